@@ -1,11 +1,13 @@
-import compare_mt.ngram_utils
-import compare_mt.stat_utils
-import compare_mt.corpus_utils
-import compare_mt.sign_utils
-import compare_mt.scorers
-import compare_mt.bucketers
-import compare_mt.reporters
-import compare_mt.arg_utils
-import compare_mt.print_utils
+import importlib
 
 __version__ = "0.2.8"
+
+# Submodules are imported when they are first accessed, so that "import compare_mt" does not pay for
+# heavy dependencies (nltk, matplotlib, ...) of modules that are never used.
+_submodules = ['ngram_utils', 'stat_utils', 'corpus_utils', 'sign_utils', 'scorers', 'bucketers',
+               'reporters', 'arg_utils', 'print_utils']
+
+def __getattr__(name):
+  if name in _submodules:
+    return importlib.import_module(f'compare_mt.{name}')
+  raise AttributeError(f"module 'compare_mt' has no attribute '{name}'")
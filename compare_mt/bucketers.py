@@ -1,11 +1,76 @@
 import sys
 import itertools
+import multiprocessing
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, Counter
 
 from compare_mt import corpus_utils
 from compare_mt import scorers
 from compare_mt import arg_utils
+from compare_mt import sign_utils
+from compare_mt import stat_utils
+from compare_mt import freq_utils
+
+def _calc_rec_prec_fmeas(mcnt, ocnt, rcnt):
+  """
+  Calculate recall, precision and f-measure from match, output and reference counts
+  """
+  if mcnt == 0:
+    return 0.0, 0.0, 0.0
+  rec = mcnt / float(rcnt) if rcnt else 0.0
+  prec = mcnt / float(ocnt)
+  fmeas = 2 * prec * rec / (prec + rec) if rec else 0.0
+  return rec, prec, fmeas
+
+def _calc_rec_prec_fmeas_arrays(mcnt, ocnt, rcnt):
+  """
+  Calculate recall, precision and f-measure elementwise for arrays of counts, in the same way as _calc_rec_prec_fmeas.
+  """
+  mcnt, ocnt, rcnt = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (mcnt, ocnt, rcnt)])
+  matched = mcnt != 0
+  rec = np.divide(mcnt, rcnt, out=np.zeros(mcnt.shape), where=matched & (rcnt != 0))
+  prec = np.divide(mcnt, ocnt, out=np.zeros(mcnt.shape), where=matched)
+  fmeas = np.divide(2 * prec * rec, prec + rec, out=np.zeros(mcnt.shape), where=rec != 0)
+  return rec, prec, fmeas
+
+def _calc_sample_bucket_stats(counts, rt_arr, ot_arr, om_arr):
+  """
+  Calculate recall, precision and f-measure of each bucket for samples given by a count matrix
+
+  Args:
+    counts: A matrix of shape (num_samples, num_sents) counting how often each sentence was sampled
+    rt_arr: The flattened bucket counts of the reference for each sentence
+    ot_arr: The flattened bucket counts of the outputs for each sentence
+    om_arr: The flattened bucket match counts of the outputs for each sentence
+
+  Returns:
+    An array of shape (num_samples, num_outs*num_buckets*3)
+  """
+  num_outs = ot_arr.shape[1] // rt_arr.shape[1]
+  # The reference totals are the same for every output
+  reduced_ref_totals = np.tile(counts @ rt_arr, (1, num_outs))
+  reduced_out_totals, reduced_out_matches = counts @ ot_arr, counts @ om_arr
+  sample_stats = np.stack(_calc_rec_prec_fmeas_arrays(reduced_out_matches, reduced_out_totals, reduced_ref_totals), axis=2)
+  return sample_stats.reshape(len(counts), -1)
+
+def _occurrence_ranks(groups):
+  """
+  Calculate how many times the group of each element occurred before it
+
+  Args:
+    groups: An integer array with the group of each element
+
+  Returns:
+    An integer array where the n-th occurrence of each group has the value n-1
+  """
+  order = np.argsort(groups, kind='stable')
+  sorted_groups = groups[order]
+  pos = np.arange(len(groups))
+  group_starts = np.ones(len(groups), dtype=bool)
+  group_starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+  ranks = np.empty(len(groups), dtype=np.intp)
+  ranks[order] = pos - np.maximum.accumulate(np.where(group_starts, pos, 0))
+  return ranks
 
 class Bucketer:
 
@@ -27,8 +92,387 @@ class Bucketer:
         return i
     return len(self.bucket_cutoffs)
 
+  def cutoffs_into_buckets(self, values):
+    """
+    Calculate the buckets of many values at once, in the same way as cutoff_into_bucket
+
+    Args:
+      values: A sequence of values
+
+    Returns:
+      An integer array containing the bucket ID of each value
+    """
+    return np.digitize(np.asarray(values, dtype=float), self.bucket_cutoffs)
+
+class _BucketVocab:
+  """
+  A vocabulary of words or labels, containing the ID of each entry and the bucket it falls into
+  """
+
+  def __init__(self):
+    self.ids = {}
+    self.buckets = np.zeros(1024, dtype=int)
+
+  def add(self, keys, buckets):
+    """
+    Add new entries to the vocabulary
+
+    Args:
+      keys: A list of distinct keys that are not in the vocabulary yet
+      buckets: The bucket of each key
+    """
+    start = len(self.ids)
+    end = start + len(keys)
+    if end > len(self.buckets):
+      capacity = len(self.buckets)
+      while capacity < end:
+        capacity *= 2
+      self.buckets = np.concatenate([self.buckets, np.zeros(capacity - len(self.buckets), dtype=int)])
+    self.ids.update(zip(keys, range(start, end)))
+    self.buckets[start:end] = buckets
+
+  def lookup(self, keys):
+    """
+    Look up the IDs of entries in the vocabulary, raising a KeyError if any of them are missing
+    """
+    return np.fromiter(map(self.ids.__getitem__, keys), dtype=np.intp, count=len(keys))
+
+def _sent_offsets(corpus):
+  offsets = np.zeros(len(corpus)+1, dtype=np.intp)
+  np.cumsum(np.fromiter(map(len, corpus), dtype=np.intp, count=len(corpus)), out=offsets[1:])
+  return offsets
+
+def _sentence_shards(num_sents, num_workers):
+  """
+  Split the sentences of a corpus into contiguous ranges, a few for each worker so that the load is balanced
+  """
+  bounds = np.linspace(0, num_sents, max(1, min(num_sents, num_workers * 4)) + 1).astype(int)
+  return list(zip(bounds[:-1], bounds[1:]))
+
+# The minimum number of sentences for which word accuracy statistics are calculated by worker processes
+min_parallel_sents = 100000
+# The inputs of the word accuracy statistics being calculated in parallel. They are set before the worker processes
+# are forked, so the workers read the corpora and matches of this process without copying them.
+_shard_inputs = None
+
+def _statistics_workers(num_workers, num_sents):
+  """
+  Get the number of worker processes used to calculate word accuracy statistics, or None to calculate them serially
+  """
+  if num_workers is None:
+    num_workers = sign_utils.global_num_workers
+  if (not num_workers or num_workers == 1 or num_sents < min_parallel_sents or
+      'fork' not in multiprocessing.get_all_start_methods()):
+    return None
+  return num_workers
+
+def _map_shards(func, inputs, num_sents, num_workers):
+  """
+  Calculate statistics of ranges of sentences in forked worker processes
+
+  Args:
+    func: A module-level function called with the start and end of a range of sentences, which reads inputs from
+          _shard_inputs and returns reduced counts
+    inputs: The inputs shared by all ranges
+    num_sents: The number of sentences
+    num_workers: The number of worker processes
+
+  Returns:
+    The results of func for all ranges, in order
+  """
+  global _shard_inputs
+  _shard_inputs = inputs
+  try:
+    with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+      return pool.map(func, _sentence_shards(num_sents, num_workers))
+  finally:
+    _shard_inputs = None
+
+def _calc_trg_shard(shard):
+  start, end = shard
+  bucketer, ref_labels, out_labels, match_store, word_buckets, keep_token_results = _shard_inputs
+  my_ref_totals, my_out_totals, my_out_matches, ref_buckets, out_buckets, _ = \
+    bucketer._calc_corpus_trg_buckets_and_matches(None, ref_labels[start:end] if ref_labels else None, None,
+                                                  [x[start:end] for x in out_labels] if out_labels else None,
+                                                  match_store=match_store.sentence_range(start, end),
+                                                  word_buckets=word_buckets)
+  # Token buckets are only sent back if they are needed
+  if keep_token_results:
+    return my_ref_totals, my_out_totals, my_out_matches, ref_buckets, out_buckets
+  return my_ref_totals, my_out_totals, my_out_matches
+
+def _calc_src_shard(shard):
+  start, end = shard
+  bucketer, src, src_labels, ref_aligns, match_store, keep_token_results = _shard_inputs
+  ref_start, ref_end = match_store.ref_offsets[start], match_store.ref_offsets[end]
+  my_ref_totals, my_out_totals, my_out_matches, src_buckets, _, _ = \
+    bucketer._calc_corpus_src_buckets_and_matches(src[start:end], src_labels[start:end] if src_labels else None,
+                                                  ref_aligns[start:end],
+                                                  match_store.ref_offsets[start:end+1] - ref_start,
+                                                  [x[ref_start:ref_end] for x in match_store.ref_matches])
+  if keep_token_results:
+    return my_ref_totals, my_out_totals, my_out_matches, src_buckets
+  return my_ref_totals, my_out_totals, my_out_matches
+
+def _flatten_aligns(aligns, src_offsets, trg_offsets):
+  """
+  Convert word alignments of all sentences into positions in the concatenated sentences
+
+  Args:
+    aligns: For each sentence, a list of (source position, target position) pairs
+    src_offsets: The start of each source sentence in the concatenated source sentences, followed by their length
+    trg_offsets: The start of each target sentence in the concatenated target sentences, followed by their length
+
+  Returns:
+    sent_idx: The sentence of each alignment pair
+    src_idx, trg_idx: The positions of the aligned words in the concatenated source and target sentences
+  """
+  align_lens = np.fromiter(map(len, aligns), dtype=np.intp, count=len(aligns))
+  pairs = np.array(list(itertools.chain.from_iterable(aligns)), dtype=np.intp).reshape(-1, 2)
+  sent_idx = np.repeat(np.arange(len(aligns)), align_lens)
+  src_pos, trg_pos = pairs[:,0], pairs[:,1]
+  if ((src_pos < 0) | (src_pos >= np.diff(src_offsets)[sent_idx]) |
+      (trg_pos < 0) | (trg_pos >= np.diff(trg_offsets)[sent_idx])).any():
+    raise ValueError('Alignments should be within the lengths of the sentences')
+  return sent_idx, src_offsets[sent_idx] + src_pos, trg_offsets[sent_idx] + trg_pos
+
+def _align_csr(aligns, src_offsets, trg_offsets):
+  """
+  Convert word alignments of all sentences into a sparse matrix in CSR format, from the source words to the aligned
+  target words
+
+  Args:
+    aligns, src_offsets, trg_offsets: As given to _flatten_aligns
+
+  Returns:
+    indptr: For each source word, the start of its aligned target words in indices, followed by len(indices)
+    indices: The positions of the aligned target words in the concatenated target sentences
+  """
+  _, src_idx, trg_idx = _flatten_aligns(aligns, src_offsets, trg_offsets)
+  order = np.argsort(src_idx, kind='stable')
+  indptr = np.zeros(src_offsets[-1]+1, dtype=np.intp)
+  np.cumsum(np.bincount(src_idx, minlength=src_offsets[-1]), out=indptr[1:])
+  return indptr, trg_idx[order]
+
+def _compact_buckets(buckets, num_buckets):
+  return np.asarray(buckets).astype(np.uint8 if num_buckets <= 256 else np.int32)
+
+class TrgTokenResults:
+  """
+  Compact per-token results of target-side statistics, which can be used to show examples without matching and
+  bucketing the sentences again. Bucket IDs are stored as small integers and match flags are bit-packed.
+  """
+
+  def __init__(self, num_buckets, ref_buckets, ref_offsets, out_buckets, out_offsets, out_matches):
+    self.ref_buckets = _compact_buckets(ref_buckets, num_buckets)
+    self.ref_offsets = ref_offsets
+    self.out_buckets = [_compact_buckets(x, num_buckets) for x in out_buckets]
+    self.out_offsets = out_offsets
+    self.out_matched = [np.packbits(x >= 0) for x in out_matches]
+
+  def sentence(self, i):
+    """
+    Get the results of a single sentence
+
+    Args:
+      i: The ID of the sentence
+
+    Returns:
+      ref_buckets: The bucket of each word in the (first) reference
+      out_buckets: The bucket of each word in each output
+      out_matched: Whether each word in each output was matched
+    """
+    out_buckets, out_matched = [], []
+    for buckets, offsets, matched in zip(self.out_buckets, self.out_offsets, self.out_matched):
+      start, end = offsets[i], offsets[i+1]
+      out_buckets.append(buckets[start:end])
+      out_matched.append(np.unpackbits(matched[start//8:(end+7)//8])[start%8:start%8+end-start].astype(bool))
+    return self.ref_buckets[self.ref_offsets[i]:self.ref_offsets[i+1]], out_buckets, out_matched
+
+class SrcTokenResults:
+  """
+  Compact per-token results of source-side statistics, which can be used to show examples without matching and
+  bucketing the sentences again.
+  """
+
+  def __init__(self, num_buckets, src_buckets, src_offsets, ref_matches, ref_offsets):
+    self.src_buckets = _compact_buckets(src_buckets, num_buckets)
+    self.src_offsets = src_offsets
+    self.ref_matches = [x.astype(np.int32) for x in ref_matches]
+    self.ref_offsets = ref_offsets
+
+  def sentence(self, i):
+    """
+    Get the results of a single sentence
+
+    Args:
+      i: The ID of the sentence
+
+    Returns:
+      src_buckets: The bucket of each source word
+      ref_matches: For each output, the position of the match of each word in the (first) reference, or -1
+    """
+    start, end = self.ref_offsets[i], self.ref_offsets[i+1]
+    return self.src_buckets[self.src_offsets[i]:self.src_offsets[i+1]], [x[start:end] for x in self.ref_matches]
+
+class TokenMatchStore:
+  """
+  Token-level matches of the outputs against the reference, for all sentences and outputs at once. The matches do not
+  depend on the bucketer, so they are calculated once per run and shared between word bucketers; bucketing then only
+  needs to look up the bucket of each word in the vocabulary of the store.
+
+  The n-th occurrence of a word in an output sentence is matched to its n-th occurrence in the reference sentence.
+
+  Attributes:
+    case_insensitive: Whether words were lowercased before matching
+    words: The vocabulary of the store, where the ID of each word is its position
+    ref_ids: The vocabulary IDs of the words of all (first) reference sentences, concatenated
+    ref_offsets: The start of each reference sentence in ref_ids, followed by len(ref_ids)
+    out_ids: For each output, the vocabulary IDs of the words of all output sentences
+    out_offsets: For each output, the start of each sentence in out_ids, followed by len(out_ids)
+    out_matches: For each output, the position of the match of each word in its (first) reference sentence, or -1.
+      With multiple references, words can additionally match up to their maximum count in any reference.
+      These matches have no position in the first reference and are marked with the length of the first reference.
+    ref_matches: For each output, the position of the match of each reference word in its output sentence, or -1
+    ref_extra_ids: With multiple references, the vocabulary IDs of the words that other references of a sentence
+      contain more often than the first one, each repeated by how much its maximum count in any reference exceeds its
+      count in the first one. Together with the first reference they form the union the outputs are matched against.
+    ref_extra_offsets: The start of each sentence in ref_extra_ids, followed by len(ref_extra_ids)
+  """
+
+  def __init__(self, ref, outs, case_insensitive=False):
+    """
+    Args:
+      ref: The reference corpus, where each sentence may be a tuple of references
+      outs: A list of output corpora
+      case_insensitive: Whether to lowercase words before matching them
+    """
+    self.case_insensitive = case_insensitive
+    if case_insensitive:
+      ref = corpus_utils.lower(ref)
+      outs = [corpus_utils.lower(out) for out in outs]
+    self._vocab = {}
+    ref_sents = [corpus_utils.sent_refs(r) for r in ref]
+    self.ref_ids, self.ref_offsets, ref_sent_idx = self._flatten_corpus([r[0] for r in ref_sents])
+    flat_outs = [self._flatten_corpus(out) for out in outs]
+    num_refs = max(map(len, ref_sents), default=1)
+    flat_other_refs = [self._flatten_corpus([r[j] if j < len(r) else [] for r in ref_sents]) for j in range(1, num_refs)]
+    self.words = list(self._vocab)
+    # Give each (sentence, word) pair a group ID, shared between the reference and the outputs
+    vocab_size = len(self.words)
+    flat_corpora = [(self.ref_ids, self.ref_offsets, ref_sent_idx)] + flat_outs
+    all_keys = [sent_idx.astype(np.int64) * vocab_size + ids for ids, _, sent_idx in flat_corpora]
+    keys, groups = np.unique(np.concatenate(all_keys), return_inverse=True)
+    groups = np.split(groups.reshape(-1), np.cumsum([len(x) for x in all_keys])[:-1])
+    ranks = [_occurrence_ranks(x) for x in groups]
+    # Each occurrence of a group can then be identified by a single integer
+    num_ranks = max([len(x) for x in ranks]) + 1
+    ref_codes = groups[0] * num_ranks + ranks[0]
+    ref_order = np.argsort(ref_codes)
+    sorted_ref_codes = ref_codes[ref_order]
+    # The maximum count of each group in any reference
+    max_cnts = None
+    if num_refs > 1:
+      max_cnts = np.bincount(groups[0], minlength=len(keys))
+      for ids, _, sent_idx in flat_other_refs:
+        other_keys = sent_idx.astype(np.int64) * vocab_size + ids
+        pos = np.minimum(np.searchsorted(keys, other_keys), len(keys)-1)
+        found = keys[pos] == other_keys
+        max_cnts = np.maximum(max_cnts, np.bincount(pos[found], minlength=len(keys)))
+    # The words completing the union of the references, with their maximum count in any reference
+    self.ref_extra_ids, self.ref_extra_offsets = np.zeros(0, dtype=np.intp), np.zeros(len(ref_sents)+1, dtype=np.intp)
+    if num_refs > 1:
+      all_ref_keys = [all_keys[0]] + [sent_idx.astype(np.int64) * vocab_size + ids for ids, _, sent_idx in flat_other_refs]
+      union_keys, union_groups = np.unique(np.concatenate(all_ref_keys), return_inverse=True)
+      union_cnts = [np.bincount(x, minlength=len(union_keys))
+                    for x in np.split(union_groups.reshape(-1), np.cumsum([len(x) for x in all_ref_keys])[:-1])]
+      extra_keys = np.repeat(union_keys, np.max(union_cnts, axis=0) - union_cnts[0])
+      self.ref_extra_ids = (extra_keys % vocab_size).astype(np.intp)
+      self.ref_extra_offsets = np.searchsorted(extra_keys // vocab_size, np.arange(len(ref_sents)+1))
+    ref_lens = np.diff(self.ref_offsets)
+    self.out_ids, self.out_offsets, self.out_matches, self.ref_matches = [], [], [], []
+    for (ids, offsets, sent_idx), out_groups, out_ranks in zip(flat_outs, groups[1:], ranks[1:]):
+      out_codes = out_groups * num_ranks + out_ranks
+      pos = np.minimum(np.searchsorted(sorted_ref_codes, out_codes), max(len(ref_codes)-1, 0))
+      found = sorted_ref_codes[pos] == out_codes if len(ref_codes) else np.zeros(len(out_codes), dtype=bool)
+      out_found = np.nonzero(found)[0]
+      ref_found = ref_order[pos[found]]
+      out_match = np.full(len(ids), -1, dtype=np.intp)
+      out_match[out_found] = ref_found - self.ref_offsets[ref_sent_idx[ref_found]]
+      if max_cnts is not None:
+        other = ~found & (out_ranks < max_cnts[out_groups])
+        out_match[other] = ref_lens[sent_idx[other]]
+      ref_match = np.full(len(self.ref_ids), -1, dtype=np.intp)
+      ref_match[ref_found] = out_found - offsets[sent_idx[out_found]]
+      self.out_ids.append(ids)
+      self.out_offsets.append(offsets)
+      self.out_matches.append(out_match)
+      self.ref_matches.append(ref_match)
+
+  def sentence_range(self, start, end):
+    """
+    Get the matches of a range of sentences
+
+    Args:
+      start: The first sentence
+      end: The sentence after the last one
+
+    Returns:
+      A TokenMatchStore of the sentences, which shares the vocabulary and the arrays of this one
+    """
+    store = TokenMatchStore.__new__(TokenMatchStore)
+    store.case_insensitive, store.words = self.case_insensitive, self.words
+    ref_start, ref_end = self.ref_offsets[start], self.ref_offsets[end]
+    store.ref_ids = self.ref_ids[ref_start:ref_end]
+    store.ref_offsets = self.ref_offsets[start:end+1] - ref_start
+    store.ref_matches = [x[ref_start:ref_end] for x in self.ref_matches]
+    extra_start, extra_end = self.ref_extra_offsets[start], self.ref_extra_offsets[end]
+    store.ref_extra_ids = self.ref_extra_ids[extra_start:extra_end]
+    store.ref_extra_offsets = self.ref_extra_offsets[start:end+1] - extra_start
+    store.out_ids, store.out_offsets, store.out_matches = [], [], []
+    for ids, offsets, matches in zip(self.out_ids, self.out_offsets, self.out_matches):
+      out_start, out_end = offsets[start], offsets[end]
+      store.out_ids.append(ids[out_start:out_end])
+      store.out_offsets.append(offsets[start:end+1] - out_start)
+      store.out_matches.append(matches[out_start:out_end])
+    return store
+
+  def _flatten_corpus(self, corpus):
+    offsets = _sent_offsets(corpus)
+    vocab = self._vocab
+    words = list(itertools.chain.from_iterable(corpus))
+    ids = np.fromiter((vocab.setdefault(w, len(vocab)) for w in words), dtype=np.intp, count=len(words))
+    return ids, offsets, np.repeat(np.arange(len(corpus)), np.diff(offsets))
+
+# Global variable containing the token matches calculated in this run (None to calculate matches for every analysis)
+global_match_stores = None
+
+def get_match_store(ref, outs, case_insensitive=False):
+  """
+  Get the token matches of the outputs against the reference. If global_match_stores is set, the matches of each
+  corpus are only calculated once, and shared between all analyses of the run.
+
+  Args:
+    ref: The reference corpus, where each sentence may be a tuple of references
+    outs: A list of output corpora
+    case_insensitive: Whether to lowercase words before matching them
+
+  Returns:
+    A TokenMatchStore
+  """
+  if global_match_stores is None:
+    return TokenMatchStore(ref, outs, case_insensitive=case_insensitive)
+  # The corpora are kept in the cache, so their IDs are not reused during the run
+  key = (id(ref), tuple(id(out) for out in outs), case_insensitive)
+  if key not in global_match_stores:
+    global_match_stores[key] = (ref, outs, TokenMatchStore(ref, outs, case_insensitive=case_insensitive))
+  return global_match_stores[key][2]
+
 class WordBucketer(Bucketer):
 
+  # Whether words are bucketed by their labels instead of the words themselves
+  bucket_by_label = False
+
   def calc_bucket(self, val, label=None):
     """
     Calculate the bucket for a particular word
@@ -42,104 +486,303 @@ class WordBucketer(Bucketer):
     """
     raise NotImplementedError('calc_bucket must be implemented in subclasses of WordBucketer')
 
+  def calc_bucket_table(self, keys):
+    """
+    Calculate the buckets of new entries in the vocabulary of the bucketer. This calls calc_bucket for each entry,
+    but can be overridden by subclasses that can calculate the buckets of many entries at once.
+
+    Args:
+      keys: A list of words, or labels if bucket_by_label is set
+
+    Returns:
+      A sequence containing the integer ID of the bucket of each entry
+    """
+    if self.bucket_by_label:
+      return [self.calc_bucket(None, label=l) for l in keys]
+    return [self.calc_bucket(w) for w in keys]
+
+  def _lookup_ids(self, keys, by_label):
+    attr = '_label_vocab' if by_label else '_word_vocab'
+    vocab = getattr(self, attr, None)
+    if vocab is None:
+      vocab = _BucketVocab()
+      setattr(self, attr, vocab)
+    try:
+      return vocab.lookup(keys)
+    except KeyError:
+      new_keys = [k for k in dict.fromkeys(keys) if k not in vocab.ids]
+      # Only the vocabulary that determines the buckets needs to calculate them
+      vocab.add(new_keys, self.calc_bucket_table(new_keys) if by_label == self.bucket_by_label else 0)
+      return vocab.lookup(keys)
+
+  def token_ids(self, words):
+    """
+    Convert words into IDs in the vocabulary of the bucketer, adding words that are not in the vocabulary yet
+
+    Args:
+      words: A list of words
+
+    Returns:
+      An integer array containing the ID of each word
+    """
+    return self._lookup_ids(words, False)
+
+  def label_ids(self, labels):
+    """
+    Convert labels into IDs in the label vocabulary of the bucketer, adding labels that are not in the vocabulary yet
+
+    Args:
+      labels: A list of labels
+
+    Returns:
+      An integer array containing the ID of each label
+    """
+    return self._lookup_ids(labels, True)
+
+  def calc_buckets(self, token_ids, label_ids=None):
+    """
+    Calculate the buckets of many words at once by looking them up in the vocabulary of the bucketer
+
+    Args:
+      token_ids: An integer array of word IDs, given by token_ids()
+      label_ids: An integer array of label IDs, given by label_ids(). Required if words are bucketed by label.
+
+    Returns:
+      An integer array containing the ID of the bucket of each word
+    """
+    if self.bucket_by_label:
+      if label_ids is None:
+        raise ValueError('When calculating buckets by label, label_ids must be specified')
+      return self._label_vocab.buckets[label_ids]
+    return self._word_vocab.buckets[token_ids]
+
+  def _calc_sent_buckets(self, sent, labels):
+    if self.bucket_by_label:
+      return self._calc_label_buckets(np.array([0, len(sent)]), [labels] if labels else None)
+    return self.calc_buckets(self.token_ids(sent))
+
+  def _calc_label_buckets(self, offsets, labels):
+    # Missing labels are looked up as None, which calc_bucket rejects
+    if not labels:
+      labels = [None for _ in range(len(offsets)-1)]
+    flat_labels = []
+    for sent_labels, sent_len in zip(labels, np.diff(offsets)):
+      if not sent_labels:
+        sent_labels = [None] * sent_len
+      elif len(sent_labels) != sent_len:
+        raise ValueError('Each sentence should have a label for each word')
+      flat_labels.extend(sent_labels)
+    return self.calc_buckets(None, self.label_ids(flat_labels))
+
+  def _check_match_store(self, ref, outs, match_store):
+    case_insensitive = getattr(self, 'case_insensitive', False)
+    if match_store is None:
+      return get_match_store(ref, outs, case_insensitive=case_insensitive)
+    if match_store.case_insensitive != case_insensitive:
+      raise ValueError('The match store should be case insensitive iff the bucketer is')
+    return match_store
+
   def _calc_trg_matches(self, ref_sent, out_sents):
+    """
+    Match the words in the outputs to words in a single reference sentence, as TokenMatchStore does for whole corpora.
+    The n-th occurrence of a word in an output is matched to its n-th occurrence in the reference.
+
+    Args:
+      ref_sent: A reference sentence, or a tuple of references
+      out_sents: The output sentences of each system
+
+    Returns:
+      out_matches: for each output word, the position of its match in the (first) reference, or -1.
+        With multiple references, words can additionally match up to their maximum count in any reference.
+        These matches have no position in the first reference and are marked with len(ref_sent[0]).
+      ref_matches: for each word in the (first) reference, the position of its match in each output, or -1
+    """
+    ref_sents = corpus_utils.sent_refs(ref_sent)
+    ref_sent = ref_sents[0]
     ref_pos = defaultdict(lambda: [])
     out_matches = [[-1 for _ in s] for s in out_sents]
     ref_matches = [[-1 for _ in ref_sent] for _ in out_sents]
     for ri, ref_word in enumerate(ref_sent):
       ref_pos[ref_word].append(ri)
+    # The maximum count of each word over all references is calculated once for all outputs
+    ref_max_cnts = None
+    if len(ref_sents) > 1:
+      ref_max_cnts = Counter(ref_sent)
+      for r in ref_sents[1:]:
+        ref_max_cnts |= Counter(r)
     for oai, out_sent in enumerate(out_sents):
       out_word_cnts = {}
       for oi, out_word in enumerate(out_sent):
+        out_word_cnt = out_word_cnts.get(out_word, 0)
         ref_poss = ref_pos.get(out_word, None)
-        if ref_poss:
-          out_word_cnt = out_word_cnts.get(out_word, 0)
-          if out_word_cnt < len(ref_poss):
-            out_matches[oai][oi] = ref_poss[out_word_cnt]
-            ref_matches[oai][ref_poss[out_word_cnt]] = oi
-          out_word_cnts[out_word] = out_word_cnt + 1
+        if ref_poss and out_word_cnt < len(ref_poss):
+          out_matches[oai][oi] = ref_poss[out_word_cnt]
+          ref_matches[oai][ref_poss[out_word_cnt]] = oi
+        elif ref_max_cnts is not None and out_word_cnt < ref_max_cnts[out_word]:
+          out_matches[oai][oi] = len(ref_sent)
+        out_word_cnts[out_word] = out_word_cnt + 1
     return out_matches, ref_matches
 
+  def _calc_corpus_trg_buckets_and_matches(self, ref, ref_labels, outs, out_labels, match_store=None,
+                                           word_buckets=None):
+    # Get matches
+    match_store = self._check_match_store(ref, outs, match_store)
+    ref_offsets, out_matches = match_store.ref_offsets, match_store.out_matches
+    # The buckets of words only need to be calculated once for each word in the vocabulary of the store
+    if self.bucket_by_label:
+      calc_flat_buckets = lambda ids, offsets, labels: self._calc_label_buckets(offsets, labels)
+    else:
+      if word_buckets is None:
+        word_buckets = self.word_buckets(match_store)
+      calc_flat_buckets = lambda ids, offsets, labels: word_buckets[ids]
+    # Process the reference, getting the bucket (with multiple references, only the first one is bucketed)
+    ref_buckets = calc_flat_buckets(match_store.ref_ids, ref_offsets, ref_labels)
+    # Calculate totals for each sentence
+    num_sents = len(ref_offsets) - 1
+    num_buckets = len(self.bucket_strs)
+    num_outs = len(out_matches)
+    ref_lens = np.diff(ref_offsets)
+    ref_sent_idx = np.repeat(np.arange(num_sents), ref_lens)
+    ref_codes = ref_sent_idx * num_buckets + ref_buckets
+    # With multiple references, the outputs are matched against the union of the references, so its words that are
+    # not in the first reference are also counted
+    if not self.bucket_by_label and len(match_store.ref_extra_ids):
+      extra_sent_idx = np.repeat(np.arange(num_sents), np.diff(match_store.ref_extra_offsets))
+      ref_codes = np.concatenate([ref_codes, extra_sent_idx * num_buckets + word_buckets[match_store.ref_extra_ids]])
+    my_ref_totals = np.bincount(ref_codes,
+                                minlength=num_sents * num_buckets).reshape(num_sents, num_buckets).astype(np.int32)
+    my_out_totals = np.zeros( (num_sents, num_outs, num_buckets) ,dtype=np.int32)
+    my_out_matches = np.zeros( (num_sents, num_outs, num_buckets) ,dtype=np.int32)
+    # Process each of the outputs, where words matched to the reference take the bucket of the reference word
+    out_buckets = []
+    for oai, (ids, offsets, match) in enumerate(zip(match_store.out_ids, match_store.out_offsets, out_matches)):
+      out_buck = calc_flat_buckets(ids, offsets, out_labels[oai] if out_labels else None)
+      sent_idx = np.repeat(np.arange(num_sents), np.diff(offsets))
+      ref_matched = (match >= 0) & (match < ref_lens[sent_idx])
+      out_buck[ref_matched] = ref_buckets[ref_offsets[sent_idx[ref_matched]] + match[ref_matched]]
+      out_codes = sent_idx * num_buckets + out_buck
+      my_out_totals[:,oai] = np.bincount(out_codes, minlength=num_sents * num_buckets).reshape(num_sents, num_buckets)
+      my_out_matches[:,oai] = np.bincount(out_codes[match >= 0],
+                                          minlength=num_sents * num_buckets).reshape(num_sents, num_buckets)
+      out_buckets.append(out_buck)
+    return my_ref_totals, my_out_totals, my_out_matches, ref_buckets, out_buckets, out_matches
+
+  def word_buckets(self, match_store):
+    """
+    Calculate the bucket of each word in the vocabulary of a TokenMatchStore
+    """
+    return self.calc_buckets(self.token_ids(match_store.words))
+
   def _calc_trg_buckets_and_matches(self, ref_sent, ref_label, out_sents, out_labels):
     # Initial setup for special cases
-    if self.case_insensitive:
-      ref_sent = [corpus_utils.lower(w) for w in ref_sent]
+    if getattr(self, 'case_insensitive', False):
+      ref_sent = corpus_utils.lower(ref_sent)
       out_sents = [[corpus_utils.lower(w) for w in out_sent] for out_sent in out_sents]
-    if not ref_label:
-      ref_label = []
-      out_labels = [[] for _ in out_sents]
+    if not out_labels:
+      out_labels = [None for _ in out_sents]
+    # Labels are only given for the first reference, so words bucketed by their labels are only matched against it
+    ref_sents = corpus_utils.sent_refs(ref_sent)
+    if self.bucket_by_label:
+      ref_sents = ref_sents[:1]
     # Get matches
-    out_matches, _ = self._calc_trg_matches(ref_sent, out_sents)
-    # Process the reference, getting the bucket
-    ref_buckets = [self.calc_bucket(w, label=l) for (w,l) in itertools.zip_longest(ref_sent, ref_label)]
-    # Process each of the outputs, finding matches
-    out_buckets = [[] for _ in out_sents]
-    for oai, (out_sent, out_label, match, out_buck) in \
-            enumerate(itertools.zip_longest(out_sents, out_labels, out_matches, out_buckets)):
-      for oi, (w, l, m) in enumerate(itertools.zip_longest(out_sent, out_label, match)):
-        out_buck.append(self.calc_bucket(w, label=l) if m < 0 else ref_buckets[m])
-    # Calculate totals for each sentence
+    out_matches, _ = self._calc_trg_matches(ref_sents if len(ref_sents) > 1 else ref_sents[0], out_sents)
+    # Process the reference, getting the bucket (with multiple references, only the first one is bucketed)
+    ref_sent = ref_sents[0]
+    ref_buckets = self._calc_sent_buckets(ref_sent, ref_label)
+    # Calculate totals for the sentence, over the union of the references that the outputs are matched against
     num_buckets = len(self.bucket_strs)
     num_outs = len(out_sents)
-    my_ref_total = np.zeros(num_buckets ,dtype=int)
-    my_out_totals = np.zeros( (num_outs, num_buckets) ,dtype=int)
-    my_out_matches = np.zeros( (num_outs, num_buckets) ,dtype=int)
-    for b in ref_buckets:
-      my_ref_total[b] += 1
-    for oi, (obs, ms) in enumerate(zip(out_buckets, out_matches)):
-      for b, m in zip(obs, ms):
-        my_out_totals[oi,b] += 1
-        if m >= 0:
-          my_out_matches[oi,b] += 1
+    my_ref_total = np.bincount(ref_buckets, minlength=num_buckets).astype(np.int32)
+    max_cnts = Counter()
+    for other_ref in ref_sents[1:]:
+      max_cnts |= Counter(other_ref)
+    extra_words = list((max_cnts - Counter(ref_sent)).elements())
+    if extra_words:
+      my_ref_total += np.bincount(self._calc_sent_buckets(extra_words, None), minlength=num_buckets).astype(np.int32)
+    my_out_totals = np.zeros( (num_outs, num_buckets) ,dtype=np.int32)
+    my_out_matches = np.zeros( (num_outs, num_buckets) ,dtype=np.int32)
+    # Process each of the outputs, where words matched to the reference take the bucket of the reference word
+    out_buckets = []
+    for oai, (out_sent, out_label, match) in enumerate(zip(out_sents, out_labels, out_matches)):
+      out_buck = self._calc_sent_buckets(out_sent, out_label)
+      match = np.array(match, dtype=int)
+      ref_matched = (match >= 0) & (match < len(ref_buckets))
+      out_buck[ref_matched] = ref_buckets[match[ref_matched]]
+      my_out_totals[oai] = np.bincount(out_buck, minlength=num_buckets)
+      my_out_matches[oai] = np.bincount(out_buck[match >= 0], minlength=num_buckets)
+      out_buckets.append(out_buck)
     return my_ref_total, my_out_totals, my_out_matches, ref_buckets, out_buckets, out_matches
 
-  def _calc_src_buckets_and_matches(self, src_sent, src_label, ref_sent, ref_aligns, out_sents):
+  def _calc_corpus_src_buckets_and_matches(self, src, src_labels, ref_aligns, ref_offsets, ref_matches):
     # Initial setup for special cases
-    if self.case_insensitive:
-      src_sent = [corpus_utils.lower(w) for w in src_sent]
-      ref_sent = [corpus_utils.lower(w) for w in ref_sent]
-      out_sents = [[corpus_utils.lower(w) for w in out_sent] for out_sent in out_sents]
-    if not src_label:
-      src_label = []
-    # Get matches
-    _, ref_matches = self._calc_trg_matches(ref_sent, out_sents)
+    if getattr(self, 'case_insensitive', False):
+      src = corpus_utils.lower(src)
     # Process the source, getting the bucket
-    src_buckets = [self.calc_bucket(w, label=l) for (w,l) in itertools.zip_longest(src_sent, src_label)]
+    src_offsets = _sent_offsets(src)
+    if self.bucket_by_label:
+      src_buckets = self._calc_label_buckets(src_offsets, src_labels)
+    else:
+      src_buckets = self.calc_buckets(self.token_ids(list(itertools.chain.from_iterable(src))))
     # For each source word, find the reference words that need to be correct
-    src_aligns = [[] for _ in src_sent]
-    for src, trg in ref_aligns:
-      src_aligns[src].append(trg)
+    indptr, indices = _align_csr(ref_aligns, src_offsets, ref_offsets)
+    aligned = np.diff(indptr) > 0
     # Calculate totals for each sentence
+    num_sents = len(src)
     num_buckets = len(self.bucket_strs)
-    num_outs = len(out_sents)
-    my_ref_total = np.zeros(num_buckets ,dtype=int)
-    my_out_matches = np.zeros( (num_outs, num_buckets) ,dtype=int)
-    for src_bucket in src_buckets:
-      my_ref_total[src_bucket] += 1
-    my_out_totals = np.broadcast_to(np.reshape(my_ref_total, (1, num_buckets)), (num_outs, num_buckets))
-    for oai, (out_sent, ref_match) in enumerate(zip(out_sents, ref_matches)):
-      for src_bucket, src_align in zip(src_buckets, src_aligns):
-        if len(src_align) != 0:
-          if all([ref_match[x] >= 0 for x in src_align]):
-            my_out_matches[oai,src_bucket] += 1
-    return my_ref_total, my_out_totals, my_out_matches, src_buckets, src_aligns, ref_matches
+    num_outs = len(ref_matches)
+    src_codes = np.repeat(np.arange(num_sents), np.diff(src_offsets)) * num_buckets + src_buckets
+    my_ref_totals = np.bincount(src_codes,
+                                minlength=num_sents * num_buckets).reshape(num_sents, num_buckets).astype(np.int32)
+    my_out_totals = np.repeat(my_ref_totals[:,None,:], num_outs, axis=1)
+    my_out_matches = np.zeros( (num_sents, num_outs, num_buckets) ,dtype=np.int32)
+    for oai, ref_match in enumerate(ref_matches):
+      # A source word is correct if all of its aligned reference words were matched
+      correct = np.zeros(len(src_buckets), dtype=bool)
+      if len(indices):
+        correct[aligned] = np.logical_and.reduceat(np.asarray(ref_match)[indices] >= 0, indptr[:-1][aligned])
+      my_out_matches[:,oai] = np.bincount(src_codes[correct],
+                                          minlength=num_sents * num_buckets).reshape(num_sents, num_buckets)
+    return my_ref_totals, my_out_totals, my_out_matches, src_buckets, indptr, indices
+
+  def _calc_src_buckets_and_matches(self, src_sent, src_label, ref_sent, ref_aligns, out_sents, ref_matches=None):
+    # Get matches, unless they were already calculated for the whole corpus
+    if ref_matches is None:
+      if getattr(self, 'case_insensitive', False):
+        ref_sent = corpus_utils.lower(ref_sent)
+        out_sents = [[corpus_utils.lower(w) for w in out_sent] for out_sent in out_sents]
+      _, ref_matches = self._calc_trg_matches(ref_sent, out_sents)
+    ref_offsets = np.array([0, len(corpus_utils.sent_refs(ref_sent)[0])])
+    my_ref_totals, my_out_totals, my_out_matches, src_buckets, indptr, indices = \
+      self._calc_corpus_src_buckets_and_matches([src_sent], [src_label] if src_label else None, [ref_aligns],
+                                                ref_offsets, ref_matches)
+    src_aligns = [list(indices[start:end]) for start, end in zip(indptr[:-1], indptr[1:])]
+    return my_ref_totals[0], my_out_totals[0], my_out_matches[0], src_buckets, src_aligns, ref_matches
 
   def calc_statistics(self, ref, outs,
                       src=None,
                       ref_labels=None, out_labels=None,
-                      ref_aligns=None, src_labels=None):
+                      ref_aligns=None, src_labels=None,
+                      keep_token_results=False, match_store=None, num_workers=None):
     """
     Calculate match statistics, bucketed by the type of word we have, and IDs of example sentences to show.
     This must be used with a subclass that has self.bucket_strs defined, and self.calc_bucket(word) implemented.
 
     Args:
-      ref: The reference corpus
+      ref: The reference corpus, where each sentence may be a tuple of references.
+           Output words are matched against the union of the references, where each word occurs as often as in the
+           reference containing it most often, and the reference totals count the words of this union. Only the
+           first reference is labeled, so when words are bucketed by their labels they are matched against it alone.
       outs: A list of output corpora
       src: Source sentences.
            If src is set, it will use ref_aligns, out_aligns, and src_labels.
            Otherwise, it will use ref_labels and out_labels.
       ref_labels: Labels of the reference corpus (optional)
       out_labels: Labels of the output corpora (should be specified iff ref_labels is)
+      keep_token_results: Whether to also return the per-token buckets and matches, which can be used to show examples
+      match_store: The TokenMatchStore of ref and outs. If None, it is given by get_match_store.
+      num_workers: The number of processes used to calculate statistics of ranges of sentences in parallel, for
+                   corpora of at least min_parallel_sents sentences. If None, sign_utils.global_num_workers is used,
+                   and if that is also None the sentences are processed serially.
 
     Returns:
       statistics: containing a list of equal length to out, containing for each system
@@ -149,8 +792,10 @@ class WordBucketer(Bucketer):
         rec: recall of the bucket
         prec: precision of the bucket
         fmeas: f1-measure of the bucket
-      my_ref_total_list: containing a list of statistics of the reference
-      my_out_matches_list: containing a list of statistics of the outputs
+      my_ref_totals: an array of shape (num_sents, num_buckets) with the bucket counts of the reference for each sentence
+      my_out_totals: an array of shape (num_sents, num_outs, num_buckets) with the bucket counts of the outputs
+      my_out_matches: an array of shape (num_sents, num_outs, num_buckets) with the bucket match counts of the outputs
+      token_results: a TrgTokenResults or SrcTokenResults object, only returned if keep_token_results is set
     """
     if not hasattr(self, 'case_insensitive'):
       self.case_insensitive = False
@@ -159,102 +804,104 @@ class WordBucketer(Bucketer):
     num_buckets = len(self.bucket_strs)
     num_outs = len(outs)
 
-    # Initialize the sufficient statistics for prec/rec/fmeas
-    ref_total = np.zeros(num_buckets, dtype=int)
-    out_totals = np.zeros( (num_outs, num_buckets) ,dtype=int)
-    out_matches = np.zeros( ( num_outs, num_buckets) ,dtype=int)
-
-    my_ref_total_list = []
-    my_out_totals_list = []
-    my_out_matches_list = []
-
-    # Step through the sentences
-    for rsi, (ref_sent, ref_label) in enumerate(itertools.zip_longest(ref, ref_labels if ref_labels else [])):
-      if src:
-        my_ref_total, my_out_totals, my_out_matches, _, _, _ = \
-          self._calc_src_buckets_and_matches(src[rsi],
-                                             src_labels[rsi] if src_labels else None,
-                                             ref_sent,
-                                             ref_aligns[rsi],
-                                             [x[rsi] for x in outs])
+    # Match the words of all sentences at once
+    if self.bucket_by_label and not src and corpus_utils.is_multi_reference(ref):
+      ref, match_store = corpus_utils.primary_reference(ref), None
+    match_store = self._check_match_store(ref, outs, match_store)
+    num_workers = _statistics_workers(num_workers, len(ref))
+    if src:
+      # Ranges of sentences are independent, so their counts can be calculated in parallel and concatenated
+      if num_workers:
+        shard_results = _map_shards(_calc_src_shard, (self, src, src_labels, ref_aligns, match_store, keep_token_results),
+                                    len(ref), num_workers)
+        my_ref_totals, my_out_totals, my_out_matches = [np.concatenate(x) for x in list(zip(*shard_results))[:3]]
+        src_buckets = np.concatenate([x[3] for x in shard_results]) if keep_token_results else None
       else:
-        my_ref_total, my_out_totals, my_out_matches, _, _, _ = \
-           self._calc_trg_buckets_and_matches(ref_sent,
-                                              ref_label,
-                                              [x[rsi] for x in outs],
-                                              [x[rsi] for x in out_labels] if out_labels else None)
-      ref_total += my_ref_total
-      out_totals += my_out_totals
-      out_matches += my_out_matches
-
-      my_ref_total_list.append(my_ref_total)
-      my_out_totals_list.append(my_out_totals)
-      my_out_matches_list.append(my_out_matches)
+        my_ref_totals, my_out_totals, my_out_matches, src_buckets, _, _ = \
+          self._calc_corpus_src_buckets_and_matches(src, src_labels, ref_aligns, match_store.ref_offsets,
+                                                    match_store.ref_matches)
+      if keep_token_results:
+        token_results = SrcTokenResults(num_buckets, src_buckets, _sent_offsets(src), match_store.ref_matches,
+                                        match_store.ref_offsets)
+    else:
+      if num_workers:
+        word_buckets = None if self.bucket_by_label else self.word_buckets(match_store)
+        shard_results = _map_shards(_calc_trg_shard,
+                                    (self, ref_labels, out_labels, match_store, word_buckets, keep_token_results),
+                                    len(ref), num_workers)
+        my_ref_totals, my_out_totals, my_out_matches = [np.concatenate(x) for x in list(zip(*shard_results))[:3]]
+        if keep_token_results:
+          ref_buckets = np.concatenate([x[3] for x in shard_results])
+          out_buckets = [np.concatenate([x[4][oi] for x in shard_results]) for oi in range(num_outs)]
+      else:
+        my_ref_totals, my_out_totals, my_out_matches, ref_buckets, out_buckets, _ = \
+          self._calc_corpus_trg_buckets_and_matches(ref, ref_labels, outs, out_labels, match_store=match_store)
+      if keep_token_results:
+        token_results = TrgTokenResults(num_buckets, ref_buckets, _sent_offsets(corpus_utils.primary_reference(ref)),
+                                        out_buckets, [_sent_offsets(out) for out in outs], match_store.out_matches)
+
+    # The sufficient statistics for prec/rec/fmeas
+    ref_total = my_ref_totals.sum(0)
+    out_totals = my_out_totals.sum(0)
+    out_matches = my_out_matches.sum(0)
 
     # Calculate statistics
     statistics = [[] for _ in range(num_outs)]
     for oi, ostatistics in enumerate(statistics):
       for bi in range(num_buckets):
         mcnt, ocnt, rcnt = out_matches[oi,bi], out_totals[oi,bi], ref_total[bi]
-        if mcnt == 0:
-          rec, prec, fmeas = 0.0, 0.0, 0.0
-        else:
-          rec = mcnt / float(rcnt)
-          prec = mcnt / float(ocnt)
-          fmeas = 2 * prec * rec / (prec + rec)
-        ostatistics.append( (mcnt, rcnt, ocnt, rec, prec, fmeas) )
+        ostatistics.append( (mcnt, rcnt, ocnt) + _calc_rec_prec_fmeas(mcnt, ocnt, rcnt) )
 
-    return statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list
+    if keep_token_results:
+      return statistics, my_ref_totals, my_out_totals, my_out_matches, token_results
+    return statistics, my_ref_totals, my_out_totals, my_out_matches
 
-  def calc_bucket_details(self, my_ref_total_list, my_out_totals_list, my_out_matches_list, num_samples=1000, sample_ratio=0.5):
- 
-    ref_total = np.array(my_ref_total_list).sum(0)
+  def calc_bucket_details(self, my_ref_totals, my_out_totals, my_out_matches, num_samples=1000, sample_ratio=0.5,
+                          num_workers=None):
+    """
+    Calculate the number of words in each bucket, and bootstrap confidence intervals of the recall, precision
+    and f-measure of each bucket.
+
+    Args:
+      my_ref_totals: The bucket counts of the reference for each sentence, of shape (num_sents, num_buckets)
+      my_out_totals: The bucket counts of the outputs for each sentence, of shape (num_sents, num_outs, num_buckets)
+      my_out_matches: The bucket match counts of the outputs for each sentence, of shape (num_sents, num_outs, num_buckets)
+      num_samples: The number of bootstrap samples
+      sample_ratio: The ratio of sentences in each sample
+      num_workers: The number of processes used to process samples in parallel.
+                   If None, sign_utils.global_num_workers is used, and if that is also None the samples are processed serially.
+
+    Returns:
+      ref_total: The number of reference words in each bucket
+      intervals: For each output and bucket, None for the three counts followed by the bounds of recall, precision
+        and f-measure
+    """
+    ref_total = my_ref_totals.sum(0)
 
-    num_outs, num_buckets = my_out_totals_list[0].shape
-    n = len(my_ref_total_list)
-    ids = list(range(n))
+    n, num_outs, num_buckets = my_out_totals.shape
     sample_size = int(np.ceil(n*sample_ratio))
-    rt_arr = np.array(my_ref_total_list)
-    ot_arr = np.array(my_out_totals_list)
-    om_arr = np.array(my_out_matches_list)
-    statistics = [[ [] for __ in range(num_buckets) ] for _ in range(num_outs)]
-    for _ in range(num_samples):
-      reduced_ids = np.random.choice(ids, size=sample_size, replace=True)
-      reduced_ref_total, reduced_out_totals, reduced_out_matches= rt_arr[reduced_ids].sum(0), ot_arr[reduced_ids].sum(0), om_arr[reduced_ids].sum(0)
-      # Calculate accuracy on the reduced sample and save stats
-      for oi in range(num_outs):
-        for bi in range(num_buckets):
-          mcnt, ocnt, rcnt = reduced_out_matches[oi,bi], reduced_out_totals[oi,bi], reduced_ref_total[bi]
-          if mcnt == 0:
-            rec, prec, fmeas = 0.0, 0.0, 0.0
-          else:
-            rec = mcnt / float(rcnt)
-            prec = mcnt / float(ocnt)
-            fmeas = 2 * prec * rec / (prec + rec)
-          statistics[oi][bi].append( (mcnt, rcnt, ocnt, rec, prec, fmeas) )
-
-    intervals = [[] for _ in range(num_outs)]
-    for oi in range(num_outs):
-      for bi in range(num_buckets):
-        if len(statistics[oi][bi]) > 0: 
-          _, _, _, recs, precs, fmeas = zip(*statistics[oi][bi])
-        else:
-          recs, precs, fmeas = [0.0], [0.0], [0.0]
-        # The first three elements (intervals of mcnt, ocnt and rcnt) are None
-        bounds = [None, None, None]
-        for x in [recs, precs, fmeas]:
-          x = list(x)
-          x.sort()
-          lower_bound = x[int(num_samples * 0.025)]
-          upper_bound = x[int(num_samples * 0.975)]
-          bounds.append( (lower_bound, upper_bound) )
-        intervals[oi].append(bounds)
+    arrs = tuple(x.reshape(n, -1).astype(float) for x in (my_ref_totals, my_out_totals, my_out_matches))
+    if num_workers is None:
+      num_workers = sign_utils.global_num_workers
+    if num_workers:
+      sample_stats = sign_utils.map_sample_blocks(_calc_sample_bucket_stats, arrs, n, sample_size, num_samples, num_workers)
+    else:
+      sample_stats = np.concatenate([_calc_sample_bucket_stats(counts, *arrs)
+                                     for counts in sign_utils.sample_count_matrices(n, sample_size, num_samples)])
+    # Shape (num_samples, num_outs, num_buckets, 3), for recall, precision and f-measure
+    sample_stats = sample_stats.reshape(num_samples, num_outs, num_buckets, 3)
+    sample_stats.sort(axis=0)
+    lower_bounds, upper_bounds = sample_stats[int(num_samples * 0.025)], sample_stats[int(num_samples * 0.975)]
+
+    # The first three elements (intervals of mcnt, ocnt and rcnt) are None
+    intervals = [[[None, None, None] + list(zip(lower_bounds[oi,bi], upper_bounds[oi,bi])) for bi in range(num_buckets)]
+                 for oi in range(num_outs)]
  
     return ref_total, intervals
 
   def calc_examples(self, num_sents, num_outs,
                           statistics,
-                          my_ref_total_list, my_out_matches_list,
+                          my_ref_totals, my_out_matches,
                           num_examples=5):
     """
     Calculate examples based the computed statistics.
@@ -269,8 +916,8 @@ class WordBucketer(Bucketer):
         rec: recall of the bucket
         prec: precision of the bucket
         fmeas: f1-measure of the bucket
-      my_ref_total_list: containing a list of statistics of the reference
-      my_out_matches_list: containing a list of statistics of the outputs
+      my_ref_totals: the bucket counts of the reference for each sentence, of shape (num_sents, num_buckets)
+      my_out_matches: the bucket match counts of the outputs for each sentence, of shape (num_sents, num_outs, num_buckets)
       num_examples: number of examples to print
 
     Returns:
@@ -278,29 +925,24 @@ class WordBucketer(Bucketer):
     """
     num_buckets = len(self.bucket_strs)
     num_examp_feats = 3
-    example_scores = np.zeros( (num_sents, num_examp_feats, num_buckets) )
+    example_scores = np.zeros( (num_sents, num_examp_feats, num_buckets) ,dtype=np.float32)
 
-    # Step through the sentences
-    for rsi, (my_ref_total, my_out_matches) in enumerate(zip(my_ref_total_list, my_out_matches_list)):
-
-      # Scoring of examples across different dimensions:
-      #  0: overall variance of matches
-      example_scores[rsi,0] = (my_out_matches / (my_ref_total+1e-10).reshape( (1, num_buckets) )).std(axis=0)
-      #  1: overall percentage of matches
-      example_scores[rsi,1] = my_out_matches.sum(axis=0) / (my_ref_total*num_outs+1e-10)
-      #  2: overall percentage of misses
-      example_scores[rsi,2] = (my_ref_total*num_outs-my_out_matches.sum(axis=0)) / (my_ref_total*num_outs+1e-10)
+    # Scoring of examples across different dimensions, for all sentences at once:
+    #  0: overall variance of matches
+    example_scores[:,0] = (my_out_matches / (my_ref_totals+1e-10).reshape( (num_sents, 1, num_buckets) )).std(axis=1)
+    #  1: overall percentage of matches
+    example_scores[:,1] = my_out_matches.sum(axis=1) / (my_ref_totals*num_outs+1e-10)
+    #  2: overall percentage of misses
+    example_scores[:,2] = (my_ref_totals*num_outs-my_out_matches.sum(axis=1)) / (my_ref_totals*num_outs+1e-10)
 
     # Calculate statistics
     # Find top-5 examples of each class
     examples = [[('Examples where some systems were good, some were bad', []),
                  ('Examples where all systems were good', []),
                  ('Examples where all systems were bad', [])] for _ in range(num_buckets)]
-    # NOTE: This could be made faster with argpartition, but the complexity is probably not worth it
-    topn = np.argsort(-example_scores, axis=0)
     for bi, bexamples in enumerate(examples):
       for fi, (_, fexamples) in enumerate(bexamples):
-        for si in topn[:num_examples,fi,bi]:
+        for si in stat_utils.top_k_indices(example_scores[:,fi,bi], num_examples):
           if example_scores[si,fi,bi] > 0:
             fexamples.append(si)
 
@@ -331,32 +973,34 @@ class WordBucketer(Bucketer):
     if not hasattr(self, 'case_insensitive'):
       self.case_insensitive = False
 
-    src_labels = src_labels if src_labels else []
-    matches = [[0, 0, 0] for x in self.bucket_strs]
-    for src_sent, ref_sent, out_sent, ref_align, out_align, src_lab in itertools.zip_longest(src, ref, out, ref_aligns, out_aligns, src_labels):
-      ref_cnt = defaultdict(lambda: 0)
-      for i, word in enumerate(ref_sent):
-        if self.case_insensitive:
-          word = corpus_utils.lower(word)
-        ref_cnt[word] += 1
-      for i, (src_index, trg_index) in enumerate(out_align):
-        src_word = src_sent[src_index]
-        word = out_sent[trg_index]
-        if self.case_insensitive:
-          word = corpus_utils.lower(word)
-        bucket = self.calc_bucket(src_word,
-                                  label=src_lab[src_index] if src_lab else None)
-        if ref_cnt[word] > 0:
-          ref_cnt[word] -= 1
-          matches[bucket][0] += 1
-        matches[bucket][2] += 1
-      for i, (src_index, trg_index) in enumerate(ref_align):
-        src_word = src_sent[src_index]
-        bucket = self.calc_bucket(src_word,
-                                  label=src_lab[src_index] if src_lab else None)
-        matches[bucket][1] += 1
-
+    # Find the buckets of all source words
+    src_offsets = _sent_offsets(src)
+    if self.bucket_by_label:
+      src_buckets = self._calc_label_buckets(src_offsets, src_labels)
+    else:
+      src_buckets = self.calc_buckets(self.token_ids(list(itertools.chain.from_iterable(src))))
+    num_buckets = len(self.bucket_strs)
+    match_store = TokenMatchStore(ref, [out], case_insensitive=self.case_insensitive)
+    ref_ids, ref_offsets = match_store.ref_ids, match_store.ref_offsets
+    out_ids, out_offsets = match_store.out_ids[0], match_store.out_offsets[0]
+    vocab_size = len(match_store.words)
+
+    # The n-th aligned occurrence of an output word is matched if it occurs at least n times in the reference
+    ref_keys = np.repeat(np.arange(len(ref)), np.diff(ref_offsets)) * vocab_size + ref_ids
+    uniq_keys, ref_cnts = np.unique(ref_keys, return_counts=True)
+    out_sent_idx, out_src_idx, out_trg_idx = _flatten_aligns(out_aligns, src_offsets, out_offsets)
+    out_keys = out_sent_idx * vocab_size + out_ids[out_trg_idx]
+    pos = np.minimum(np.searchsorted(uniq_keys, out_keys), max(len(uniq_keys)-1, 0))
+    out_ref_cnts = np.where(uniq_keys[pos] == out_keys, ref_cnts[pos], 0) if len(uniq_keys) else 0
+    matched = _occurrence_ranks(out_keys) < out_ref_cnts
+    out_pair_buckets = src_buckets[out_src_idx]
+    _, ref_src_idx, _ = _flatten_aligns(ref_aligns, src_offsets, ref_offsets)
+
+    matches = zip(np.bincount(out_pair_buckets[matched], minlength=num_buckets),
+                  np.bincount(src_buckets[ref_src_idx], minlength=num_buckets),
+                  np.bincount(out_pair_buckets, minlength=num_buckets))
     for both_tot, ref_tot, out_tot in matches:
+      both_tot, ref_tot, out_tot = int(both_tot), int(ref_tot), int(out_tot)
       if both_tot == 0:
         rec, prec, fmeas = 0.0, 0.0, 0.0
       else:
@@ -365,40 +1009,67 @@ class WordBucketer(Bucketer):
         fmeas = 2 * prec * rec / (prec + rec)
       yield both_tot, ref_tot, out_tot, rec, prec, fmeas
 
-  def calc_bucketed_likelihoods(self, corpus, likelihoods):
+  def calc_bucketed_likelihood_stats(self, corpus, likelihoods_list):
     """
-    Calculate the average of log likelihoods, bucketed by the type of word/label we have
-    This must be used with a subclass that has self.bucket_strs defined, and self.calc_bucket(word) implemented.
+    Calculate statistics of the log likelihoods of several systems, bucketed by the type of word/label we have.
+    The buckets of the corpus are calculated once and shared by all systems.
 
     Args:
       corpus: The text/label corpus over which we compute the likelihoods
-      likelihoods: The log-likelihoods corresponding to each word/label in the corpus
+      likelihoods_list: For each system, the log-likelihoods corresponding to each word/label in the corpus
 
     Returns:
-      the average log-likelihood bucketed by the type of word/label we have
+      sums: An array with the sum of the log-likelihoods of each system in each bucket
+      counts: An array with the number of words in each bucket
+      variances: An array with the variance of the log-likelihoods of each system in each bucket, or NaN if the bucket
+                 is empty
     """
-    if not hasattr(self, 'case_insensitive'):
-      self.case_insensitive = False
-
     if type(corpus) == str:
       corpus = corpus_utils.load_tokens(corpus)
-    bucketed_likelihoods = [[0.0, 0] for _ in self.bucket_strs]
-    if len(corpus) != len(likelihoods):
-      raise ValueError("Corpus and likelihoods should have the same size.")
-    for sent, list_of_likelihoods in zip(corpus, likelihoods):
-      if len(sent) != len(list_of_likelihoods):
+    if getattr(self, 'case_insensitive', False):
+      corpus = corpus_utils.lower(corpus)
+    sent_lens = np.fromiter(map(len, corpus), dtype=np.intp, count=len(corpus))
+    for likelihoods in likelihoods_list:
+      if len(corpus) != len(likelihoods):
+        raise ValueError("Corpus and likelihoods should have the same size.")
+      if (np.fromiter(map(len, likelihoods), dtype=np.intp, count=len(likelihoods)) != sent_lens).any():
         raise ValueError("Each sentence of the corpus should have likelihood value for each word")
 
-      for word, ll in zip(sent, list_of_likelihoods):
-        if self.case_insensitive:
-          word = corpus_utils.lower(word)
-        bucket = self.calc_bucket(word, label=word)
-        bucketed_likelihoods[bucket][0] += ll
-        bucketed_likelihoods[bucket][1] += 1
+    # Words are looked up as labels when bucketing by label
+    flat_corpus = list(itertools.chain.from_iterable(corpus))
+    if self.bucket_by_label:
+      buckets = self.calc_buckets(None, self.label_ids(flat_corpus))
+    else:
+      buckets = self.calc_buckets(self.token_ids(flat_corpus))
+    num_buckets = len(self.bucket_strs)
+    counts = np.bincount(buckets, minlength=num_buckets)
+    sums = np.zeros( (len(likelihoods_list), num_buckets) )
+    variances = np.zeros( (len(likelihoods_list), num_buckets) )
+    # Every system is aggregated over the same bucket array
+    with np.errstate(invalid='ignore', divide='ignore'):
+      for si, likelihoods in enumerate(likelihoods_list):
+        lls = np.fromiter(itertools.chain.from_iterable(likelihoods), dtype=float, count=len(buckets))
+        sums[si] = np.bincount(buckets, weights=lls, minlength=num_buckets)
+        means = sums[si] / counts
+        variances[si] = np.bincount(buckets, weights=(lls - means[buckets]) ** 2, minlength=num_buckets) / counts
+    return sums, counts, variances
+
+  def calc_bucketed_likelihoods(self, corpus, likelihoods):
+    """
+    Calculate the average of log likelihoods, bucketed by the type of word/label we have
+    This must be used with a subclass that has self.bucket_strs defined, and self.calc_bucket(word) implemented.
+
+    Args:
+      corpus: The text/label corpus over which we compute the likelihoods
+      likelihoods: The log-likelihoods corresponding to each word/label in the corpus
 
-    for ll, count in bucketed_likelihoods:
+    Returns:
+      the average log-likelihood bucketed by the type of word/label we have
+    """
+    sums, counts, _ = self.calc_bucketed_likelihood_stats(corpus, [likelihoods])
+    for ll, count in zip(sums[0], counts):
       if count != 0:
-        yield ll/float(count)
+        yield float(ll)/float(count)
       else:
         yield "NA" # not applicable
 
@@ -408,7 +1079,8 @@ class FreqWordBucketer(WordBucketer):
   def __init__(self,
                freq_counts=None, freq_count_file=None, freq_corpus_file=None, freq_data=None,
                bucket_cutoffs=None,
-               case_insensitive=False):
+               case_insensitive=False,
+               freq_memory_mb=None):
     """
     A bucketer that buckets words by their frequency.
 
@@ -423,48 +1095,41 @@ class FreqWordBucketer(WordBucketer):
                       Middle buckets will be range(bucket_cutoffs[i],bucket_cutoffs[i-1].
                       Final bucket will be everything greater than bucket_cutoffs[-1].
       case_insensitive: A boolean specifying whether to turn on the case insensitive option.
+      freq_memory_mb: If set, the words in freq_corpus_file are counted approximately in this many megabytes,
+                      which bounds the memory used for very large vocabularies.
     """
     self.case_insensitive = case_insensitive
-    if not freq_counts:
-      freq_counts = defaultdict(lambda: 0)
-      if freq_count_file != None:
-        print(f'Reading frequency from "{freq_count_file}"')
-        with open(freq_count_file, "r") as f:
-          for line in f:
-            cols = line.strip().split('\t')
-            if len(cols) != 2:
-              print(f'Bad line in counts file {freq_count_file}, ignoring:\n{line}')
-            else:
-              word, freq = cols
-              if self.case_insensitive:
-                word = corpus_utils.lower(word)
-              freq_counts[word] = int(freq)
-      elif freq_corpus_file:
-        print(f'Reading frequency from "{freq_corpus_file}"')
-        for words in corpus_utils.iterate_tokens(freq_corpus_file):
-          for word in words:
-            if self.case_insensitive:
-              word = corpus_utils.lower(word)
-            freq_counts[word] += 1
-      elif freq_data:
-        print('Reading frequency from the reference')
-        for words in freq_data:
-          for word in words:
-            if self.case_insensitive:
-              word = corpus_utils.lower(word)
-            freq_counts[word] += 1
-      else:
-        raise ValueError('Must have at least one source of frequency counts for FreqWordBucketer')
-    self.freq_counts = freq_counts
+    if freq_counts:
+      self.freq_table = freq_utils.FreqTable.from_counts(freq_counts)
+    elif freq_count_file != None:
+      print(f'Reading frequency from "{freq_count_file}"')
+      self.freq_table = freq_utils.load_freq_table(freq_count_file, 'counts', case_insensitive=self.case_insensitive)
+    elif freq_corpus_file:
+      print(f'Reading frequency from "{freq_corpus_file}"')
+      self.freq_table = freq_utils.load_freq_table(freq_corpus_file, 'corpus', case_insensitive=self.case_insensitive,
+                                                   memory_mb=freq_memory_mb)
+    elif freq_data:
+      print('Reading frequency from the reference')
+      self.freq_table = freq_utils.FreqTable.from_counts(
+        freq_utils.corpus_counts(freq_data, case_insensitive=self.case_insensitive))
+    else:
+      raise ValueError('Must have at least one source of frequency counts for FreqWordBucketer')
 
     if bucket_cutoffs is None:
       bucket_cutoffs = [1, 2, 3, 4, 5, 10, 100, 1000]
     self.set_bucket_cutoffs(bucket_cutoffs)
+    if isinstance(self.freq_table, freq_utils.CountMinSketch):
+      print(self.freq_table.cutoff_report(bucket_cutoffs))
 
   def calc_bucket(self, word, label=None):
     if self.case_insensitive:
       word = corpus_utils.lower(word)
-    return self.cutoff_into_bucket(self.freq_counts.get(word, 0))
+    return self.cutoff_into_bucket(self.freq_table.lookup([word])[0])
+
+  def calc_bucket_table(self, keys):
+    if self.case_insensitive:
+      keys = corpus_utils.lower(keys)
+    return self.cutoffs_into_buckets(self.freq_table.lookup(keys))
 
   def name(self):
     return "frequency"
@@ -499,6 +1164,8 @@ class CaseWordBucketer(WordBucketer):
 
 class LabelWordBucketer(WordBucketer):
 
+  bucket_by_label = True
+
   def __init__(self,
                label_set=None):
     """
@@ -520,6 +1187,11 @@ class LabelWordBucketer(WordBucketer):
       raise ValueError('When calculating buckets by label, label must be non-zero')
     return self.bucket_map[label]
 
+  def calc_bucket_table(self, keys):
+    if not all(keys):
+      raise ValueError('When calculating buckets by label, label must be non-zero')
+    return [self.bucket_map[l] for l in keys]
+
   def name(self):
     return "labels"
 
@@ -528,6 +1200,8 @@ class LabelWordBucketer(WordBucketer):
 
 class NumericalLabelWordBucketer(WordBucketer):
 
+  bucket_by_label = True
+
   def __init__(self,
                bucket_cutoffs=None):
     """
@@ -549,6 +1223,11 @@ class NumericalLabelWordBucketer(WordBucketer):
     else:
       raise ValueError('When calculating buckets by label must be non-zero')
 
+  def calc_bucket_table(self, keys):
+    if not all(keys):
+      raise ValueError('When calculating buckets by label must be non-zero')
+    return self.cutoffs_into_buckets([float(l) for l in keys])
+
   def name(self):
     return "numerical labels"
 
@@ -572,20 +1251,80 @@ class SentenceBucketer(Bucketer):
     """
     raise NotImplementedError('calc_bucket must be implemented in subclasses of SentenceBucketer')
 
-  def create_bucketed_corpus(self, out, ref=None, ref_labels=None, out_labels=None):
-    bucketed_corpus = [([],[] if ref else None) for _ in self.bucket_strs]
+  def calc_values(self, out, ref, labels):
+    """
+    Calculate the value of every sentence in a corpus, for bucketers that cut sentences into buckets by the values
+    in bucket_cutoffs. This gives the same buckets as calc_bucket, but lets the bucket of all sentences be found at once.
+
+    Args:
+      out: The output corpus
+      ref: The reference corpus, or the output corpus if there is no reference
+      labels: The label of each sentence, or None
+
+    Returns:
+      An array containing the value of each sentence, or None if the bucketer does not bucket sentences by value
+    """
+    return None
+
+  def calc_bucket_ids(self, out, ref=None, ref_labels=None, out_labels=None):
+    """
+    Calculate the bucket of every sentence in a corpus
+
+    Args:
+      out: The output corpus
+      ref: The reference corpus, if it exists
+      ref_labels: The labels of the reference sentences, if they exist
+      out_labels: The labels of the output sentences, used if there are no reference labels
+
+    Returns:
+      An integer array containing the ID of the bucket of each sentence
+    """
     if ref is None:
       ref = out
 
     if ref_labels is None:
       ref_labels = out_labels
-    
-    for i, (out_words, ref_words) in enumerate(zip(out, ref)):
-      bucket = self.calc_bucket(out_words, ref_words, label=(ref_labels[i][0] if ref_labels else None))
-      bucketed_corpus[bucket][0].append(out_words)
-      bucketed_corpus[bucket][1].append(ref_words)
 
-    return bucketed_corpus
+    labels = [x[0] for x in ref_labels] if ref_labels else None
+    values = self.calc_values(out, ref, labels)
+    if values is not None:
+      return self.cutoffs_into_buckets(values)
+    return np.array([self.calc_bucket(out_words, ref_words, label=(labels[i] if labels else None))
+                     for i, (out_words, ref_words) in enumerate(zip(out, ref))], dtype=int)
+
+  def calc_bucket_sent_ids(self, out, ref=None, ref_labels=None, out_labels=None):
+    """
+    Calculate the IDs of the sentences in each bucket, which lets statistics of each bucket be calculated without
+    copying the sentences into buckets
+
+    Args:
+      out: The output corpus
+      ref: The reference corpus, if it exists
+      ref_labels: The labels of the reference sentences, if they exist
+      out_labels: The labels of the output sentences, used if there are no reference labels
+
+    Returns:
+      A list containing an array of the IDs of the sentences in each bucket, in increasing order
+    """
+    bucket_ids = self.calc_bucket_ids(out, ref=ref, ref_labels=ref_labels, out_labels=out_labels)
+    order = np.argsort(bucket_ids, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(bucket_ids, minlength=len(self.bucket_strs)))[:-1])
+
+  def create_bucketed_corpus(self, out, ref=None, ref_labels=None, out_labels=None):
+    """
+    Split a corpus into buckets
+
+    Args:
+      out: The output corpus
+      ref: The reference corpus, if it exists
+      ref_labels: The labels of the reference sentences, if they exist
+      out_labels: The labels of the output sentences, used if there are no reference labels
+
+    Returns:
+      A list containing the output sentences and reference sentences (or None if there is no reference) of each bucket
+    """
+    bucket_sent_ids = self.calc_bucket_sent_ids(out, ref=ref, ref_labels=ref_labels, out_labels=out_labels)
+    return [([out[i] for i in ids], [ref[i] for i in ids] if ref is not None else None) for ids in bucket_sent_ids]
 
 
 class ScoreSentenceBucketer(SentenceBucketer):
@@ -603,9 +1342,14 @@ class ScoreSentenceBucketer(SentenceBucketer):
 
   def calc_bucket(self, val, ref=None, label=None):
     if self.case_insensitive:
-      return self.cutoff_into_bucket(self.scorer.score_sentence(corpus_utils.lower(ref), corpus_utils.lower(val))[0])
+      return self.cutoff_into_bucket(self.scorer.memo_score_sentence(corpus_utils.lower(ref), corpus_utils.lower(val))[0])
     else:
-      return self.cutoff_into_bucket(self.scorer.score_sentence(ref, val)[0])
+      return self.cutoff_into_bucket(self.scorer.memo_score_sentence(ref, val)[0])
+
+  def calc_values(self, out, ref, labels):
+    if self.case_insensitive:
+      out, ref = corpus_utils.lower(out), corpus_utils.lower(ref)
+    return np.array([self.scorer.memo_score_sentence(r, o)[0] for o, r in zip(out, ref)], dtype=float)
 
   def name(self):
     return self.scorer.name()
@@ -626,6 +1370,9 @@ class LengthSentenceBucketer(SentenceBucketer):
   def calc_bucket(self, val, ref=None, label=None):
     return self.cutoff_into_bucket(len(ref))
 
+  def calc_values(self, out, ref, labels):
+    return np.fromiter(map(len, ref), dtype=int, count=len(ref))
+
   def name(self):
     return "length"
 
@@ -645,6 +1392,9 @@ class LengthDiffSentenceBucketer(SentenceBucketer):
   def calc_bucket(self, val, ref=None, label=None):
     return self.cutoff_into_bucket(len(val) - len(ref))
 
+  def calc_values(self, out, ref, labels):
+    return np.fromiter(map(len, out), dtype=int, count=len(out)) - np.fromiter(map(len, ref), dtype=int, count=len(ref))
+
   def name(self):
     return "len(output)-len(reference)"
 
@@ -696,6 +1446,11 @@ class NumericalLabelSentenceBucketer(SentenceBucketer):
   def calc_bucket(self, val, ref=None, label=None):
     return self.cutoff_into_bucket(float(label))
 
+  def calc_values(self, out, ref, labels):
+    if labels is None:
+      return None
+    return np.array([float(l) for l in labels], dtype=float)
+
   def name(self):
     return "numerical labels"
 
@@ -706,9 +1461,12 @@ def create_word_bucketer_from_profile(bucket_type,
                                       freq_counts=None, freq_count_file=None, freq_corpus_file=None, freq_data=None,
                                       label_set=None,
                                       bucket_cutoffs=None,
-                                      case_insensitive=False):
+                                      case_insensitive=False,
+                                      freq_memory_mb=None):
   if type(bucket_cutoffs) == str:
     bucket_cutoffs = [arg_utils.parse_intfloat(x) for x in bucket_cutoffs.split(':')]
+  if type(freq_memory_mb) == str:
+    freq_memory_mb = float(freq_memory_mb)
   if bucket_type == 'freq':
     return FreqWordBucketer(
       freq_counts=freq_counts,
@@ -716,7 +1474,8 @@ def create_word_bucketer_from_profile(bucket_type,
       freq_corpus_file=freq_corpus_file,
       freq_data=freq_data,
       bucket_cutoffs=bucket_cutoffs,
-      case_insensitive=case_insensitive)
+      case_insensitive=case_insensitive,
+      freq_memory_mb=freq_memory_mb)
   if bucket_type == 'case':
     return CaseWordBucketer()
   elif bucket_type == 'label':
@@ -41,13 +41,14 @@ def print_word_likelihood_report(ref, lls, bucket_type='freq', bucket_cutoffs=No
   if label_corpus is not None:
     ref = label_corpus
 
-  lls_out = [[l for l in bucketer.calc_bucketed_likelihoods(ref, ll)] for ll in lls]
+  sums, counts, _ = bucketer.calc_bucketed_likelihood_stats(ref, lls)
 
   print(f'--- average word log likelihood by {bucketer.name()} bucket')
   for i, bucket_str in enumerate(bucketer.bucket_strs):
     print (bucket_str + "\t", end='')
-    for ll_out in lls_out:
-      print(f"{formatting.fmt(ll_out[i])}\t", end="")
+    for ll_sums in sums:
+      ll_out = float(ll_sums[i])/float(counts[i]) if counts[i] != 0 else "NA"
+      print(f"{formatting.fmt(ll_out)}\t", end="")
     print()
 
 def main():
@@ -1,8 +1,11 @@
 # Overall imports
 import argparse
+import contextlib
+import itertools
 import operator
 import numpy as np
 import numpy.random as npr
+import sys
 import tempfile
 
 # In-package imports
@@ -17,12 +20,15 @@ from compare_mt import reporters
 from compare_mt import arg_utils
 from compare_mt import formatting
 from compare_mt import cache_utils
+from compare_mt import freq_utils
 
 source_code_url = 'https://github.com/neulab/compare-mt'
 
 def generate_score_report(ref, outs,
                        score_type='bleu',
                        bootstrap=0, prob_thresh=0.05,
+                       adaptive_bootstrap=False,
+                       approx_randomization=0,
                        meteor_directory=None, options=None,
                        title=None, 
                        case_insensitive=False,
@@ -32,11 +38,14 @@ def generate_score_report(ref, outs,
   Generate a report comparing overall scores of system(s) in both plain text and graphs.
 
   Args:
-    ref: Tokens from the reference
+    ref: Tokens from the reference (each sentence may be a tuple of references)
     outs: Tokens from the output file(s)
     score_type: A string specifying the scoring type (bleu/length)
     bootstrap: Number of samples for significance test (0 to disable)
     prob_thresh: P-value threshold for significance test
+    adaptive_bootstrap: A boolean specifying whether to stop bootstrap resampling as soon as the results are clearly
+                        significant or not (bootstrap is then the maximum number of samples)
+    approx_randomization: Number of samples for approximate randomization test (0 to disable)
     meteor_directory: Path to the directory of the METEOR code
     options: Options when using external program
     compare_directions: A string specifying which systems to compare 
@@ -48,12 +57,17 @@ def generate_score_report(ref, outs,
   # check and set parameters
   bootstrap = int(bootstrap)
   prob_thresh = float(prob_thresh)
+  approx_randomization = int(approx_randomization)
+  if type(adaptive_bootstrap) == str:
+    adaptive_bootstrap = True if adaptive_bootstrap == 'True' else False
   if type(case_insensitive) == str:
     case_insensitive = True if case_insensitive == 'True' else False
 
 
   # compute statistics
   scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive, meteor_directory=meteor_directory, options=options)
+  if not scorer.multi_ref:
+    ref = corpus_utils.primary_reference(ref)
 
   cache_key_list = ['scores', 'strs', 'sign_stats']
   scores, strs, sign_stats = cache_utils.extract_cache_dicts(cache_dicts, cache_key_list, len(outs))
@@ -64,20 +78,31 @@ def generate_score_report(ref, outs,
     cache_dict = cache_utils.return_cache_dict(cache_key_list, [scores, strs, [scorer.cache_stats(ref, outs[0])] ])
     return cache_dict
 
+  direcs = []
+  for i in range(len(scores)):
+    for j in range(i+1, len(scores)):
+      direcs.append( (i,j) )
+  if (bootstrap != 0 or approx_randomization != 0) and sign_stats is None:
+    sign_stats = [scorer.cache_stats(ref, out) for out in outs]
+
   if bootstrap != 0:
-    direcs = []
-    for i in range(len(scores)):
-      for j in range(i+1, len(scores)):
-        direcs.append( (i,j) )
-    wins, sys_stats = sign_utils.eval_with_paired_bootstrap(ref, outs, scorer, direcs, num_samples=bootstrap, cache_stats=sign_stats)
+    wins, sys_stats = sign_utils.eval_with_paired_bootstrap(ref, outs, scorer, direcs, num_samples=bootstrap, cache_stats=sign_stats,
+                                                            adaptive_thresh=prob_thresh if adaptive_bootstrap else None)
     wins = list(zip(direcs, wins))
   else:
     wins = sys_stats = None
+  bootstrap_samples = sys_stats[0]['num_samples'] if adaptive_bootstrap and sys_stats else None
+
+  if approx_randomization != 0:
+    ar_pvals = sign_utils.eval_with_approx_randomization(ref, outs, scorer, direcs, num_samples=approx_randomization, cache_stats=sign_stats)
+    ar_pvals = list(zip(direcs, ar_pvals))
+  else:
+    ar_pvals = None
 
   # generate reports
   reporter = reporters.ScoreReport(scorer=scorer, scores=scores, strs=strs, 
                                    wins=wins, sys_stats=sys_stats, prob_thresh=prob_thresh, 
-                                   title=title)
+                                   title=title, ar_pvals=ar_pvals, bootstrap_samples=bootstrap_samples)
   reporter.generate_report(output_fig_file=f'score-{score_type}-{bootstrap}',
                            output_fig_format='pdf', 
                            output_directory='outputs')
@@ -86,7 +111,7 @@ def generate_score_report(ref, outs,
 def generate_word_accuracy_report(ref, outs,
                           src=None,
                           acc_type='fmeas', bucket_type='freq', bucket_cutoffs=None,
-                          freq_count_file=None, freq_corpus_file=None,
+                          freq_count_file=None, freq_corpus_file=None, freq_memory_mb=None,
                           label_set=None,
                           ref_labels=None, out_labels=None,
                           title=None,
@@ -98,7 +123,7 @@ def generate_word_accuracy_report(ref, outs,
   Generate a report comparing the word accuracy in both plain text and graphs.
 
   Args:
-    ref: Tokens from the reference
+    ref: Tokens from the reference (each sentence may be a tuple of references)
     outs: Tokens from the output file(s)
     src: Tokens from the source
     acc_type: The type of accuracy to show (prec/rec/fmeas). Can also have multiple separated by '+'.
@@ -109,6 +134,7 @@ def generate_word_accuracy_report(ref, outs,
                       to use the frequency in the training set, in which case you specify the path of the
                       training corpus.
     freq_count_file: An alternative to freq_corpus that uses a count file in "word\tfreq" format.
+    freq_memory_mb: If set, count the words in freq_corpus_file approximately in this many megabytes
     ref_labels: either a filename of a file full of reference labels, or a list of strings corresponding to `ref`.
     out_labels: output labels. must be specified if ref_labels is specified.
     title: A string specifying the caption of the printed table
@@ -139,18 +165,24 @@ def generate_word_accuracy_report(ref, outs,
                                                          bucket_cutoffs=bucket_cutoffs,
                                                          freq_count_file=freq_count_file,
                                                          freq_corpus_file=freq_corpus_file,
-                                                         freq_data=ref,
+                                                         freq_memory_mb=freq_memory_mb,
+                                                         freq_data=corpus_utils.primary_reference(ref),
                                                          label_set=label_set,
                                                          case_insensitive=case_insensitive)
 
   cache_key_list = ['statistics', 'my_ref_total_list', 'my_out_totals_list', 'my_out_matches_list']
   statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list = cache_utils.extract_cache_dicts(cache_dicts, cache_key_list, len(outs))
-  if cache_dicts is None:
+  token_results = None
+  if cache_dicts is None and to_cache:
     statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list = bucketer.calc_statistics(ref, outs, ref_labels=ref_labels, out_labels=out_labels)
+  elif cache_dicts is None:
+    # Keep the per-token results to show examples without calculating them again
+    statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list, token_results = \
+      bucketer.calc_statistics(ref, outs, ref_labels=ref_labels, out_labels=out_labels, keep_token_results=True)
   else:
     my_ref_total_list = my_ref_total_list[0]
-    my_out_totals_list = list(np.concatenate(my_out_totals_list, 1))
-    my_out_matches_list = list(np.concatenate(my_out_matches_list, 1))
+    my_out_totals_list = np.concatenate(my_out_totals_list, 1)
+    my_out_matches_list = np.concatenate(my_out_matches_list, 1)
   examples = bucketer.calc_examples(len(ref), len(outs), statistics, my_ref_total_list, my_out_matches_list)
 
   bucket_cnts, bucket_intervals = bucketer.calc_bucket_details(my_ref_total_list, my_out_totals_list, my_out_matches_list) if output_bucket_details else (None, None)
@@ -170,6 +202,7 @@ def generate_word_accuracy_report(ref, outs,
                                   ref_labels=ref_labels,
                                   out_sents=outs,
                                   out_labels=out_labels,
+                                  token_results=token_results,
                                   acc_type=acc_type, header="Word Accuracy Analysis",
                                   title=title)
   reporter.generate_report(output_fig_file=f'word-acc',
@@ -180,7 +213,7 @@ def generate_word_accuracy_report(ref, outs,
 
 def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None,
                           acc_type='rec', bucket_type='freq', bucket_cutoffs=None,
-                          freq_count_file=None, freq_corpus_file=None,
+                          freq_count_file=None, freq_corpus_file=None, freq_memory_mb=None,
                           label_set=None,
                           src_labels=None,
                           title=None,
@@ -204,6 +237,7 @@ def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None,
                       se the frequency in the training set, in which case you specify the path of the target side
                       he training corpus.
     freq_count_file: An alternative to freq_corpus that uses a count file in "word\tfreq" format.
+    freq_memory_mb: If set, count the words in freq_corpus_file approximately in this many megabytes
     src_labels: either a filename of a file full of source labels, or a list of strings corresponding to `ref`.
     title: A string specifying the caption of the printed table
     case_insensitive: A boolean specifying whether to turn on the case insensitive option
@@ -231,18 +265,24 @@ def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None,
                                                          bucket_cutoffs=bucket_cutoffs,
                                                          freq_count_file=freq_count_file,
                                                          freq_corpus_file=freq_corpus_file,
+                                                         freq_memory_mb=freq_memory_mb,
                                                          freq_data=src,
                                                          label_set=label_set,
                                                          case_insensitive=case_insensitive)
 
   cache_key_list = ['statistics', 'my_ref_total_list', 'my_out_totals_list', 'my_out_matches_list']
   statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list = cache_utils.extract_cache_dicts(cache_dicts, cache_key_list, len(outs))
+  token_results = None
   if cache_dicts is not None:
     my_ref_total_list = my_ref_total_list[0]
-    my_out_totals_list = list(np.concatenate(my_out_totals_list, 1))
-    my_out_matches_list = list(np.concatenate(my_out_matches_list, 1))
-  else:
+    my_out_totals_list = np.concatenate(my_out_totals_list, 1)
+    my_out_matches_list = np.concatenate(my_out_matches_list, 1)
+  elif to_cache:
     statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list = bucketer.calc_statistics(ref, outs, src=src, src_labels=src_labels, ref_aligns=ref_align)
+  else:
+    # Keep the per-token results to show examples without calculating them again
+    statistics, my_ref_total_list, my_out_totals_list, my_out_matches_list, token_results = \
+      bucketer.calc_statistics(ref, outs, src=src, src_labels=src_labels, ref_aligns=ref_align, keep_token_results=True)
   examples = bucketer.calc_examples(len(ref), len(outs), statistics, my_ref_total_list, my_out_matches_list)
 
   bucket_cnts, bucket_intervals = bucketer.calc_bucket_details(my_ref_total_list, my_out_totals_list, my_out_matches_list) if output_bucket_details else (None, None)
@@ -262,6 +302,7 @@ def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None,
                                   ref_aligns=ref_align,
                                   out_sents=outs,
                                   src_labels=src_labels,
+                                  token_results=token_results,
                                   acc_type=acc_type, header="Source Word Accuracy Analysis",
                                   title=title)
 
@@ -326,10 +367,8 @@ def generate_sentence_bucketed_report(ref, outs,
     scorer = None
     if bucket_type != 'score' and bucket_type != 'lengthdiff':
       ref = ref_label = None
-    aggregator = lambda out,refs: len(out)
   elif statistic_type == 'score':
     scorer = scorers.create_scorer_from_profile(score_measure, case_insensitive=case_insensitive)
-    aggregator = lambda out,ref: scorer.score_corpus(ref,out)[0]
   else:
     raise ValueError(f'Illegal statistic_type {statistic_type}')
   
@@ -337,17 +376,28 @@ def generate_sentence_bucketed_report(ref, outs,
   cache_key_list = ['stats']
   stats = cache_utils.extract_cache_dicts(cache_dicts, cache_key_list, len(outs))
 
+  # Sentences are bucketed into sets of sentence IDs, and the statistics of each bucket are calculated from them.
+  # If the scorer has sufficient statistics, the statistics of each sentence are calculated once for the whole corpus.
+  use_sent_stats = statistic_type == 'score' and scorer.cacheable
+  if cache_dicts is None or (output_bucket_details and statistic_type == 'score'):
+    bucket_sent_ids = [bucketer.calc_bucket_sent_ids(out, ref=ref, ref_labels=ref_labels if ref_labels else None, out_labels=out_labels[i] if out_labels else None) for i, out in enumerate(outs)]
+    if use_sent_stats:
+      sent_stats = [np.asarray(scorer.cache_stats(ref, out)) for out in outs]
+
   if cache_dicts is None:
-    bcs = [bucketer.create_bucketed_corpus(out, ref=ref, ref_labels=ref_labels if ref_labels else None, out_labels=out_labels[i] if out_labels else None) for i, out in enumerate(outs)]
-    stats = [[aggregator(out,ref) for (out,ref) in bc] for bc in bcs]
+    if statistic_type == 'count':
+      stats = [[len(ids) for ids in sent_ids] for sent_ids in bucket_sent_ids]
+    elif use_sent_stats:
+      stats = [[scorer.score_cached_corpus(ids, sent_stat)[0] for ids in sent_ids] for sent_stat, sent_ids in zip(sent_stats, bucket_sent_ids)]
+    else:
+      stats = [[scorer.score_corpus([ref[j] for j in ids], [out[j] for j in ids])[0] for ids in sent_ids] for out, sent_ids in zip(outs, bucket_sent_ids)]
 
   if output_bucket_details and statistic_type == 'score':
-    bucket_cnt_calculator = lambda out,ref: len(out)
-    bucket_interval_calculator = lambda out,ref: sign_utils.eval_with_paired_bootstrap(ref, [out], scorer, None)[1][0]
-    if cache_dicts is not None: # we don't cache bcs
-      bcs = [bucketer.create_bucketed_corpus(out, ref=ref, ref_labels=ref_labels if ref_labels else None, out_labels=out_labels[i] if out_labels else None) for i, out in enumerate(outs)]
-    bucket_cnts = [bucket_cnt_calculator(out,ref) for (out,ref) in bcs[0]]
-    bucket_intervals = [[bucket_interval_calculator(out,ref) for (out,ref) in bc] for bc in bcs]
+    bucket_cnts = [len(ids) for ids in bucket_sent_ids[0]]
+    bucket_intervals = [[sign_utils.eval_with_paired_bootstrap([ref[j] for j in ids], [[out[j] for j in ids]], scorer, None,
+                                                               cache_stats=[sent_stats[i][ids]] if use_sent_stats else None)[1][0]
+                         for ids in sent_ids]
+                        for i, (out, sent_ids) in enumerate(zip(outs, bucket_sent_ids))]
   else:
     bucket_cnts = bucket_intervals = None
   
@@ -464,6 +514,25 @@ def generate_ngram_report(ref, outs,
                            output_directory='outputs')
   return reporter
 
+def select_scorediff_examples(scorediff_list, report_length):
+  """
+  Select the sentences with the lowest and highest score differences without sorting all of them
+
+  Args:
+    scorediff_list: A list of tuples starting with the score difference of each sentence
+    report_length: The number of sentences to select at each end
+
+  Returns:
+    A sorted list whose first and last report_length elements are the same as in the fully sorted list
+  """
+  if len(scorediff_list) <= 2*report_length:
+    return sorted(scorediff_list)
+  diffs = np.array([x[0] for x in scorediff_list], dtype=np.float32)
+  # Ties with the last selected difference are included as candidates, so the selection is exact
+  lowest = sorted(scorediff_list[i] for i in stat_utils.top_k_candidates(-diffs, report_length))[:report_length]
+  highest = sorted(scorediff_list[i] for i in stat_utils.top_k_candidates(diffs, report_length))[-report_length:]
+  return lowest + highest
+
 def generate_sentence_examples(ref, outs, src=None,
                             score_type='sentbleu',
                             report_length=10,
@@ -476,7 +545,7 @@ def generate_sentence_examples(ref, outs, src=None,
   Generate examples of sentences that satisfy some criterion, usually score of one system better
 
   Args:
-    ref: Tokens from the reference
+    ref: Tokens from the reference (each sentence may be a tuple of references)
     outs: Tokens from the output file(s)
     src: Tokens from the source (optional)
     score_type: The type of scorer to use
@@ -495,6 +564,8 @@ def generate_sentence_examples(ref, outs, src=None,
     
   # compute statistics
   scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive)
+  if not scorer.multi_ref:
+    ref = corpus_utils.primary_reference(ref)
 
   cache_key_list = ['scores', 'strs']
   scores, strs = cache_utils.extract_cache_dicts(cache_dicts, cache_key_list, len(outs))
@@ -503,7 +574,7 @@ def generate_sentence_examples(ref, outs, src=None,
     for out in outs:
       scores_i, strs_i = [], []
       for (r, o) in zip(ref, out):
-        score, string = scorer.score_sentence(r, o)
+        score, string = scorer.memo_score_sentence(r, o)
         scores_i.append(score)
         strs_i.append(string)
       scores.append(scores_i)
@@ -520,31 +591,161 @@ def generate_sentence_examples(ref, outs, src=None,
     scorediff_list = []
     deduplicate_set = set()
     for i, (o1, o2, r) in enumerate(zip(outs[left], outs[right], ref)):
-      if (tuple(o1), tuple(o2), tuple(r)) in deduplicate_set:
+      r = tuple(tuple(x) for x in corpus_utils.sent_refs(r))
+      if (tuple(o1), tuple(o2), r) in deduplicate_set:
         continue
-      deduplicate_set.add( (tuple(o1), tuple(o2), tuple(r)) )
+      deduplicate_set.add( (tuple(o1), tuple(o2), r) )
       s1, str1 = scores[left][i], strs[left][i]
       s2, str2 = scores[right][i], strs[right][i]
       scorediff_list.append((s2-s1, s1, s2, str1, str2, i))
-    scorediff_list.sort()
-    scorediff_lists.append(scorediff_list)
+    scorediff_lists.append(select_scorediff_examples(scorediff_list, report_length))
 
   # generate reports
   reporter = reporters.SentenceExampleReport(report_length=report_length, scorediff_lists=scorediff_lists,
                                              scorer=scorer,
-                                             ref=ref, outs=outs, src=src,
+                                             ref=corpus_utils.primary_reference(ref), outs=outs, src=src,
                                              compare_directions=direcs,
                                              title=title)
   reporter.generate_report()
   return reporter 
 
+class _StreamingSentenceExamples(object):
+  """
+  The sentences with the lowest and highest score differences between two systems in a stream of sentences,
+  where only the sentences in the two bounded heaps are kept in memory.
+  """
+  def __init__(self, report_length):
+    self.report_length = report_length
+    self.heaps = (stat_utils.TopKHeap(report_length, largest=False), stat_utils.TopKHeap(report_length))
+    # The number of heaps containing each kept sentence, and its outputs and references
+    self.sents = {}
+    self.sent_ids = {}
+    self.num_sents = 0
+
+  def add(self, scorediff, sents):
+    """
+    Add a sentence
+
+    Args:
+      scorediff: A tuple of the score difference, the scores and strings of both systems, and the sentence ID
+      sents: A tuple of both outputs and the references of the sentence
+    """
+    # Duplicates are only detected among the sentences that are kept
+    if sents in self.sent_ids:
+      return
+    self.num_sents += 1
+    i = scorediff[-1]
+    for heap in self.heaps:
+      kept, removed = heap.push(scorediff)
+      if kept:
+        self.sents.setdefault(i, [0, sents])[0] += 1
+      if removed is not None:
+        removed_sent = self.sents[removed[-1]]
+        removed_sent[0] -= 1
+        if removed_sent[0] == 0:
+          del self.sent_ids[removed_sent[1]]
+          del self.sents[removed[-1]]
+    if i in self.sents:
+      self.sent_ids[sents] = i
+
+  def scorediff_list(self):
+    """
+    Get a sorted list whose first and last report_length elements are the same as in the fully sorted list
+    """
+    lowest, highest = [x.items() for x in self.heaps]
+    return lowest if self.num_sents <= self.report_length else lowest + highest
+
+def generate_streaming_scores(ref_file, out_files, score_profiles,
+                              report_interval=1000, example_profiles=None):
+  """
+  Print running corpus-level scores while reading the reference and outputs line by line.
+  This can be used to monitor outputs as they are generated, e.g. by reading from named pipes.
+  Each sentence only adds its own sufficient statistics, so every update is independent of the corpus size.
+
+  Args:
+    ref_file: A path to the reference file, or multiple paths separated by ';'
+    out_files: Paths to the output files
+    score_profiles: A list of score profiles in the format of --compare_scores (only score_type and case_insensitive are used)
+    report_interval: The number of sentences between printed scores
+    example_profiles: A list of profiles in the format of --compare_sentence_examples. The examples are printed at the
+                      end of the stream, and only report_length sentences are kept in memory for each side of a comparison.
+
+  Returns:
+    A list containing a list of accumulators for each score profile, one for each output
+  """
+  all_scorers, all_accs = [], []
+  for profile in score_profiles:
+    kargs = arg_utils.parse_profile(profile)
+    scorer = scorers.create_scorer_from_profile(kargs.get('score_type', 'bleu'),
+                                                case_insensitive=kargs.get('case_insensitive') == 'True',
+                                                meteor_directory=kargs.get('meteor_directory'),
+                                                options=kargs.get('options'))
+    all_scorers.append(scorer)
+    all_accs.append([scorer.accumulator() for _ in out_files])
+
+  all_examples = []
+  if len(out_files) > 1:
+    for profile in (example_profiles or []):
+      kargs = arg_utils.parse_profile(profile)
+      scorer = scorers.create_scorer_from_profile(kargs.get('score_type', 'sentbleu'),
+                                                  case_insensitive=kargs.get('case_insensitive') == 'True')
+      report_length = int(kargs.get('report_length', 10))
+      direcs = arg_utils.parse_compare_directions(kargs.get('compare_directions', '0-1'))
+      all_examples.append((scorer, report_length, direcs, kargs.get('title'),
+                           [_StreamingSentenceExamples(report_length) for _ in direcs]))
+
+  def print_scores(num_sents):
+    print('\t'.join([str(num_sents)] + [formatting.fmt(acc.score()) for accs in all_accs for acc in accs]), flush=True)
+
+  def add_examples(i, ref_sent, out_sents):
+    refs = tuple(tuple(x) for x in corpus_utils.sent_refs(ref_sent))
+    for scorer, _, direcs, _, selectors in all_examples:
+      sent_ref = ref_sent if scorer.multi_ref else corpus_utils.sent_refs(ref_sent)[0]
+      sent_scores = {oi: scorer.memo_score_sentence(sent_ref, out_sents[oi]) for oi in set(itertools.chain.from_iterable(direcs))}
+      for (left, right), selector in zip(direcs, selectors):
+        (s1, str1), (s2, str2) = sent_scores[left], sent_scores[right]
+        selector.add((s2-s1, s1, s2, str1, str2, i), (tuple(out_sents[left]), tuple(out_sents[right]), refs))
+
+  print('\t'.join(['# sents'] + [f'{sn} {scorer.name()}' for scorer in all_scorers for sn in reporters.sys_names]), flush=True)
+  num_sents = 0
+  ref_files = arg_utils.parse_files(ref_file)
+  ref_iterator = zip(*[corpus_utils.iterate_tokens(x) for x in ref_files])
+  if len(ref_files) == 1:
+    ref_iterator = (x[0] for x in ref_iterator)
+  iterators = [ref_iterator] + [corpus_utils.iterate_tokens(x) for x in out_files]
+  for ref_sent, *out_sents in zip(*iterators):
+    for accs in all_accs:
+      for acc, out_sent in zip(accs, out_sents):
+        acc.update(ref_sent, out_sent)
+    if all_examples:
+      add_examples(num_sents, ref_sent, out_sents)
+    num_sents += 1
+    if num_sents % report_interval == 0:
+      print_scores(num_sents)
+  if num_sents % report_interval != 0:
+    print_scores(num_sents)
+
+  for scorer, report_length, direcs, title, selectors in all_examples:
+    # The reports only need the kept sentences, which are looked up by their IDs
+    ref_sents, out_sents = {}, [{} for _ in out_files]
+    for (left, right), selector in zip(direcs, selectors):
+      for i, (_, (out1, out2, refs)) in selector.sents.items():
+        ref_sents[i], out_sents[left][i], out_sents[right][i] = refs[0], out1, out2
+    reporter = reporters.SentenceExampleReport(report_length=report_length,
+                                               scorediff_lists=[x.scorediff_list() for x in selectors],
+                                               scorer=scorer, ref=ref_sents, outs=out_sents,
+                                               compare_directions=direcs, title=title)
+    reporter.generate_report()
+
+  return all_accs
+
 def main():
   parser = argparse.ArgumentParser(
       description='Program to compare MT results',
       epilog=f'For more details, see {source_code_url}'
   )
   parser.add_argument('ref_file', type=str,
-                      help='A path to a correct reference file')
+                      help="A path to a correct reference file, or multiple paths separated by ';' for multiple references")
   parser.add_argument('out_files', type=str, nargs='+',
                       help='Paths to system outputs')
   parser.add_argument('--sys_names', type=str, nargs='+', default=None,
@@ -596,6 +797,12 @@ def main():
                       A path to a directory where a graphical report will be saved. Open index.html in the directory
                       to read the report.
                       """)
+  parser.add_argument('--output_json', type=str, default=None,
+                      help="""
+                      A path to a file where all reports will be written in JSON format ("-" for standard output,
+                      in which case the text reports are written to standard error).
+                      Unlike --output_directory, this does not render any figures.
+                      """)
   parser.add_argument('--report_title', type=str, default='compare-mt Analysis Report',
                       help="""
                       The name of the HTML report.
@@ -604,11 +811,30 @@ def main():
                       help="Number of decimals to print for floating point numbers")
   parser.add_argument('--seed', type=int, default=None,
                       help="Seed for random number generation")
+  parser.add_argument('--num_workers', type=int, default=None,
+                      help="""
+                      Number of processes used for bootstrap resampling and word accuracy statistics.
+                      The results for a given --seed do not depend on the number of processes.
+                      """)
+  parser.add_argument('--freq_table_dir', type=str, default=None,
+                      help="""
+                      A directory where the word frequencies of freq_count_file and freq_corpus_file are stored
+                      after they are first read, keyed by the content of the file. Later runs memory-map the
+                      stored frequencies instead of reading the file again.
+                      """)
   parser.add_argument('--scorer_scale', type=float, default=100, choices=[1, 100],
                       help="Set the scale of BLEU, METEOR, WER and chrF to 0-1 or 0-100 (default 0-100)")
   parser.add_argument('--http', type=int, dest='bind_port',
                       help='Launch an HTTP server at specified port to view results.'
                            'Disabled by default, but specifying a port number enabled it.')
+  parser.add_argument('--stream', action='store_true',
+                      help="""
+                      Read the reference and output files (which may be pipes) line by line, and print running
+                      corpus-level scores for each profile in --compare_scores instead of performing the full analysis.
+                      Sentence examples for each profile in --compare_sentence_examples are printed at the end.
+                      """)
+  parser.add_argument('--stream_interval', type=int, default=1000,
+                      help="Number of sentences between the scores printed in --stream mode")
   parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}')
   args = parser.parse_args()
 
@@ -622,38 +848,64 @@ def main():
   # Set scale
   scorers.global_scorer_scale = args.scorer_scale
 
-  ref = corpus_utils.load_tokens(args.ref_file)
-  outs = [corpus_utils.load_tokens(x) for x in args.out_files]
-
-  src = corpus_utils.load_tokens(args.src_file) if args.src_file else None 
-  reporters.sys_names = args.sys_names if args.sys_names else [f'sys{i+1}' for i in range(len(outs))]
-  reporters.fig_size = tuple([float(x) for x in args.fig_size.split('x')])
-  if len(reporters.sys_names) != len(outs):
-    raise ValueError(f'len(sys_names) != len(outs) -- {len(reporters.sys_names)} != {len(outs)}')
-
-  reports = []
-
-  report_types = [
-    (args.compare_scores, generate_score_report, 'Aggregate Scores', False),
-    (args.compare_word_accuracies, generate_word_accuracy_report, 'Word Accuracies', False),
-    (args.compare_src_word_accuracies, generate_src_word_accuracy_report, 'Source Word Accuracies', True),
-    (args.compare_sentence_buckets, generate_sentence_bucketed_report, 'Sentence Buckets', False)]
-  if len(outs) > 1:
-    report_types += [
-      (args.compare_ngrams, generate_ngram_report, 'Characteristic N-grams', False),
-      (args.compare_sentence_examples, generate_sentence_examples, 'Sentence Examples', True),
-    ]
-
-  for arg, func, name, use_src in report_types:
-    if arg is not None:
-      if use_src:
-        reports.append( (name, [func(ref, outs, src, **arg_utils.parse_profile(x)) for x in arg]) )
-      else:
-        reports.append( (name, [func(ref, outs, **arg_utils.parse_profile(x)) for x in arg]) )
-
-  # Write all reports into a single html file
-  if args.output_directory != None:
-    reporters.generate_html_report(reports, args.output_directory, args.report_title)
+  # Set parallelism of resampling
+  sign_utils.global_num_workers = args.num_workers
+  # All bootstrap resampling in this run uses the same samples
+  sign_utils.global_resample_plan = sign_utils.ResamplePlan(seed=args.seed)
+  # Word accuracy analyses of this run share their token matches
+  bucketers.global_match_stores = {}
+  # Set where frequency tables are stored
+  freq_utils.global_table_dir = args.freq_table_dir
+
+  if args.stream:
+    reporters.sys_names = args.sys_names if args.sys_names else [f'sys{i+1}' for i in range(len(args.out_files))]
+    generate_streaming_scores(args.ref_file, args.out_files, args.compare_scores, report_interval=args.stream_interval,
+                              example_profiles=args.compare_sentence_examples)
+    return
+
+  # When the JSON reports are written to standard output, the text reports are written to standard error instead
+  text_out = sys.stderr if args.output_json == '-' else sys.stdout
+  with contextlib.redirect_stdout(text_out):
+    ref = corpus_utils.merge_references([corpus_utils.load_tokens(x) for x in arg_utils.parse_files(args.ref_file)])
+    outs = [corpus_utils.load_tokens(x) for x in args.out_files]
+    # The sentence scores of each scorer over all outputs are kept, so that later analyses can reuse them
+    scorers.global_sentence_score_memo = scorers.SentenceScoreMemo(max_size=len(ref) * len(outs))
+
+    src = corpus_utils.load_tokens(args.src_file) if args.src_file else None 
+    reporters.sys_names = args.sys_names if args.sys_names else [f'sys{i+1}' for i in range(len(outs))]
+    reporters.fig_size = tuple([float(x) for x in args.fig_size.split('x')])
+    if len(reporters.sys_names) != len(outs):
+      raise ValueError(f'len(sys_names) != len(outs) -- {len(reporters.sys_names)} != {len(outs)}')
+
+    reports = []
+
+    # Analyses that do not support multiple references only use the first one
+    primary_ref = corpus_utils.primary_reference(ref)
+    report_types = [
+      (args.compare_scores, generate_score_report, 'Aggregate Scores', False, True),
+      (args.compare_word_accuracies, generate_word_accuracy_report, 'Word Accuracies', False, True),
+      (args.compare_src_word_accuracies, generate_src_word_accuracy_report, 'Source Word Accuracies', True, False),
+      (args.compare_sentence_buckets, generate_sentence_bucketed_report, 'Sentence Buckets', False, False)]
+    if len(outs) > 1:
+      report_types += [
+        (args.compare_ngrams, generate_ngram_report, 'Characteristic N-grams', False, False),
+        (args.compare_sentence_examples, generate_sentence_examples, 'Sentence Examples', True, True),
+      ]
+
+    for arg, func, name, use_src, use_multi_ref in report_types:
+      if arg is not None:
+        func_ref = ref if use_multi_ref else primary_ref
+        if use_src:
+          reports.append( (name, [func(func_ref, outs, src, **arg_utils.parse_profile(x)) for x in arg]) )
+        else:
+          reports.append( (name, [func(func_ref, outs, **arg_utils.parse_profile(x)) for x in arg]) )
+
+    # Write all reports into a single html file
+    if args.output_directory != None:
+      reporters.generate_html_report(reports, args.output_directory, args.report_title)
+
+  if args.output_json != None:
+    reporters.generate_json_report(reports, args.output_json)
 
   if args.bind_port:
     out_dir = args.output_directory
@@ -26,7 +26,43 @@ def load_alignments(filename):
   return list(iterate_alignments(filename))
 
 def lower(inp):
-  return inp.lower() if type(inp) == str else [lower(x) for x in inp]
+  if type(inp) == str:
+    return inp.lower()
+  elif type(inp) == tuple:
+    return tuple(lower(x) for x in inp)
+  return [lower(x) for x in inp]
+
+def merge_references(refs):
+  """
+  Combine several reference corpora into a multi-reference corpus
+
+  Args:
+    refs: A list of reference corpora of the same length
+
+  Returns:
+    The reference corpus itself if there is only one, otherwise a corpus where each sentence is a tuple of references
+  """
+  if len(refs) == 1:
+    return refs[0]
+  for r in refs[1:]:
+    if len(r) != len(refs[0]):
+      raise ValueError(f'All reference files should have the same number of sentences -- {len(r)} != {len(refs[0])}')
+  return [tuple(sents) for sents in zip(*refs)]
+
+def is_multi_reference(ref):
+  return len(ref) > 0 and type(ref[0]) == tuple
+
+def sent_refs(ref_sent):
+  """
+  Get all references for a sentence of a (possibly multi-reference) corpus as a tuple
+  """
+  return ref_sent if type(ref_sent) == tuple else (ref_sent,)
+
+def primary_reference(ref):
+  """
+  Get a single-reference corpus containing the first reference for each sentence
+  """
+  return [r[0] for r in ref] if is_multi_reference(ref) else ref
 
 def list2str(l):
   string = ''
@@ -0,0 +1,329 @@
+import hashlib
+import math
+import os
+import tempfile
+import numpy as np
+from collections import Counter
+
+from compare_mt import corpus_utils
+
+# The version of the format of frequency tables, which is part of their key
+table_format_version = 1
+# Words that are longer than this many bytes in UTF-8 are stored in a separate table, so that a few long words
+# do not increase the size of every entry
+max_short_word_bytes = 32
+# Global variable containing the directory where compiled frequency tables are stored (None to count every run)
+global_table_dir = None
+
+def _sorted_words(words, counts):
+  width = max(1, max(map(len, words), default=1))
+  words = np.array(words, dtype=f'S{width}')
+  order = np.argsort(words, kind='stable')
+  return words[order], np.asarray(counts, dtype=np.int64)[order]
+
+def _lookup_sorted(words, counts, queries, query_lens):
+  result = np.zeros(len(queries), dtype=np.int64)
+  # Queries that are longer than all words would be truncated when converted to the width of the words
+  fits = np.flatnonzero(query_lens <= words.dtype.itemsize)
+  if len(words) == 0 or len(fits) == 0:
+    return result
+  fit_queries = np.array([queries[i] for i in fits], dtype=words.dtype)
+  pos = np.minimum(np.searchsorted(words, fit_queries), len(words)-1)
+  found = words[pos] == fit_queries
+  result[fits[found]] = counts[pos[found]]
+  return result
+
+class FreqTable(object):
+  """
+  A table of word frequencies, stored as an array of sorted UTF-8 encoded words and an array of their counts.
+  The arrays can be saved and memory-mapped, and the counts of many words are looked up at once by binary search.
+  """
+
+  def __init__(self, words, counts, long_words, long_counts):
+    """
+    Args:
+      words: A sorted array of fixed-width byte strings, containing the words of at most max_short_word_bytes
+      counts: The count of each word in words
+      long_words: A sorted array of fixed-width byte strings, containing the longer words
+      long_counts: The count of each word in long_words
+    """
+    self.words, self.counts = words, counts
+    self.long_words, self.long_counts = long_words, long_counts
+
+  @classmethod
+  def from_counts(cls, counts):
+    """
+    Create a table from a dictionary of counts
+
+    Args:
+      counts: A dictionary from words to counts
+
+    Returns:
+      A FreqTable
+    """
+    short_words, short_counts, long_words, long_counts = [], [], [], []
+    for word, count in counts.items():
+      word = word.encode('utf-8')
+      if len(word) <= max_short_word_bytes:
+        short_words.append(word)
+        short_counts.append(count)
+      else:
+        long_words.append(word)
+        long_counts.append(count)
+    return cls(*_sorted_words(short_words, short_counts), *_sorted_words(long_words, long_counts))
+
+  @classmethod
+  def load(cls, directory):
+    """
+    Load a table saved by save(), memory-mapping its arrays
+    """
+    return cls(*[np.load(os.path.join(directory, f'{x}.npy'), mmap_mode='r')
+                 for x in ('words', 'counts', 'long_words', 'long_counts')])
+
+  def save(self, directory):
+    """
+    Save the table to a new directory. The directory is created atomically, so that a table being saved by
+    another process is never loaded.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    for name in ('words', 'counts', 'long_words', 'long_counts'):
+      np.save(os.path.join(tmp_dir, f'{name}.npy'), getattr(self, name))
+    try:
+      os.rename(tmp_dir, directory)
+    except OSError:
+      # Another process saved the same table first
+      for name in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, name))
+      os.rmdir(tmp_dir)
+
+  def __len__(self):
+    return len(self.words) + len(self.long_words)
+
+  def lookup(self, words):
+    """
+    Look up the counts of words
+
+    Args:
+      words: A list of words
+
+    Returns:
+      An integer array containing the count of each word, which is 0 for words that are not in the table
+    """
+    queries = [w.encode('utf-8') for w in words]
+    query_lens = np.fromiter(map(len, queries), dtype=np.intp, count=len(queries))
+    result = _lookup_sorted(self.words, self.counts, queries, query_lens)
+    is_long = np.flatnonzero(query_lens > max_short_word_bytes)
+    if len(is_long):
+      result[is_long] = _lookup_sorted(self.long_words, self.long_counts, [queries[i] for i in is_long],
+                                       query_lens[is_long])
+    return result
+
+def _stable_hashes(words):
+  return np.fromiter((int.from_bytes(hashlib.blake2b(w.encode('utf-8'), digest_size=8).digest(), 'little')
+                      for w in words), dtype=np.uint64, count=len(words))
+
+class CountMinSketch(object):
+  """
+  Approximate word counts in a fixed amount of memory, using a count-min sketch with conservative update.
+  Counts are never underestimated, and each count is overestimated by at most error_bound() with probability
+  confidence(), regardless of the size of the vocabulary.
+  """
+
+  def __init__(self, memory_mb, depth=5, seed=0):
+    """
+    Args:
+      memory_mb: The memory used by the counters in megabytes, which is rounded down to a power of two counters per row
+      depth: The number of rows, each with its own hash function
+      seed: The seed of the hash functions
+    """
+    width = int(memory_mb * 2**20) // (depth * 8)
+    if width < 1:
+      raise ValueError(f'The memory of the sketch should allow at least one counter per row, but was {memory_mb}MB')
+    self.log_width = width.bit_length() - 1
+    self.table = np.zeros( (depth, 1 << self.log_width) , dtype=np.int64)
+    rng = np.random.RandomState(seed)
+    # Multiply-shift hashing of the stable 64-bit hash of each word, with an odd multiplier for each row
+    self.multipliers = rng.randint(0, 2**63, size=(depth, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    self.total = 0
+
+  def _cells(self, words):
+    hashes = _stable_hashes(words)
+    return (hashes[None,:] * self.multipliers) >> np.uint64(64 - self.log_width) if self.log_width else \
+           np.zeros( (len(self.table), len(words)) , dtype=np.uint64)
+
+  def add(self, counts):
+    """
+    Add counts of words
+
+    Args:
+      counts: A dictionary from distinct words to counts
+    """
+    if not counts:
+      return
+    cells = self._cells(list(counts.keys())).astype(np.intp)
+    values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    rows = np.broadcast_to(np.arange(len(self.table))[:,None], cells.shape)
+    # Conservative update: raise each counter of a word only as far as the new estimate of the word.
+    # Counters shared by several words in the batch take the largest of their estimates.
+    estimates = self.table[rows, cells].min(0) + values
+    np.maximum.at(self.table, (rows, cells), np.broadcast_to(estimates, cells.shape))
+    self.total += int(values.sum())
+
+  def lookup(self, words):
+    """
+    Look up the approximate counts of words
+
+    Args:
+      words: A list of words
+
+    Returns:
+      An integer array containing the approximate count of each word
+    """
+    if not words:
+      return np.zeros(0, dtype=np.int64)
+    cells = self._cells(words).astype(np.intp)
+    return self.table[np.arange(len(self.table))[:,None], cells].min(0)
+
+  def error_bound(self):
+    """
+    The maximum overestimate of a count with probability confidence()
+    """
+    return int(math.ceil(math.e * self.total / self.table.shape[1]))
+
+  def confidence(self):
+    return 1.0 - math.exp(-len(self.table))
+
+  def cutoff_report(self, bucket_cutoffs):
+    """
+    Describe how the error of the counts affects buckets with the given cutoffs
+
+    Args:
+      bucket_cutoffs: The cutoffs of the buckets
+
+    Returns:
+      A string describing the error
+    """
+    error = self.error_bound()
+    report = (f'Approximate counts are overestimated by at most {error} with probability {self.confidence():.4f}, '
+              f'so words whose counts are less than {error} below a cutoff may be put in a higher bucket')
+    low_cutoffs = [c for c in bucket_cutoffs if c <= error]
+    if low_cutoffs:
+      report += f'. Even unseen words may exceed the cutoffs {", ".join(str(c) for c in low_cutoffs)}'
+    return report
+
+# The number of tokens counted exactly before they are added to a sketch
+sketch_batch_size = 1000000
+
+def sketch_file_counts(filename, memory_mb, case_insensitive=False):
+  """
+  Count the words of a tokenized corpus file approximately, in a fixed amount of memory
+
+  Args:
+    filename: The name of the file
+    memory_mb: The memory used by the sketch in megabytes
+    case_insensitive: Whether to lowercase words
+
+  Returns:
+    A CountMinSketch
+  """
+  sketch = CountMinSketch(memory_mb)
+  batch, batch_tokens = Counter(), 0
+  for words in corpus_utils.iterate_tokens(filename):
+    batch.update(corpus_utils.lower(words) if case_insensitive else words)
+    batch_tokens += len(words)
+    if batch_tokens >= sketch_batch_size:
+      sketch.add(batch)
+      batch, batch_tokens = Counter(), 0
+  sketch.add(batch)
+  return sketch
+
+def count_file_counts(filename, case_insensitive=False):
+  """
+  Read counts from a file in tab-separated word, count format. If words are lowercased, the last count of
+  each lowercased word is used.
+  """
+  freq_counts = {}
+  with open(filename, "r") as f:
+    for line in f:
+      cols = line.strip().split('\t')
+      if len(cols) != 2:
+        print(f'Bad line in counts file {filename}, ignoring:\n{line}')
+      else:
+        word, freq = cols
+        if case_insensitive:
+          word = corpus_utils.lower(word)
+        freq_counts[word] = int(freq)
+  return freq_counts
+
+def corpus_counts(corpus, case_insensitive=False):
+  """
+  Count the words in a tokenized corpus, or an iterator over its sentences
+  """
+  freq_counts = Counter()
+  for words in corpus:
+    freq_counts.update(corpus_utils.lower(words) if case_insensitive else words)
+  return freq_counts
+
+def file_table_key(filename, file_type, case_insensitive=False):
+  """
+  Calculate the key of the frequency table of a file from the content of the file
+
+  Args:
+    filename: The name of the file
+    file_type: 'counts' for a count file, or 'corpus' for a tokenized corpus
+    case_insensitive: Whether words are lowercased
+
+  Returns:
+    A hexadecimal string
+  """
+  key = hashlib.blake2b(f'{table_format_version}\t{file_type}\t{case_insensitive}\t'.encode('utf-8'), digest_size=20)
+  with open(filename, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      key.update(block)
+  return key.hexdigest()
+
+# The tables loaded in this process, by file name, modification time and options
+_loaded_tables = {}
+
+def load_freq_table(filename, file_type, case_insensitive=False, memory_mb=None):
+  """
+  Load the frequencies of the words in a file. If global_table_dir is set, the table is compiled once for the
+  content of the file and memory-mapped on later runs.
+
+  Args:
+    filename: The name of the file
+    file_type: 'counts' for a count file in tab-separated word, count format, or 'corpus' for a tokenized corpus
+    case_insensitive: Whether to lowercase words
+    memory_mb: If set, count the words of a corpus file approximately in this many megabytes, see sketch_file_counts.
+               Count files are always read exactly, as the last count of each word can only be known by remembering
+               all words.
+
+  Returns:
+    A FreqTable, or a CountMinSketch if memory_mb is set and file_type is 'corpus'
+  """
+  if file_type not in ('counts', 'corpus'):
+    raise ValueError(f'Illegal frequency file type {file_type}')
+  stat = os.stat(filename)
+  loaded_key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, file_type, case_insensitive, memory_mb)
+  if loaded_key in _loaded_tables:
+    return _loaded_tables[loaded_key]
+  if memory_mb is not None and file_type == 'corpus':
+    _loaded_tables[loaded_key] = sketch_file_counts(filename, memory_mb, case_insensitive=case_insensitive)
+    return _loaded_tables[loaded_key]
+  table_dir = None
+  if global_table_dir is not None:
+    table_dir = os.path.join(global_table_dir, file_table_key(filename, file_type, case_insensitive))
+  if table_dir is not None and os.path.isdir(table_dir):
+    table = FreqTable.load(table_dir)
+  else:
+    if file_type == 'counts':
+      freq_counts = count_file_counts(filename, case_insensitive=case_insensitive)
+    else:
+      freq_counts = corpus_counts(corpus_utils.iterate_tokens(filename), case_insensitive=case_insensitive)
+    table = FreqTable.from_counts(freq_counts)
+    if table_dir is not None:
+      table.save(table_dir)
+  _loaded_tables[loaded_key] = table
+  return table
@@ -1,11 +1,9 @@
-import matplotlib
-matplotlib.use('agg')
-from matplotlib import pyplot as plt 
-plt.rcParams['font.family'] = 'sans-serif'
 import numpy as np
 import os
 import itertools
+import json
 from compare_mt.formatting import fmt
+from compare_mt import corpus_utils
 
 from functools import partial
 from http.server import SimpleHTTPRequestHandler, HTTPServer
@@ -78,11 +76,24 @@ def next_tab_id():
   tab_counter += 1
   return f'{tab_counter:03d}'
 
+# matplotlib is only imported once a figure is actually rendered, so text-only and JSON-only runs never load it
+_pyplot = None
+def get_pyplot():
+  global _pyplot
+  if _pyplot is None:
+    import matplotlib
+    matplotlib.use('agg')
+    from matplotlib import pyplot as plt
+    plt.rcParams['font.family'] = 'sans-serif'
+    _pyplot = plt
+  return _pyplot
+
 bar_colors = ["#7293CB", "#E1974C", "#84BA5B", "#D35E60", "#808585", "#9067A7", "#AB6857", "#CCC210"]
 
 def make_bar_chart(datas,
                    output_directory, output_fig_file, output_fig_format='png',
                    errs=None, title=None, xlabel=None, xticklabels=None, ylabel=None):
+  plt = get_pyplot()
   fig, ax = plt.subplots(figsize=fig_size)
   ind = np.arange(len(datas[0]))
   width = 0.7/len(datas)
@@ -111,6 +122,7 @@ def make_bar_chart(datas,
     os.makedirs(output_directory)
   out_file = os.path.join(output_directory, f'{output_fig_file}.{output_fig_format}')
   plt.savefig(out_file, format=output_fig_format, bbox_inches='tight')
+  plt.close(fig)
 
 def html_img_reference(fig_file, title):
   latex_code_pieces = [r"\begin{figure}[h]",
@@ -135,6 +147,9 @@ class Report:
   def plot(self, output_directory, output_fig_file, output_fig_type):
     raise NotImplementedError('plot must be implemented in subclasses of Report')
 
+  def json_content(self):
+    raise NotImplementedError('json_content must be implemented in subclasses of Report')
+
   def print_header(self, header):
     print(f'********************** {header} ************************')
 
@@ -149,12 +164,15 @@ class Report:
 class ScoreReport(Report):
   def __init__(self, scorer, scores, strs,
                wins=None, sys_stats=None, prob_thresh=0.05,
-               title=None):
+               title=None, ar_pvals=None, bootstrap_samples=None):
     self.scorer = scorer 
     self.scores = scores
     self.strs = [f'{fmt(x)} ({y})' if y else fmt(x) for (x,y) in zip(scores,strs)]
+    self.aux_strs = strs
     self.wins = wins
     self.sys_stats = sys_stats
+    self.ar_pvals = ar_pvals
+    self.bootstrap_samples = bootstrap_samples
     self.output_fig_file = f'{next_fig_id()}-score-{scorer.idstr()}'
     self.prob_thresh = prob_thresh
     self.title = scorer.name() if not title else title
@@ -169,42 +187,80 @@ class ScoreReport(Report):
     pval = 1-(my_wins[0] if my_wins[0] > my_wins[1] else my_wins[1])
     return winstr, pval
 
+  def ar_winstr_pval(self, left, right, pval):
+    if pval >= self.prob_thresh:
+      winstr = '-'
+    elif self.scores[left] > self.scores[right]:
+      winstr = 's1>s2'
+    else:
+      winstr = 's2>s1'
+    return winstr, pval
+
+  def pairwise_results(self):
+    """
+    Get the results of each significance test as a list of (test name, [((left, right), winstr, pval), ...])
+    """
+    results = []
+    if self.wins is not None:
+      results.append( ('bootstrap', [(direc,)+self.winstr_pval(my_wins) for direc, my_wins in self.wins]) )
+    if self.ar_pvals is not None:
+      results.append( ('approximate randomization', [(direc,)+self.ar_winstr_pval(*direc, pval) for direc, pval in self.ar_pvals]) )
+    return results
+
   def scores_to_tables(self):
-    if self.wins is None:
+    """
+    Returns:
+      A table of scores, and a list of (test name, table of wins) for tests with multiple systems
+    """
+    pairwise_results = self.pairwise_results()
+    if self.wins is None and (self.ar_pvals is None or len(self.scores) < 2):
       # Single table with just scores
-      return [[""]+sys_names, [self.scorer.name()]+self.strs], None
+      return [[""]+sys_names, [self.scorer.name()]+self.strs], []
     elif len(self.scores) == 1:
       # Single table with scores for one system
       return [
         [""]+sys_names,
         [self.scorer.name()]+self.strs,
         [""]+[f'[{fmt(x["lower_bound"])},{fmt(x["upper_bound"])}]' for x in self.sys_stats]
-      ], None
+      ], []
     elif len(self.scores) == 2:
-      # Single table with scores and wins for two systems
-      winstr, pval = self.winstr_pval(self.wins[0][1])
-      return [
+      # Single table with scores and wins for two systems, with results of a second test in an extra row
+      (_, winstr, pval), = pairwise_results[0][1]
+      if self.sys_stats is not None:
+        bounds = [f'[{fmt(x["lower_bound"])},{fmt(x["upper_bound"])}]' for x in self.sys_stats]
+      else:
+        bounds = [""] * len(self.scores)
+      table = [
         [""]+sys_names+["Win?"],
         [self.scorer.name()]+self.strs+[winstr],
-        [""]+[f'[{fmt(x["lower_bound"])},{fmt(x["upper_bound"])}]' for x in self.sys_stats]+[f'p={fmt(pval)}']
-      ], None
+        [""]+bounds+[f'p={fmt(pval)}']
+      ]
+      for test_name, ((_, winstr, pval),) in pairwise_results[1:]:
+        table.append([test_name]+[""]*len(self.scores)+[f'{winstr} (p={fmt(pval)})'])
+      return table, []
     else:
-      # Table with scores, and separate one with wins for multiple systems
-      wptable = [['v s1 / s2 ->'] + [sys_names[i] for i in range(1,len(self.scores))]]
-      for i in range(0, len(self.scores)-1):
-        wptable.append([sys_names[i]] + [""] * (len(self.scores)-1))
-      for (left,right), my_wins in self.wins:
-        winstr, pval = self.winstr_pval(my_wins)
-        wptable[left+1][right] = f'{winstr} (p={fmt(pval)})'
-      return [[""]+sys_names, [self.scorer.name()]+self.strs], wptable
+      # Table with scores, and separate ones with wins for multiple systems
+      win_tables = []
+      for test_name, results in pairwise_results:
+        wptable = [['v s1 / s2 ->'] + [sys_names[i] for i in range(1,len(self.scores))]]
+        for i in range(0, len(self.scores)-1):
+          wptable.append([sys_names[i]] + [""] * (len(self.scores)-1))
+        for (left,right), winstr, pval in results:
+          wptable[left+1][right] = f'{winstr} (p={fmt(pval)})'
+        win_tables.append( (test_name, wptable) )
+      return [[""]+sys_names, [self.scorer.name()]+self.strs], win_tables
 
   def print(self):
-    aggregate_table, win_table = self.scores_to_tables()
+    aggregate_table, win_tables = self.scores_to_tables()
     self.print_header('Aggregate Scores')
     print(f'{self.title}:')
     self.print_tabbed_table(aggregate_table)
-    if win_table:
+    for test_name, win_table in win_tables:
+      if len(win_tables) > 1:
+        print(f'{test_name}:')
       self.print_tabbed_table(win_table)
+    if self.bootstrap_samples is not None:
+      print(f'bootstrap samples: {self.bootstrap_samples}')
 
   def plot(self, output_directory, output_fig_file, output_fig_format='pdf'):
     sys = [[score] for score in self.scores]
@@ -221,14 +277,40 @@ class ScoreReport(Report):
                    xticklabels=xticklabels)
 
   def html_content(self, output_directory):
-    aggregate_table, win_table = self.scores_to_tables()
+    aggregate_table, win_tables = self.scores_to_tables()
     html = html_table(aggregate_table, title=self.title)
-    if win_table:
-      html += html_table(win_table, title=f'{self.scorer.name()} Wins')
+    for test_name, win_table in win_tables:
+      html += html_table(win_table, title=f'{self.scorer.name()} Wins ({test_name})' if len(win_tables) > 1 else f'{self.scorer.name()} Wins')
+    if self.bootstrap_samples is not None:
+      html += tag_str('p', f'bootstrap samples: {self.bootstrap_samples}')
     for ext in ('png', 'pdf'):
       self.plot(output_directory, self.output_fig_file, ext)
     html += html_img_reference(self.output_fig_file, 'Score Comparison')
     return html
+
+  def json_content(self):
+    systems = []
+    for i, (sn, score, aux_str) in enumerate(zip(sys_names, self.scores, self.aux_strs)):
+      system = {'name': sn, 'score': score, 'info': aux_str}
+      if self.sys_stats is not None:
+        system['lower_bound'], system['upper_bound'] = self.sys_stats[i]['lower_bound'], self.sys_stats[i]['upper_bound']
+      systems.append(system)
+    content = {'type': 'score', 'title': self.title, 'scorer': self.scorer.idstr(), 'systems': systems}
+    if self.bootstrap_samples is not None:
+      content['bootstrap_samples'] = self.bootstrap_samples
+    if self.wins is not None:
+      content['wins'] = []
+      for (left, right), my_wins in self.wins:
+        winstr, pval = self.winstr_pval(my_wins)
+        content['wins'].append({'left': sys_names[left], 'right': sys_names[right],
+                                'win_ratios': list(my_wins), 'winner': winstr, 'p': pval})
+    if self.ar_pvals is not None:
+      content['approx_randomization'] = []
+      for (left, right), pval in self.ar_pvals:
+        winstr, _ = self.ar_winstr_pval(left, right, pval)
+        content['approx_randomization'].append({'left': sys_names[left], 'right': sys_names[right],
+                                                'winner': winstr, 'p': pval})
+    return content
     
 class WordReport(Report):
   def __init__(self, bucketer, statistics,
@@ -240,6 +322,7 @@ class WordReport(Report):
                ref_sents=None, ref_labels=None,
                out_sents=None, out_labels=None,
                src_labels=None, ref_aligns=None,
+               token_results=None,
                title=None):
     self.bucketer = bucketer
     self.statistics = [[s for s in stat] for stat in statistics]
@@ -253,6 +336,7 @@ class WordReport(Report):
     self.out_labels = out_labels
     self.src_labels = src_labels
     self.ref_aligns = ref_aligns
+    self.token_results = token_results
     self.acc_type = acc_type
     self.header = header
     self.acc_type_map = {'prec': 3, 'rec': 4, 'fmeas': 5}
@@ -335,17 +419,23 @@ class WordReport(Report):
         html += tag_str('h4', tag)
         for eid in examp_ids:
           table = [['', 'Output']]
+          # Only the first reference is displayed if there are multiple references
+          ref_sent = corpus_utils.sent_refs(self.ref_sents[eid])[0]
           # Find buckets for the examples if it's on the source side (will have alignments in this case)
+          # The buckets and matches are taken from the results of calculating the statistics if they were kept
           if self.ref_aligns:
-            _, _, _, src_buckets, ref_aligns, ref_matches = \
-              self.bucketer._calc_src_buckets_and_matches(self.src_sents[eid],
-                                                          self.src_labels[eid] if self.src_labels else None,
-                                                          self.ref_sents[eid],
-                                                          self.ref_aligns[eid],
-                                                          [x[eid] for x in self.out_sents])
+            if self.token_results is not None:
+              src_buckets, ref_matches = self.token_results.sentence(eid)
+            else:
+              _, _, _, src_buckets, _, ref_matches = \
+                self.bucketer._calc_src_buckets_and_matches(self.src_sents[eid],
+                                                            self.src_labels[eid] if self.src_labels else None,
+                                                            self.ref_sents[eid],
+                                                            self.ref_aligns[eid],
+                                                            [x[eid] for x in self.out_sents])
             src_hls = [x == bi for x in src_buckets]
             table.append(['Src', self.highlight_words(self.src_sents[eid], src_hls)])
-            ref_hls = [False for _ in self.ref_sents[eid]]
+            ref_hls = [False for _ in ref_sent]
             out_hls = [[False for _ in x[eid]] for x in self.out_sents]
             for sid, tid in self.ref_aligns[eid]:
               if src_hls[sid]:
@@ -355,14 +445,18 @@ class WordReport(Report):
                     ohls[rm[tid]] = True
           # Find buckets for the examples if it's on the target side
           else:
-            _, _, _, ref_buckets, out_buckets, out_matches = \
-              self.bucketer._calc_trg_buckets_and_matches(self.ref_sents[eid],
-                                                          self.ref_labels[eid] if self.ref_labels else None,
-                                                          [x[eid] for x in self.out_sents],
-                                                          [x[eid] for x in self.out_labels] if self.out_labels else None)
+            if self.token_results is not None:
+              ref_buckets, out_buckets, out_matched = self.token_results.sentence(eid)
+            else:
+              _, _, _, ref_buckets, out_buckets, out_matches = \
+                self.bucketer._calc_trg_buckets_and_matches(self.ref_sents[eid],
+                                                            self.ref_labels[eid] if self.ref_labels else None,
+                                                            [x[eid] for x in self.out_sents],
+                                                            [x[eid] for x in self.out_labels] if self.out_labels else None)
+              out_matched = [[m >= 0 for m in om] for om in out_matches]
             ref_hls = [x == bi for x in ref_buckets]
-            out_hls = [[(b == bi and m >= 0) for (b,m) in zip(ob, om)] for (ob, om) in zip(out_buckets, out_matches)]
-          table.append(['Ref', self.highlight_words(self.ref_sents[eid], ref_hls)])
+            out_hls = [[(b == bi and m) for (b,m) in zip(ob, om)] for (ob, om) in zip(out_buckets, out_matched)]
+          table.append(['Ref', self.highlight_words(ref_sent, ref_hls)])
           for sn, oss, ohl in itertools.zip_longest(sys_names, self.out_sents, out_hls):
             table.append([sn, self.highlight_words(oss[eid], ohl)])
           html += html_table(table, None)
@@ -411,6 +505,25 @@ class WordReport(Report):
       html += html_img_reference(img_name, self.header)
     return html 
 
+  def json_content(self):
+    stat_names = ['matches', 'ref_total', 'out_total', 'rec', 'prec', 'fmeas']
+    systems = []
+    for j, (sn, stats) in enumerate(zip(sys_names, self.statistics)):
+      buckets = []
+      for i, stat in enumerate(stats):
+        bucket = dict(zip(stat_names, stat))
+        if self.bucket_intervals is not None:
+          for name, interval in zip(stat_names, self.bucket_intervals[j][i]):
+            if interval is not None:
+              bucket[f'{name}_interval'] = list(interval)
+        buckets.append(bucket)
+      systems.append({'name': sn, 'buckets': buckets})
+    content = {'type': 'word', 'header': self.header, 'title': self.title, 'bucketer': self.bucketer.name(),
+               'buckets': list(self.bucketer.bucket_strs), 'systems': systems}
+    if self.bucket_cnts is not None:
+      content['bucket_counts'] = list(self.bucket_cnts)
+    return content
+
 class NgramReport(Report):
   def __init__(self, scorelist, report_length, min_ngram_length, max_ngram_length,
                matches, compare_type, alpha, compare_directions=[(0, 1)], label_files=None, title=None):
@@ -472,6 +585,19 @@ class NgramReport(Report):
       html += html_table(table, title)
     return html 
 
+  def json_content(self):
+    def ngram_list(scorelist, left, right):
+      return [{'ngram': ' '.join(k), 'score': v, 'left_count': self.matches[left][k], 'right_count': self.matches[right][k]}
+              for k, v in scorelist]
+    directions = []
+    for i, (left, right) in enumerate(self.compare_directions):
+      directions.append({'left': sys_names[left], 'right': sys_names[right],
+                         'left_better': ngram_list(self.scorelist[i][:self.report_length], left, right),
+                         'right_better': ngram_list(reversed(self.scorelist[i][-self.report_length:]), left, right)})
+    return {'type': 'ngram', 'title': self.title, 'compare_type': self.compare_type,
+            'min_ngram_length': self.min_ngram_length, 'max_ngram_length': self.max_ngram_length,
+            'alpha': self.alpha, 'directions': directions}
+
 class SentenceReport(Report):
 
   def __init__(self, bucketer=None, sys_stats=None, statistic_type=None, scorer=None, bucket_cnts=None, bucket_intervals=None, title=None):
@@ -561,6 +687,19 @@ class SentenceReport(Report):
     html += html_img_reference(self.output_fig_file, 'Sentence Bucket Analysis')
     return html 
 
+  def json_content(self):
+    systems = []
+    for j, (sn, stat) in enumerate(zip(sys_names, self.sys_stats)):
+      system = {'name': sn, 'stats': list(stat)}
+      if self.bucket_intervals is not None:
+        system['intervals'] = [[x['lower_bound'], x['upper_bound']] for x in self.bucket_intervals[j]]
+      systems.append(system)
+    content = {'type': 'sentence', 'title': self.title, 'bucketer': self.bucketer.idstr(),
+               'statistic': self.yidstr, 'buckets': list(self.bucketer.bucket_strs), 'systems': systems}
+    if self.bucket_cnts is not None:
+      content['bucket_counts'] = list(self.bucket_cnts)
+    return content
+
 class SentenceExampleReport(Report):
 
   def __init__(self, report_length=None, scorediff_lists=None, scorer=None, ref=None, outs=None, src=None, compare_directions=[(0, 1)], title=None):
@@ -637,6 +776,16 @@ class SentenceExampleReport(Report):
 
     return html
 
+  def json_content(self):
+    def example_list(scorediff_list):
+      return [{'id': i, 'left_score': s1, 'right_score': s2} for _, s1, s2, _, _, i in scorediff_list]
+    directions = []
+    for cnt, (left, right) in enumerate(self.compare_directions):
+      directions.append({'left': sys_names[left], 'right': sys_names[right],
+                         'left_better': example_list(self.scorediff_lists[cnt][:self.report_length]),
+                         'right_better': example_list(self.scorediff_lists[cnt][-self.report_length:])})
+    return {'type': 'sentence_examples', 'title': self.title, 'scorer': self.scorer.idstr(), 'directions': directions}
+
 
 def tag_str(tag, str, new_line=''):
   return f'<{tag}>{new_line} {str} {new_line}</{tag}>'
@@ -688,6 +837,28 @@ def generate_html_report(reports, output_directory, report_title):
   with open(css_file, 'w') as f:
     f.write(css_style)
 
+def _json_default(x):
+  if isinstance(x, np.generic):
+    return x.item()
+  elif isinstance(x, np.ndarray):
+    return x.tolist()
+  raise TypeError(f'Object of type {type(x).__name__} is not JSON serializable')
+
+def generate_json_report(reports, output_file):
+  """
+  Write all reports in JSON format, without rendering any figures
+
+  Args:
+    reports: A list of (name, list of reports) tuples
+    output_file: The file to write to, or "-" to write to standard output
+  """
+  content = [{'name': name, 'reports': [r.json_content() for r in rep]} for name, rep in reports]
+  if output_file == '-':
+    print(json.dumps(content, indent=2, default=_json_default))
+  else:
+    with open(output_file, 'w') as f:
+      json.dump(content, f, indent=2, default=_json_default)
+
 def launch_http_server(output_directory: str, bind_address:str ='0.0.0.0', bind_port: int=8000):
   assert Path(output_directory).is_dir()
   hostname = bind_address if bind_address != '0.0.0.0' else socket.gethostname()
@@ -27,7 +27,6 @@ import abc
 import collections
 
 import numpy as np
-import six
 from six.moves import xrange  # pylint: disable=redefined-builtin
 
 
@@ -74,8 +73,17 @@ class BootstrapAggregator(object):
          low=Score(precision=0.0, recall=0.0, fmeasure=0.0),
          mid=Score(precision=0.5, recall=0.33, fmeasure=0.40),
          high=Score(precision=1.0, recall=0.66, fmeasure=0.80))}
+
+  Scores are stored in a growable numpy buffer of (precision, recall,
+  fmeasure) rows per score type, and are resampled in blocks of bootstrap
+  samples, so memory use stays proportional to the number of examples.
   """
 
+  # Initial number of rows in the buffer of each score type.
+  _initial_capacity = 1024
+  # Maximum number of elements in the count matrix of a block of samples.
+  _max_block_elements = 2**20
+
   def __init__(self,
                confidence_interval=0.95,
                n_samples=1000):
@@ -96,7 +104,24 @@ class BootstrapAggregator(object):
 
     self._n_samples = n_samples
     self._confidence_interval = confidence_interval
-    self._scores = collections.defaultdict(list)
+    # Buffers of shape (capacity, 3) and the number of rows used in each.
+    self._buffers = collections.OrderedDict()
+    self._sizes = {}
+
+  def _reserve(self, score_type, n):
+    """Returns the buffer of score_type with room for n more rows."""
+
+    if score_type not in self._buffers:
+      self._buffers[score_type] = np.zeros(
+          (max(self._initial_capacity, n), 3))
+      self._sizes[score_type] = 0
+    buf = self._buffers[score_type]
+    size = self._sizes[score_type]
+    if size + n > len(buf):
+      new_buf = np.zeros((max(2 * len(buf), size + n), 3))
+      new_buf[:size] = buf[:size]
+      buf = self._buffers[score_type] = new_buf
+    return buf
 
   def add_scores(self, scores):
     """Adds a sample for future aggregation.
@@ -105,9 +130,26 @@ class BootstrapAggregator(object):
       scores: Dict mapping score_type strings to Score object.
     """
 
-    for score_type, score in six.iteritems(scores):
-      self._scores[score_type].append((score.precision, score.recall,
-                                       score.fmeasure))
+    for score_type, score in scores.items():
+      buf = self._reserve(score_type, 1)
+      size = self._sizes[score_type]
+      buf[size] = (score.precision, score.recall, score.fmeasure)
+      self._sizes[score_type] = size + 1
+
+  def add_scores_batch(self, scores):
+    """Adds many samples for future aggregation.
+
+    Args:
+      scores: Dict mapping score_type strings to a sequence of Score objects,
+        or to an array of shape (n, 3) with precision, recall and fmeasure.
+    """
+
+    for score_type, score_rows in scores.items():
+      score_rows = np.asarray(score_rows, dtype=float).reshape(-1, 3)
+      buf = self._reserve(score_type, len(score_rows))
+      size = self._sizes[score_type]
+      buf[size:size + len(score_rows)] = score_rows
+      self._sizes[score_type] = size + len(score_rows)
 
   def aggregate(self):
     """Aggregates scores previously added using add_scores.
@@ -117,9 +159,9 @@ class BootstrapAggregator(object):
     """
 
     result = {}
-    for score_type, scores in six.iteritems(self._scores):
-      # Stack scores into a 2-d matrix of (sample, measure).
-      score_matrix = np.vstack(scores)
+    for score_type, buf in self._buffers.items():
+      # A 2-d matrix of (sample, measure).
+      score_matrix = buf[:self._sizes[score_type]]
       # Percentiles are returned as (interval, measure).
       percentiles = self._bootstrap_resample(score_matrix)
       # Extract the three intervals (low, mid, high).
@@ -145,12 +187,18 @@ class BootstrapAggregator(object):
     """
 
     # Matrix of (bootstrap sample, measure).
+    n = matrix.shape[0]
     sample_mean = np.zeros((self._n_samples, matrix.shape[1]))
-    for i in xrange(self._n_samples):
-      sample_idx = np.random.choice(
-          np.arange(matrix.shape[0]), size=matrix.shape[0])
-      sample = matrix[sample_idx, :]
-      sample_mean[i, :] = np.mean(sample, axis=0)
+    block_size = max(1, self._max_block_elements // max(n, 1))
+    for start in xrange(0, self._n_samples, block_size):
+      block = min(block_size, self._n_samples - start)
+      # The indices of a block of samples are drawn at once, which gives the
+      # same samples as drawing them one by one.
+      sample_idx = np.random.choice(n, size=(block, n))
+      sample_idx += n * np.arange(block).reshape(block, 1)
+      counts = np.bincount(sample_idx.ravel(), minlength=block * n)
+      sample_mean[start:start + block] = (
+          counts.reshape(block, n).astype(float).dot(matrix) / n)
 
     # Take percentiles on the estimate of the mean using bootstrap samples.
     # Final result is a (bounds, measure) matrix.
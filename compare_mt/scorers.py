@@ -1,24 +1,79 @@
-import nltk
-import nltk.translate.chrf_score  # This is necessary to avoid an AttributeError in NLTK
-import sacrebleu
+# NOTE: nltk, sacrebleu and the rouge package are slow to import, so they are imported inside the scorers
+#       that need them rather than here. This keeps startup fast when only light-weight scorers are used.
 import numpy as np
 import math
 import re
 import subprocess
 import tempfile
-from collections import Counter
+from collections import Counter, OrderedDict
 
 from compare_mt import corpus_utils
 from compare_mt import align_utils
 from compare_mt import ngram_utils
-from compare_mt.rouge import rouge_scorer
 
 # Global variable controlling scorer scale
 global_scorer_scale = 100.0
 
+class SentenceScoreMemo(object):
+  """
+  A size-bounded memo of sentence scores, so that a sentence that is scored by several analyses (e.g. sentence
+  bucketing, bucket statistics and sentence examples) is only scored once. Scores are keyed by the scorer and its
+  options and by the content of the sentences, which stays valid when corpora are bucketed, lowercased or sliced.
+  Each scorer keeps at most max_size scores, and when they are full its least recently used score is evicted. Analyses
+  score whole corpora in turn, so max_size should be at least the number of sentences times the number of outputs.
+  """
+  def __init__(self, max_size=100000):
+    self.max_size = max_size
+    # The scores of each scorer, keyed by its memo_key
+    self.scores = {}
+    self.hits = 0
+    self.misses = 0
+
+  def score_sentence(self, scorer, ref, out):
+    """
+    Score a sentence, reusing the score if it is in the memo
+
+    Args:
+      scorer: The scorer
+      ref: A reference sentence, or a tuple of references
+      out: An output sentence
+
+    Returns:
+      The result of scorer.score_sentence(ref, out)
+    """
+    scorer_key = scorer.memo_key()
+    if scorer_key is None:
+      return scorer.score_sentence(ref, out)
+    scores = self.scores.setdefault(scorer_key, OrderedDict())
+    key = (tuple(tuple(x) for x in ref) if type(ref) == tuple else tuple(ref), tuple(out))
+    result = scores.get(key)
+    if result is not None:
+      self.hits += 1
+      scores.move_to_end(key)
+      return result
+    self.misses += 1
+    result = scorer.score_sentence(ref, out)
+    scores[key] = result
+    if len(scores) > self.max_size:
+      scores.popitem(last=False)
+    return result
+
+# Global variable containing the sentence score memo of the process (None to score sentences every time)
+global_sentence_score_memo = SentenceScoreMemo()
+
+def _is_simple_option(val):
+  if type(val) == tuple:
+    return all(_is_simple_option(x) for x in val)
+  return isinstance(val, (str, int, float, bool, type(None)))
+
 
 class Scorer(object):
 
+  # Whether cache_stats returns additive sufficient statistics, one row per sentence
+  cacheable = False
+  # Whether the scorer accepts multi-reference corpora, where each reference sentence is a tuple of references
+  multi_ref = False
+
   @property
   def scale(self):
     return 1.0
@@ -29,9 +84,77 @@ class Scorer(object):
   def score_sentence(self, ref, out):
     pass
 
+  def memo_score_sentence(self, ref, out):
+    """
+    Score a sentence in the same way as score_sentence, reading through global_sentence_score_memo
+    """
+    if global_sentence_score_memo is None:
+      return self.score_sentence(ref, out)
+    return global_sentence_score_memo.score_sentence(self, ref, out)
+
+  def memo_key(self):
+    """
+    A key identifying the scorer and its options, which is used to share sentence scores between equal scorers.
+    By default it contains all attributes of the scorer. If an attribute is not of a simple type, the options cannot be
+    compared safely and None is returned, so that the sentence scores are not memoized. Scorers with such attributes
+    should override this with a key of the options that determine them.
+    """
+    options = tuple(sorted(vars(self).items()))
+    if not all(_is_simple_option(v) for _, v in options):
+      return None
+    return (type(self).__name__, self.scale, options)
+
   def cache_stats(self, ref, out):
     return None
 
+  def score_stats(self, stats):
+    """
+    Calculate a score from sufficient statistics
+
+    Args:
+      stats: The sum of rows of the statistics returned by cache_stats
+
+    Returns:
+      A single value for the score
+    """
+    raise NotImplementedError(f'score_stats is not implemented in {type(self).__name__}')
+
+  def score_stats_batch(self, stats):
+    """
+    Calculate scores from many sums of sufficient statistics at once, e.g. for all bootstrap samples
+
+    Args:
+      stats: An array where each row is a sum of rows of the statistics returned by cache_stats
+
+    Returns:
+      An array with the score of each row
+    """
+    return np.array([self.score_stats(x) for x in stats], dtype=float)
+
+  def score_cached_corpus(self, sent_ids, cached_stats):
+    """
+    Score a corpus with cache
+
+    Args:
+      sent_ids: The sentence ids for reference and output corpora
+      cached_stats: An array of cached statistics with one row per sentence
+
+    Returns:
+      A tuple containing a single value for the score and a string summarizing auxiliary information
+    """
+    if len(cached_stats) == 0 or len(sent_ids) == 0:
+      return 0.0, None
+    cached_stats = np.asarray(cached_stats)
+    return self.score_stats(cached_stats[np.asarray(sent_ids, dtype=int)].sum(0)), None
+
+  def accumulator(self):
+    """
+    Create an accumulator that calculates a running corpus-level score one sentence at a time.
+    """
+    if not self.cacheable:
+      raise NotImplementedError(f'{type(self).__name__} does not have sufficient statistics to accumulate')
+    return ScoreAccumulator(self)
+
   def name(self):
     """
     A name that can have spaces that describes the scorer.
@@ -44,7 +167,58 @@ class Scorer(object):
     """
     return None
 
+class ScoreAccumulator(object):
+  """
+  Accumulates the sufficient statistics of a scorer sentence by sentence. Each update takes time
+  proportional to the length of the sentence, so a running corpus-level score can be calculated
+  while outputs are still being generated.
+  """
+  def __init__(self, scorer):
+    self.scorer = scorer
+    self.stats = None
+    self.num_sents = 0
+
+  def update(self, ref_sent, out_sent):
+    """
+    Add the statistics of a single sentence
+
+    Args:
+      ref_sent: A reference sentence, or a tuple of references if the scorer supports multiple references
+      out_sent: An output sentence
+    """
+    if not self.scorer.multi_ref:
+      ref_sent = corpus_utils.sent_refs(ref_sent)[0]
+    stats = self.scorer.cache_stats([ref_sent], [out_sent])[0]
+    self.stats = stats if self.stats is None else self.stats + stats
+    self.num_sents += 1
+
+  def merge(self, other):
+    """
+    Add the statistics collected by another accumulator for the same scorer
+
+    Args:
+      other: The other accumulator
+
+    Returns:
+      This accumulator
+    """
+    if other.stats is not None:
+      self.stats = other.stats.copy() if self.stats is None else self.stats + other.stats
+    self.num_sents += other.num_sents
+    return self
+
+  def score(self):
+    """
+    Calculate the score of all sentences added so far
+    """
+    if self.stats is None:
+      return 0.0
+    return self.scorer.score_stats(self.stats)
+
 class SentenceFactoredScorer(Scorer):
+
+  cacheable = True
+
   def score_corpus(self, ref, out):
     """
     Score a corpus using the average of the score
@@ -60,7 +234,7 @@ class SentenceFactoredScorer(Scorer):
       return 0.0, None
     score_sum = 0
     for r, o in zip(ref, out):
-      score_sum += self.score_sentence(r, o)[0]
+      score_sum += self.memo_score_sentence(r, o)[0]
     return score_sum/len(ref), None
 
   def cache_stats(self, ref, out):
@@ -72,36 +246,39 @@ class SentenceFactoredScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A tuple of cached statistics
+      An array with the score of each sentence and a count of 1
     """
     if hasattr(self, 'case_insensitive') and self.case_insensitive:
       ref = corpus_utils.lower(ref)
       out = corpus_utils.lower(out)
 
-    cached_scores = []
-    for r, o in zip(ref, out):
-      cached_scores.append(self.score_sentence(r, o)[0])
+    cached_stats = np.ones( (len(ref), 2) )
+    for i, (r, o) in enumerate(zip(ref, out)):
+      cached_stats[i,0] = self.memo_score_sentence(r, o)[0]
   
-    return cached_scores
+    return cached_stats
 
-  def score_cached_corpus(self, sent_ids, cached_stats):
+  def score_stats(self, stats):
     """
-    Score a corpus with cache
-
-    Args:
-      sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A tuple of cached statistics
-
-    Returns:
-      A tuple containing a single value for the score and a string summarizing auxiliary information
+    Calculate the average score from the summed scores and sentence count
     """
-    cached_stats = np.array(cached_stats)
-    return np.mean(cached_stats[sent_ids]), None
+    return stats[0] / stats[1] if stats[1] != 0 else 0.0
+
+  def score_stats_batch(self, stats):
+    stats = np.asarray(stats, dtype=float)
+    counts = stats[:,1]
+    return np.divide(stats[:,0], counts, out=np.zeros(len(stats)), where=counts != 0)
 
 class BleuScorer(Scorer):
   """
   A scorer that calculates BLEU score.
+  With multiple references, n-gram counts are clipped by their maximum count in any reference,
+  and the reference length closest to the output length is used for the brevity penalty.
   """
+
+  cacheable = True
+  multi_ref = True
+
   def __init__(self, weights=(0.25, 0.25, 0.25, 0.25), case_insensitive=False):
     self.weights = weights
     self.case_insensitive = case_insensitive
@@ -121,28 +298,44 @@ class BleuScorer(Scorer):
     Returns:
       A tuple containing a single value for the BLEU score and a string summarizing auxiliary information
     """
-    cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(range(len(ref)), cached_stats)
+    if len(ref) == 0:
+      return 0.0, None
+    return self.score_stats(self.cache_stats(ref, out).sum(0)), None
 
   def score_sentence(self, ref, out):
     raise NotImplementedError("Sentence-level calculation is not implemented in BleuScorer as it is usually 0."
                               "Consider using SentenceBleuScorer (string sentbleu) instead.")
 
+  def _ref_ngram_counts(self, refs, n):
+    """
+    Calculate the maximum count of each n-gram over the references of a sentence
+
+    Args:
+      refs: A tuple of reference sentences
+      n: The n-gram length
+
+    Returns:
+      A Counter with the maximum count of each n-gram
+    """
+    ref_cnt = Counter(ngram_utils.sent_ngrams_list(refs[0], n))
+    for ref in refs[1:]:
+      ref_cnt |= Counter(ngram_utils.sent_ngrams_list(ref, n))
+    return ref_cnt
+
   def _precision(self, ref, out, n):
     """
     Caculate n-gram precision 
 
     Args:
-      ref: A reference sentence
+      ref: A reference sentence, or a tuple of references
       out: An output sentence
 
     Returns:
       Numerator and denominator of the precision
     """
     out_ngram = ngram_utils.sent_ngrams_list(out, n)
-    ref_ngram = ngram_utils.sent_ngrams_list(ref, n)
     out_cnt = Counter(out_ngram)
-    ref_cnt = Counter(ref_ngram)
+    ref_cnt = self._ref_ngram_counts(corpus_utils.sent_refs(ref), n)
 
     num = 0
     denom = 0
@@ -162,63 +355,64 @@ class BleuScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      An array with one row per sentence containing the reference length, the output length,
+      the numerators of the n-gram precisions and the denominators of the n-gram precisions
     """
     if self.case_insensitive:
       ref = corpus_utils.lower(ref)
       out = corpus_utils.lower(out)
 
-    cached_stats = []
+    order = len(self.weights)
+    cached_stats = np.zeros( (len(ref), 2+2*order), dtype=int)
 
-    for r, o in zip(ref, out):
-      prec = []
-      for n in range(1, len(self.weights) + 1):
-        prec.append(self._precision(r, o, n))
-      cached_stats.append( (len(r), len(o), prec) )
+    for i, (r, o) in enumerate(zip(ref, out)):
+      # The closest reference length, preferring the shorter reference on ties
+      ref_len = min((abs(len(x)-len(o)), len(x)) for x in corpus_utils.sent_refs(r))[1]
+      cached_stats[i,0], cached_stats[i,1] = ref_len, len(o)
+      for n in range(1, order + 1):
+        cached_stats[i,1+n], cached_stats[i,1+order+n] = self._precision(r, o, n)
 
     return cached_stats
 
-  def score_cached_corpus(self, sent_ids, cached_stats):
+  def score_stats(self, stats):
     """
-    Score a corpus using BLEU score with cache
-
-    Args:
-      sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
-
-    Returns:
-      A tuple containing a single value for the BLEU score and a string summarizing auxiliary information
+    Calculate BLEU score from the summed statistics of cache_stats
     """
-    if len(cached_stats) == 0:
-      return 0.0, None
-
-    cached_ref_len, cached_out_len, cached_prec = zip(*cached_stats)
+    order = len(self.weights)
+    ref_len, out_len = stats[0], stats[1]
+    num_prec, denom_prec = stats[2:2+order], stats[2+order:2+2*order]
 
-    num_prec = Counter()
-    denom_prec = Counter()
-  
-    ref_len = 0
-    out_len = 0
-    for sent_id in sent_ids:
-      ref_len += cached_ref_len[sent_id]
-      out_len += cached_out_len[sent_id]
-      for n in range(1, len(self.weights) + 1):
-        num, denom = cached_prec[sent_id][n-1]
-        num_prec[n] += num
-        denom_prec[n] += denom
-
-    if num_prec[1] == 0:
-      return 0, None
+    if num_prec[0] == 0:
+      return 0
 
     prec = 0
-    for i, w in enumerate(self.weights, start=1):
-      p = num_prec[i] / denom_prec[i] if denom_prec[i] != 0 else 0
+    for w, num, denom in zip(self.weights, num_prec, denom_prec):
+      p = num / denom if denom != 0 else 0
       p = math.log(p) if p > 0 else 0
       prec += p * w 
     
     bp = min(1, math.exp(1 - ref_len/out_len)) if out_len != 0 else 0
 
-    return self.scale * bp * math.exp(prec), None
+    return self.scale * bp * math.exp(prec)
+
+  def score_stats_batch(self, stats):
+    order = len(self.weights)
+    stats = np.asarray(stats, dtype=float)
+    ref_len, out_len = stats[:,0], stats[:,1]
+    num_prec, denom_prec = stats[:,2:2+order], stats[:,2+order:2+2*order]
+
+    prec = np.zeros(len(stats))
+    for i, w in enumerate(self.weights):
+      p = np.divide(num_prec[:,i], denom_prec[:,i], out=np.zeros(len(stats)), where=denom_prec[:,i] != 0)
+      prec += np.log(p, out=np.zeros(len(stats)), where=p > 0) * w
+
+    bp = np.zeros(len(stats))
+    has_out = out_len != 0
+    bp[has_out] = np.minimum(1, np.exp(1 - ref_len[has_out]/out_len[has_out]))
+
+    scores = self.scale * bp * np.exp(prec)
+    scores[num_prec[:,0] == 0] = 0
+    return scores
 
   def name(self):
     return "BLEU"
@@ -230,6 +424,9 @@ class SentBleuScorer(SentenceFactoredScorer):
   """
   A scorer that calculates sentence-level smoothed BLEU score.
   """
+
+  multi_ref = True
+
   def __init__(self, case_insensitive=False):
     self.case_insensitive = case_insensitive
 
@@ -242,17 +439,19 @@ class SentBleuScorer(SentenceFactoredScorer):
     Score a single sentence with sentence-level smoothed BLEU score
 
     Args:
-      ref: A reference sentence
+      ref: A reference sentence, or a tuple of references
       out: An output sentence
 
     Returns:
       The sentence-level BLEU score, and None
     """
-    chencherry = nltk.translate.bleu_score.SmoothingFunction()
+    from nltk.translate import bleu_score as nltk_bleu
+    chencherry = nltk_bleu.SmoothingFunction()
+    refs = list(corpus_utils.sent_refs(ref))
     if self.case_insensitive:
-      bleu_score = nltk.translate.bleu_score.sentence_bleu([corpus_utils.lower(ref)], corpus_utils.lower(out), smoothing_function=chencherry.method2)
+      bleu_score = nltk_bleu.sentence_bleu(corpus_utils.lower(refs), corpus_utils.lower(out), smoothing_function=chencherry.method2)
     else:  
-      bleu_score = nltk.translate.bleu_score.sentence_bleu([ref], out, smoothing_function=chencherry.method2)
+      bleu_score = nltk_bleu.sentence_bleu(refs, out, smoothing_function=chencherry.method2)
     return self.scale * bleu_score, None
 
   def name(self):
@@ -265,6 +464,9 @@ class LengthScorer(Scorer):
   """
   A scorer that calculate the length ratio
   """
+
+  cacheable = True
+
   def score_corpus(self, ref, out):
     """
     Calculate the length ratio for a corpus
@@ -297,33 +499,53 @@ class LengthScorer(Scorer):
       return 0.0, f"ref={len(ref)}, out={len(out)}"
     return len(out) / len(ref), f"ref={len(ref)}, out={len(out)}"
 
-  def name(self):
-    return "length ratio"
-
-  def idstr(self):
-    return "lengthrat"
-
-class ExactMatchScorer(Scorer):
-  """
-  A scorer that calculates exact matches
-  """
-  def score_corpus(self, ref, out):
+  def cache_stats(self, ref, out):
     """
-    Calculate the percentage of exact matches in a corpus
+    Cache sufficient statistics for caculating the length ratio
 
     Args:
       ref: A reference corpus
       out: An output corpus
 
     Returns:
-      A tuple containing a single value for the exact match percentage and None
+      An array with the reference and output length of each sentence
     """
-    matches = 0
-    for r, o in zip(ref, out):
-      if r == o:
-        matches += 1
-    return float(matches) / len(ref), None
+    return np.array([(len(r), len(o)) for r, o in zip(ref, out)], dtype=int).reshape(-1, 2)
 
+  def score_stats(self, stats):
+    """
+    Calculate the length ratio from the summed reference and output lengths
+    """
+    return self.scale * stats[1] / stats[0] if stats[0] != 0 else 0.0
+
+  def score_stats_batch(self, stats):
+    stats = np.asarray(stats, dtype=float)
+    return self.scale * np.divide(stats[:,1], stats[:,0], out=np.zeros(len(stats)), where=stats[:,0] != 0)
+
+  def score_cached_corpus(self, sent_ids, cached_stats):
+    """
+    Calculate the length ratio with cache
+
+    Args:
+      sent_ids: The sentence ids for reference and output corpora
+      cached_stats: An array of cached statistics
+
+    Returns:
+      A tuple containing a single value for the length ratio and a string summarizing auxiliary information
+    """
+    ref_words, out_words = np.asarray(cached_stats)[np.asarray(sent_ids, dtype=int)].sum(0) if len(cached_stats) else (0, 0)
+    return self.score_stats([ref_words, out_words]), f'ref={ref_words}, out={out_words}'
+
+  def name(self):
+    return "length ratio"
+
+  def idstr(self):
+    return "lengthrat"
+
+class ExactMatchScorer(SentenceFactoredScorer):
+  """
+  A scorer that calculates exact matches
+  """
   def score_sentence(self, ref, out):
     """
     Score a single sentence by exact match
@@ -406,6 +628,9 @@ class SacreBleuScorer(Scorer):
   A scorer that computes BLEU on detokenized text.
 
   """
+
+  cacheable = True
+
   def __init__(self, smooth_method='exp', smooth_value=0, use_effective_order=False, case_insensitive=False):
     self.smooth_method = smooth_method
     self.smooth_value = smooth_value
@@ -421,8 +646,9 @@ class SacreBleuScorer(Scorer):
                               "Consider using SentenceBleuScorer (string sentbleu) instead.")
 
   def score_corpus(self, ref, out):
-    cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(range(len(ref)), cached_stats)
+    if len(ref) == 0:
+      return 0.0, None
+    return self.score_stats(self.cache_stats(ref, out).sum(0)), None
 
   def cache_stats(self, ref, out):
     """
@@ -433,8 +659,10 @@ class SacreBleuScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      An array with one row per sentence containing the n-gram match counts, the n-gram totals,
+      the output length and the reference length
     """
+    import sacrebleu
     if self.case_insensitive:
       ref = corpus_utils.lower(ref)
       out = corpus_utils.lower(out)
@@ -442,28 +670,18 @@ class SacreBleuScorer(Scorer):
     cached_stats = []
     for r, o in zip(ref, out):
       re = sacrebleu.corpus_bleu(" ".join(o), " ".join(r))
-      cached_stats.append( (re.counts, re.totals, re.sys_len, re.ref_len) )
+      cached_stats.append( list(re.counts) + list(re.totals) + [re.sys_len, re.ref_len] )
 
-    return cached_stats
+    return np.array(cached_stats, dtype=int).reshape(len(cached_stats), -1)
 
-  def score_cached_corpus(self, sent_ids, cached_stats):
+  def score_stats(self, stats):
     """
-    Score a corpus using SacreBLEU score with cache
-
-    Args:
-      sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
-
-    Returns:
-      A tuple containing a single value for the SacreBLEU score and a string summarizing auxiliary information
+    Calculate SacreBLEU score from the summed statistics of cache_stats
     """
-    if len(cached_stats) == 0:
-      return 0.0, None
-
-    counts, totals, sys_len, ref_len = zip(*cached_stats)
-    counts, totals, sys_len, ref_len = [np.sum(np.array(x)[sent_ids], 0) for x in [counts, totals, sys_len, ref_len]]
-
-    return sacrebleu.compute_bleu(counts, totals, sys_len, ref_len, smooth_method=self.smooth_method, smooth_value=self.smooth_value, use_effective_order=self.use_effective_order).score, None
+    import sacrebleu
+    order = (len(stats) - 2) // 2
+    counts, totals = [int(x) for x in stats[:order]], [int(x) for x in stats[order:2*order]]
+    return sacrebleu.compute_bleu(counts, totals, int(stats[-2]), int(stats[-1]), smooth_method=self.smooth_method, smooth_value=self.smooth_value, use_effective_order=self.use_effective_order).score
 
   def name(self):
     return "SacreBleuScorer"
@@ -472,27 +690,70 @@ class SacreBleuScorer(Scorer):
     return "sacrebleu"
 
 
-class ChrFScorer(Scorer):
+class ChrFScorer(SentenceFactoredScorer):
   """
   A scorer that calculates chrF (character n-gram F-score) score.
 
   This computes F2 score (beta=2.0 as per http://www.aclweb.org/anthology/W16-2341).
+  The corpus-level score is the average of the sentence-level scores, as in NLTK.
+  With multiple references, each sentence is scored against its best matching reference.
   """
-  def __init__(self, case_insensitive=False):
+
+  multi_ref = True
+
+  def __init__(self, case_insensitive=False, max_len=6, beta=2.0):
     self.case_insensitive = case_insensitive
+    self.max_len = max_len
+    self.beta = beta
 
   @property
   def scale(self):
     return global_scorer_scale
 
+  def _char_ngram_counts(self, sent):
+    """
+    Count the character n-grams of a sentence, ignoring whitespace
+
+    Args:
+      sent: A sentence
+
+    Returns:
+      A list containing a Counter of n-grams for each n-gram length
+    """
+    chars = re.sub(r"\s+", "", " ".join(sent))
+    return [Counter(chars[i:i+n] for i in range(len(chars)-n+1)) for n in range(1, self.max_len+1)]
+
+  def _fscore(self, ref_cnt, out_cnt, epsilon=1e-16):
+    tp = sum((ref_cnt & out_cnt).values())
+    tpfp, tpfn = sum(out_cnt.values()), sum(ref_cnt.values())
+    if tpfp == 0 or tpfn == 0:
+      return epsilon
+    prec, rec = tp / tpfp, tp / tpfn
+    factor = self.beta ** 2
+    if factor * prec + rec == 0:
+      return epsilon
+    return (1 + factor) * prec * rec / (factor * prec + rec)
+
   def chrf_score(self, refs, out):
-    return self.scale * nltk.translate.chrf_score.corpus_chrf(
-      [[" ".join(x) for x in ref] for ref in refs],
-      [" ".join(x) for x in out],
-      max_len=6,  # Order 6 n-grams
-      beta=2.0,  # F2 score
-      ignore_whitespace=True  # No whitespaces
-    )
+    """
+    Calculate the chrF score of a corpus
+
+    Args:
+      refs: A list containing a list of reference sentences for each output sentence
+      out: An output corpus
+
+    Returns:
+      The average of the sentence-level chrF scores
+    """
+    if len(out) == 0:
+      return 0.0
+    score_sum = 0.0
+    for sent_refs, out_sent in zip(refs, out):
+      out_cnts = self._char_ngram_counts(out_sent)
+      # The n-gram counts of each reference are computed once, then the best reference is used
+      score_sum += max(sum(self._fscore(r, o) for r, o in zip(self._char_ngram_counts(ref_sent), out_cnts)) / self.max_len
+                       for ref_sent in sent_refs)
+    return self.scale * score_sum / len(out)
 
   def score_corpus(self, ref, out):
     """
@@ -506,13 +767,13 @@ class ChrFScorer(Scorer):
       A tuple containing a single value for the ChrF score and a string summarizing auxiliary information
     """
     if self.case_insensitive:
-      chrf = self.chrf_score([[corpus_utils.lower(x)] for x in ref], corpus_utils.lower(out))
-    else:
-      chrf = self.chrf_score([[x] for x in ref], out)
-    return chrf, None
+      ref, out = corpus_utils.lower(ref), corpus_utils.lower(out)
+    return self.chrf_score([corpus_utils.sent_refs(x) for x in ref], out), None
 
   def score_sentence(self, ref, out):
-    return self.chrf_score([ref], [out]), None
+    if self.case_insensitive:
+      ref, out = corpus_utils.lower(ref), corpus_utils.lower(out)
+    return self.chrf_score([corpus_utils.sent_refs(ref)], [out]), None
 
   def name(self):
     return "ChrF"
@@ -527,14 +788,24 @@ class RougeScorer(SentenceFactoredScorer):
   def __init__(self, rouge_type, score_type='fmeasure', use_stemmer=False, case_insensitive=False):
     self.rouge_type = rouge_type
     self.score_type = score_type
-    self._stemmer = nltk.stem.porter.PorterStemmer() if use_stemmer else None
+    self.use_stemmer = use_stemmer
+    if use_stemmer:
+      from nltk.stem import porter
+      self._stemmer = porter.PorterStemmer()
+    else:
+      self._stemmer = None
     self.case_insensitive = case_insensitive
 
   @property
   def scale(self):
     return global_scorer_scale
+
+  def memo_key(self):
+    # The stemmer is determined by use_stemmer
+    return (type(self).__name__, self.scale, self.rouge_type, self.score_type, self.use_stemmer, self.case_insensitive)
   
   def score_sentence(self, ref, out):
+    from compare_mt.rouge import rouge_scorer
     if self.case_insensitive:
       ref = corpus_utils.lower(ref)
       out = corpus_utils.lower(out)
@@ -595,6 +866,9 @@ class WERScorer(Scorer):
   """
   A scorer that calculates Word Error Rate (WER).
   """
+
+  cacheable = True
+
   def __init__(self, sub_pen=1.0, ins_pen=1.0, del_pen=1.0, case_insensitive=False):
     self.sub_pen = 1.0
     self.ins_pen = 1.0
@@ -616,8 +890,9 @@ class WERScorer(Scorer):
     Returns:
       A tuple containing a single value for the WER and None
     """
-    cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(np.arange(len(ref)), cached_stats)
+    if len(ref) == 0:
+      return 0.0, None
+    return self.score_stats(self.cache_stats(ref, out).sum(0)), None
 
   def score_sentence(self, ref, out):
     return self.score_corpus([ref], [out])
@@ -631,34 +906,24 @@ class WERScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      An array with the reference length and the edit distance of each sentence
     """
-    cached_stats = []
+    cached_stats = np.zeros( (len(ref), 2) )
 
-    for r, o in zip(ref, out):
-      cached_stats.append( (len(r), self._edit_distance(r, o)) )
+    for i, (r, o) in enumerate(zip(ref, out)):
+      cached_stats[i] = (len(r), self._edit_distance(r, o))
 
     return cached_stats
 
-  def score_cached_corpus(self, sent_ids, cached_stats):
+  def score_stats(self, stats):
     """
-    Score a corpus with cache
-
-    Args:
-      sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
-
-    Returns:
-      A tuple containing a single value for the score and a string summarizing auxiliary information
+    Calculate WER from the summed reference lengths and edit distances
     """
-    if len(cached_stats) == 0:
-      return 0.0, None
+    return self.scale * stats[1] / stats[0] if stats[0] != 0 else 0
 
-    cached_ref_len, cached_edit_distance = zip(*cached_stats)
-    cached_ref_len, cached_edit_distance = np.array(cached_ref_len), np.array(cached_edit_distance)
-    denom = np.sum(cached_ref_len[sent_ids])
-    wer = np.sum(cached_edit_distance[sent_ids])/denom if denom != 0 else 0
-    return self.scale * wer, None
+  def score_stats_batch(self, stats):
+    stats = np.asarray(stats, dtype=float)
+    return self.scale * np.divide(stats[:,1], stats[:,0], out=np.zeros(len(stats)), where=stats[:,0] != 0)
 
   def _edit_distance(self, ref, out):
     if self.case_insensitive:
@@ -697,6 +962,9 @@ class METEORScorer(Scorer):
   """
   A scorer that calculates METEOR score.
   """
+
+  cacheable = True
+
   def __init__(self, meteor_directory, options=None):
     self.meteor_directory = meteor_directory
     self.options = options
@@ -717,8 +985,9 @@ class METEORScorer(Scorer):
     Returns:
       A tuple containing a single value for the METEOR score and a string summarizing auxiliary information
     """
-    cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(np.arange(len(ref)), cached_stats)
+    if len(ref) == 0:
+      return 0.0, None
+    return self.score_stats(self.cache_stats(ref, out).sum(0)), None
 
   def score_sentence(self, ref, out):
     return self.score_corpus([ref], [out])
@@ -732,7 +1001,8 @@ class METEORScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      An array with one row per sentence containing the statistics output by METEOR, followed by 1
+      if the sentence is a single chunk that matches entirely (which is subtracted from the chunk count)
     """
     with tempfile.TemporaryDirectory() as directory:
       ref_name = directory + '/ref'
@@ -752,42 +1022,23 @@ class METEORScorer(Scorer):
       stats = p.communicate()[0].decode("utf-8").split('\n')[:-1]
 
       for stat_str in stats:
-        stat = tuple(float(x) for x in stat_str.split())
-        cached_stats.append(stat)
-
-    return cached_stats
-
-  def score_cached_corpus(self, sent_ids, cached_stats):
+        stat = [float(x) for x in stat_str.split()]
+        # num_total_chunks = sum(num_sent_chunks) - minus_chunk
+        out_len = stat[0]
+        ref_len = stat[1]
+        out_total_match = stat[4] + stat[6] + stat[8] + stat[10] + stat[12] + stat[14] + stat[16] + stat[18]
+        ref_total_match = stat[5] + stat[7] + stat[9] + stat[11] + stat[13] + stat[15] + stat[17] + stat[19]
+        minus_chunk = 1.0 if out_len == out_total_match and ref_len == ref_total_match and stat[-3] == 1 else 0.0
+        cached_stats.append(stat + [minus_chunk])
+
+    return np.array(cached_stats)
+
+  def score_stats(self, stats):
     """
-    Score a corpus using METEOR score with cache
-
-    Args:
-      sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
-
-    Returns:
-      A tuple containing a single value for the METEOR score and a string summarizing auxiliary information
+    Calculate METEOR score from the summed statistics of cache_stats
     """
-    if len(cached_stats) == 0:
-      return 0.0, None
-
-    cached_stats = np.array(cached_stats)
-
-    # compute sufficient statistics
-    sent_stats = cached_stats[sent_ids]
-
-    # num_total_chunks = sum(num_sent_chunks) - minus_chunk
-    minus_chunk = 0
-    for stat in sent_stats:
-      out_len = stat[0]
-      ref_len = stat[1]
-      out_total_match = stat[4] + stat[6] + stat[8] + stat[10] + stat[12] + stat[14] + stat[16] + stat[18]
-      ref_total_match = stat[5] + stat[7] + stat[9] + stat[11] + stat[13] + stat[15] + stat[17] + stat[19]
-      if out_len == out_total_match and ref_len == ref_total_match and stat[-3] == 1:
-        minus_chunk += 1
-
-    cal_stats = np.sum(sent_stats, 0)
-    cal_stats[20] -= minus_chunk
+    cal_stats = np.array(stats[:-1], dtype=float)
+    cal_stats[20] -= stats[-1]
 
     # rename
     alpha, beta, gamma, delta = self.parameters
@@ -821,7 +1072,7 @@ class METEORScorer(Scorer):
 
     score = fmean * (1.0-frag_penalty)
 
-    return self.scale * score, None
+    return self.scale * score
 
   def _get_weights_and_parameters(self, options):
     if self.options is None:
@@ -855,6 +1106,69 @@ class METEORScorer(Scorer):
   def idstr(self):
     return "meteor"
 
+# Factories for the scorers that can be created from a profile string. Each factory takes the keyword arguments
+# case_insensitive, meteor_directory and options, and returns a scorer.
+_scorer_factories = {}
+
+# Entry point group through which other packages can provide scorers
+scorer_entry_point_group = 'compare_mt.scorers'
+
+def register_scorer(profile, factory):
+  """
+  Register a scorer so that it can be created with create_scorer_from_profile
+
+  Args:
+    profile: The profile string that selects the scorer
+    factory: A callable taking the keyword arguments case_insensitive, meteor_directory and options,
+             and returning a scorer
+  """
+  _scorer_factories[profile] = factory
+
+def _load_entry_point_factory(profile):
+  """
+  Look for a scorer factory registered by another package under the "compare_mt.scorers" entry point group
+
+  Args:
+    profile: The profile string, which should be equal to the name of the entry point
+
+  Returns:
+    The loaded factory, or None if no entry point exists for the profile
+  """
+  try:
+    from importlib.metadata import entry_points
+  except ImportError:
+    return None
+  eps = entry_points()
+  if hasattr(eps, 'select'):
+    eps = eps.select(group=scorer_entry_point_group)
+  else:
+    eps = eps.get(scorer_entry_point_group, [])
+  for ep in eps:
+    if ep.name == profile:
+      return ep.load()
+  return None
+
+def _create_meteor_scorer(case_insensitive=False, meteor_directory=None, options=None):
+  if meteor_directory == None:
+    raise ValueError("Must specify the directory of the METEOR source code.")
+  return METEORScorer(meteor_directory=meteor_directory, options=options)
+
+def _create_rouge_scorer_factory(rouge_type):
+  return lambda case_insensitive=False, **kwargs: RougeScorer(rouge_type=rouge_type, case_insensitive=case_insensitive)
+
+register_scorer('bleu', lambda case_insensitive=False, **kwargs: BleuScorer(case_insensitive=case_insensitive))
+register_scorer('sacrebleu', lambda case_insensitive=False, **kwargs: SacreBleuScorer(case_insensitive=case_insensitive))
+register_scorer('sentbleu', lambda case_insensitive=False, **kwargs: SentBleuScorer(case_insensitive=case_insensitive))
+register_scorer('length', lambda **kwargs: LengthScorer())
+register_scorer('ribes', lambda case_insensitive=False, **kwargs: RibesScorer(case_insensitive=case_insensitive))
+register_scorer('chrf', lambda case_insensitive=False, **kwargs: ChrFScorer(case_insensitive=case_insensitive))
+for _rouge_suffix in '0123456789L':
+  for _rouge_type in (f'rouge{_rouge_suffix}', f'rouge{_rouge_suffix}sum'):
+    register_scorer(_rouge_type, _create_rouge_scorer_factory(_rouge_type))
+register_scorer('wer', lambda case_insensitive=False, **kwargs: WERScorer(case_insensitive=case_insensitive))
+register_scorer('meteor', _create_meteor_scorer)
+register_scorer('exact', lambda **kwargs: ExactMatchScorer())
+
 def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory=None, options=None):
   """
   Create a scorer from a profile string
@@ -865,27 +1179,10 @@ def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory
   Returns:
     A scorer to perform the appropriate scoring
   """
-  if profile == 'bleu':
-    return BleuScorer(case_insensitive=case_insensitive)
-  if profile == 'sacrebleu':
-    return SacreBleuScorer(case_insensitive=case_insensitive)
-  elif profile == 'sentbleu':
-    return SentBleuScorer(case_insensitive=case_insensitive)
-  elif profile == 'length':
-    return LengthScorer()
-  elif profile == 'ribes':
-    return RibesScorer(case_insensitive=case_insensitive)
-  elif profile == 'chrf':
-    return ChrFScorer(case_insensitive=case_insensitive)
-  elif re.match(r"rouge[0-9L](sum)?$", profile):
-    return RougeScorer(rouge_type=profile, case_insensitive=case_insensitive)
-  elif profile == 'wer':
-    return WERScorer(case_insensitive=case_insensitive)
-  elif profile == 'meteor':
-    if meteor_directory == None:
-      raise ValueError("Must specify the directory of the METEOR source code.")
-    return METEORScorer(meteor_directory=meteor_directory, options=options)
-  elif profile == 'exact':
-    return ExactMatchScorer()
-  else:
-    raise ValueError(f'Invalid profile for scorer {profile}'.format(profile=profile))
+  factory = _scorer_factories.get(profile)
+  if factory is None:
+    factory = _load_entry_point_factory(profile)
+    if factory is None:
+      raise ValueError(f'Invalid profile for scorer {profile}')
+    register_scorer(profile, factory)
+  return factory(case_insensitive=case_insensitive, meteor_directory=meteor_directory, options=options)
@@ -10,75 +10,394 @@
 #                                                                                      #
 ########################################################################################
 
+import multiprocessing
 import numpy as np
+from collections import OrderedDict
 
 
+# The maximum number of elements in the count matrices built at once, to bound memory use
+max_count_matrix_size = 2**24
+# Number of samples drawn from each random stream when sampling in parallel. This is fixed so that the
+# samples only depend on the seed, and not on the number of workers.
+parallel_block_size = 100
+# The number of samples drawn at a time by the adaptive bootstrap, and the z-value of the confidence interval
+# of the win probability that is used to decide when to stop
+adaptive_block_size = 100
+adaptive_confidence_z = 2.576
+# Global variable controlling the number of worker processes used for resampling (None to sample serially)
+global_num_workers = None
+
+def _ids_to_counts(ids, n):
+  """
+  Convert a (num_samples, sample_size) matrix of sentence ids into float counts of shape (num_samples, n)
+  """
+  block = len(ids)
+  # Offset the ids of each sample so that a single bincount counts all samples
+  ids = ids + np.arange(block).reshape(block, 1) * n
+  return np.bincount(ids.ravel(), minlength=block*n).reshape(block, n).astype(float)
+
+class ResamplePlan(object):
+  """
+  A plan of bootstrap samples that is shared by all analyses in a run.
+  It consists of uniformly distributed 32-bit integers, where row i is used for the i-th sample of every bootstrap.
+  These are scaled to sentence ids of a corpus of any size, so the same plan is used both for whole corpora and
+  for subsets such as buckets. The plan is generated in tiles, each with a random stream spawned from the seed
+  by its position. Each tile is generated once, and the plan does not depend on the order in which it is used.
+  """
+  # The number of samples and sentences in a tile of the plan
+  tile_rows = 100
+  tile_cols = 1024
+  # The maximum number of tiles kept in memory, least recently used tiles are generated again when needed
+  max_cached_tiles = 256
+
+  def __init__(self, seed=None):
+    """
+    Args:
+      seed: The seed of the plan, or None for a random plan
+    """
+    self.entropy = seed if seed is not None else np.random.SeedSequence().entropy
+    self.tiles = OrderedDict()
+
+  def __getstate__(self):
+    # Tiles are regenerated when needed rather than sent to other processes
+    return {'entropy': self.entropy, 'tiles': OrderedDict()}
+
+  def _tile(self, r, c):
+    if (r, c) in self.tiles:
+      self.tiles.move_to_end((r, c))
+    else:
+      rng = np.random.default_rng(np.random.SeedSequence(self.entropy, spawn_key=(r, c)))
+      self.tiles[r, c] = rng.integers(0, 2**32, size=(self.tile_rows, self.tile_cols), dtype=np.uint32)
+      if len(self.tiles) > self.max_cached_tiles:
+        self.tiles.popitem(last=False)
+    return self.tiles[r, c]
+
+  def sample_ids(self, n, sample_size, start, end):
+    """
+    Get the sentence ids of a range of samples
+
+    Args:
+      n: The number of sentences
+      sample_size: The number of sentences in each sample
+      start: The first sample
+      end: The sample after the last one
+
+    Returns:
+      An array of sentence ids of shape (end-start, sample_size)
+    """
+    if n == 0 or sample_size == 0 or end <= start:
+      return np.zeros((max(end-start, 0), sample_size), dtype=int)
+    # Copy only the requested rows and columns of each tile
+    draws = np.empty((end-start, sample_size), dtype=np.uint32)
+    for r in range(start // self.tile_rows, (end-1) // self.tile_rows + 1):
+      row_start, row_end = max(start, r*self.tile_rows), min(end, (r+1)*self.tile_rows)
+      for c in range((sample_size-1) // self.tile_cols + 1):
+        col_start, col_end = c*self.tile_cols, min(sample_size, (c+1)*self.tile_cols)
+        draws[row_start-start:row_end-start, col_start:col_end] = \
+          self._tile(r, c)[row_start-r*self.tile_rows:row_end-r*self.tile_rows, :col_end-col_start]
+    return ((draws.astype(np.uint64) * np.uint64(n)) >> np.uint64(32)).astype(int)
+
+# Global variable containing the resample plan of the run (None to draw samples from numpy's global random state)
+global_resample_plan = None
+
+def sample_ids(n, sample_size, start, num_samples):
+  """
+  Get the sentence ids of bootstrap samples from global_resample_plan, or draw them with np.random.choice if there is
+  no plan. In this case, the samples continue the stream of numpy's global random state and start is ignored.
+
+  Args:
+    n: The number of sentences
+    sample_size: The number of sentences in each sample
+    start: The index of the first sample
+    num_samples: The number of samples
+
+  Returns:
+    An array of sentence ids of shape (num_samples, sample_size)
+  """
+  if global_resample_plan is not None:
+    return global_resample_plan.sample_ids(n, sample_size, start, start+num_samples)
+  if n == 0:
+    return np.zeros((num_samples, sample_size), dtype=int)
+  return np.random.choice(n, size=(num_samples, sample_size), replace=True)
+
+def sample_count_matrices(n, sample_size, num_samples, start=0):
+  """
+  Draw bootstrap samples and convert them into matrices counting how often each sentence was drawn.
+  Without a resample plan, the samples are the same as those drawn one by one with np.random.choice.
+
+  Args:
+    n: The number of sentences
+    sample_size: The number of sentences in each sample
+    num_samples: The number of samples
+    start: The index of the first sample in the resample plan
+
+  Returns:
+    An iterator over float count matrices of shape (block_size, n), which together have num_samples rows
+  """
+  block_size = max(1, min(max_count_matrix_size // max(n, 1), max_count_matrix_size // max(sample_size, 1)))
+  for block_start in range(0, num_samples, block_size):
+    block = min(block_size, num_samples - block_start)
+    yield _ids_to_counts(sample_ids(n, sample_size, start + block_start, block), n)
+
+# The function and data used by each worker process, set once when the worker starts
+_worker_func = None
+_worker_args = None
+
+def _init_worker(func, args):
+  global _worker_func, _worker_args
+  _worker_func, _worker_args = func, args
+
+def _run_sample_block(task):
+  source, n, sample_size, start, block = task
+  if isinstance(source, ResamplePlan):
+    ids = source.sample_ids(n, sample_size, start, start+block)
+  else:
+    rng = np.random.default_rng(source)
+    ids = rng.integers(0, n, size=(block, sample_size)) if n else np.zeros((block, 0), dtype=int)
+  return _worker_func(_ids_to_counts(ids, n), *_worker_args)
+
+def start_worker_pool(func, args, num_workers):
+  """
+  Start a pool of worker processes that can be used by several calls to map_sample_blocks with the same func and args.
+  The caller is responsible for closing it.
+
+  Args:
+    func: The function called by the workers
+    args: Additional arguments of func, which are sent to each worker once
+    num_workers: The number of worker processes
+
+  Returns:
+    A multiprocessing pool
+  """
+  return multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(func, args))
+
+def map_sample_blocks(func, args, n, sample_size, num_samples, num_workers, start=0, pool=None):
+  """
+  Draw bootstrap samples in fixed-size blocks and process them with a pool of worker processes.
+  The samples are taken from global_resample_plan. If there is no plan, each block uses its own random stream
+  spawned with a SeedSequence from the global numpy random state. Either way, the results are the same for a
+  given seed regardless of the number of workers.
+
+  Args:
+    func: A module-level function called as func(counts, *args), where counts is a float matrix of shape
+          (block_size, n) counting how often each sentence was drawn. It returns an array with one row per sample.
+    args: Additional arguments of func. These are sent to each worker once, not once per block.
+    n: The number of sentences
+    sample_size: The number of sentences in each sample
+    num_samples: The number of samples
+    num_workers: The number of worker processes (1 to process all blocks in this process)
+    start: The index of the first sample in the resample plan
+    pool: A pool started by start_worker_pool with the same func and args. If None, a pool is started for this call.
+
+  Returns:
+    The results of func for all blocks, concatenated in order
+  """
+  num_blocks = (num_samples + parallel_block_size - 1) // parallel_block_size
+  if global_resample_plan is not None:
+    sources = [global_resample_plan] * num_blocks
+  else:
+    entropy = np.random.randint(2**32, size=4, dtype=np.uint64)
+    sources = np.random.SeedSequence([int(x) for x in entropy]).spawn(num_blocks)
+  tasks = [(source, n, sample_size, start + i*parallel_block_size, min(parallel_block_size, num_samples - i*parallel_block_size))
+           for i, source in enumerate(sources)]
+  if pool is not None:
+    results = pool.map(_run_sample_block, tasks)
+  elif num_workers == 1:
+    _init_worker(func, args)
+    try:
+      results = [_run_sample_block(task) for task in tasks]
+    finally:
+      _init_worker(None, None)
+  else:
+    with start_worker_pool(func, args, num_workers) as pool:
+      results = pool.map(_run_sample_block, tasks)
+  return np.concatenate(results)
+
+def _score_samples(counts, scorer, cache_stats):
+  """
+  Score the samples given by a count matrix for each system, returning an array of shape (num_samples, num_systems)
+  """
+  return np.stack([scorer.score_stats_batch(counts @ cache_stat) for cache_stat in cache_stats], axis=1)
+
+def _win_ratio_decided(sys_scores, compare_directions, prob_thresh):
+  """
+  Check whether the bootstrap samples so far give a clear decision for every compare direction, i.e. whether the
+  Wilson confidence interval of the probability that the better system loses is entirely below or above prob_thresh.
+  """
+  num_samples = len(sys_scores)
+  z2 = adaptive_confidence_z ** 2
+  for left, right in compare_directions:
+    left_wins = np.mean(sys_scores[:,left] > sys_scores[:,right])
+    right_wins = np.mean(sys_scores[:,left] < sys_scores[:,right])
+    # The fraction of samples in which the better system does not win
+    p = 1 - max(left_wins, right_wins)
+    center = (p + z2 / (2*num_samples)) / (1 + z2 / num_samples)
+    margin = adaptive_confidence_z / (1 + z2 / num_samples) * np.sqrt(p * (1-p) / num_samples + z2 / (4*num_samples**2))
+    if center - margin < prob_thresh < center + margin:
+      return False
+  return True
+
 def eval_with_paired_bootstrap(ref, outs,
                                scorer,
                                compare_directions=[(0, 1)],
                                num_samples=1000, sample_ratio=0.5,
-                               cache_stats=None):
+                               cache_stats=None,
+                               num_workers=None,
+                               adaptive_thresh=None):
   """
   Evaluate with paired boostrap.
   This compares several systems, performing a signifiance tests with
   paired bootstrap resampling to compare the accuracy of the specified systems.
+  If the scorer has additive sufficient statistics, all samples of all systems are scored in batch.
 
   Args:
     ref: The correct labels
     outs: The output of systems
     scorer: The scorer
     compare_directions: A string specifying which two systems to compare
-    num_samples: The number of bootstrap samples to take
+    num_samples: The number of bootstrap samples to take (the maximum number if adaptive_thresh is set)
     sample_ratio: The ratio of samples to take every time
     cache_stats: The precomputed statistics
+    num_workers: The number of processes used to score samples in parallel, which requires cached statistics.
+                 If None, global_num_workers is used, and if that is also None the samples are scored serially.
+    adaptive_thresh: If set, samples are drawn in blocks of adaptive_block_size, and sampling stops as soon as
+                     it is clear whether the win ratio of every compare direction is significant at this p-value.
 
   Returns:
-    A tuple containing the win ratios, statistics for systems
+    A tuple containing the win ratios, statistics for systems.
+    The statistics for each system also contain the number of samples that were actually taken.
   """
-  sys_scores = [[] for _ in outs] 
-  wins = [[0, 0, 0] for _ in compare_directions] if compare_directions is not None else None
   n = len(ref)
-  ids = list(range(n))
+  sample_size = int(n*sample_ratio)
+  if num_workers is None:
+    num_workers = global_num_workers
 
   if cache_stats is None:
     cache_stats = [scorer.cache_stats(ref, out) for out in outs] 
-  sample_size = int(n*sample_ratio)
-  for _ in range(num_samples):
-    # Subsample the gold and system outputs (with replacement)
-    reduced_ids = np.random.choice(ids, size=sample_size, replace=True)
-    # Calculate accuracy on the reduced sample and save stats
-    if cache_stats[0]:
-      sys_score, _ = zip(*[scorer.score_cached_corpus(reduced_ids, cache_stat) for cache_stat in cache_stats])
+  if cache_stats[0] is not None:
+    cache_stats = [np.asarray(x, dtype=float) for x in cache_stats]
+
+  def draw_scores(start, num):
+    """
+    Draw num samples starting from sample start, and return an array where element [i,j] is the score of system j
+    on sample i
+    """
+    if cache_stats[0] is not None:
+      if num_workers:
+        return map_sample_blocks(_score_samples, (scorer, cache_stats), n, sample_size, num, num_workers, start=start,
+                                 pool=pool)
+      return np.concatenate([_score_samples(counts, scorer, cache_stats)
+                             for counts in sample_count_matrices(n, sample_size, num, start=start)])
+    scores = np.zeros( (num, len(outs)) )
+    # The ids of several samples are drawn at once, so that the resample plan generates each tile once per block
+    block_size = max(1, max_count_matrix_size // max(sample_size, 1))
+    for block_start in range(0, num, block_size):
+      block_ids = sample_ids(n, sample_size, start+block_start, min(block_size, num-block_start))
+      for i, reduced_ids in enumerate(block_ids, start=block_start):
+        # Subsample the gold and system outputs (with replacement)
+        reduced_ref = [ref[k] for k in reduced_ids]
+        reduced_outs = [[out[k] for k in reduced_ids] for out in outs]
+        scores[i], _ = zip(*[scorer.score_corpus(reduced_ref, reduced_out) for reduced_out in reduced_outs])
+    return scores
+
+  # The adaptive bootstrap draws many blocks, so the workers are started once and used for all of them
+  pool = None
+  if cache_stats[0] is not None and num_workers and num_workers != 1:
+    pool = start_worker_pool(_score_samples, (scorer, cache_stats), num_workers)
+  try:
+    if adaptive_thresh is None or compare_directions is None:
+      sys_scores = draw_scores(0, num_samples)
     else:
-      reduced_ref = [ref[i] for i in reduced_ids]
-      reduced_outs = [[out[i] for i in reduced_ids] for out in outs]
-      sys_score, _ = zip(*[scorer.score_corpus(reduced_ref, reduced_out) for reduced_out in reduced_outs])
-
-    if wins is not None:
-      for i, compare_direction in enumerate(compare_directions): 
-        left, right = compare_direction
-        if sys_score[left] > sys_score[right]:
-          wins[i][0] += 1
-        if sys_score[left] < sys_score[right]:
-          wins[i][1] += 1
-        else:
-          wins[i][2] += 1
-    
-    for i in range(len(outs)): 
-      sys_scores[i].append(sys_score[i])
-
-  # Print win stats
-  wins = [[x/float(num_samples) for x in win] for win in wins] if wins is not None else None
-
-  # Print system stats
+      sys_scores = draw_scores(0, min(adaptive_block_size, num_samples))
+      while len(sys_scores) < num_samples and not _win_ratio_decided(sys_scores, compare_directions, adaptive_thresh):
+        sys_scores = np.concatenate([sys_scores, draw_scores(len(sys_scores), min(adaptive_block_size, num_samples - len(sys_scores)))])
+  finally:
+    if pool is not None:
+      pool.terminate()
+  num_samples = len(sys_scores)
+
+  # Win stats
+  wins = None
+  if compare_directions is not None:
+    wins = []
+    for left, right in compare_directions:
+      left_scores, right_scores = sys_scores[:,left], sys_scores[:,right]
+      wins.append([float(np.mean(left_scores > right_scores)),
+                   float(np.mean(left_scores < right_scores)),
+                   float(np.mean(left_scores == right_scores))])
+
+  # System stats
+  sys_scores.sort(axis=0)
   sys_stats = []
   for i in range(len(outs)): 
-    sys_scores[i].sort()
     sys_stats.append({
-      'mean':np.mean(sys_scores[i]),
-      'median':np.median(sys_scores[i]),
-      'lower_bound':sys_scores[i][int(num_samples * 0.025)],
-      'upper_bound':sys_scores[i][int(num_samples * 0.975)]
+      'mean':np.mean(sys_scores[:,i]),
+      'median':np.median(sys_scores[:,i]),
+      'lower_bound':sys_scores[int(num_samples * 0.025),i],
+      'upper_bound':sys_scores[int(num_samples * 0.975),i],
+      'num_samples':num_samples
     })
  
   return wins, sys_stats
+
+def eval_with_approx_randomization(ref, outs,
+                                   scorer,
+                                   compare_directions=[(0, 1)],
+                                   num_samples=10000,
+                                   cache_stats=None):
+  """
+  Evaluate with approximate randomization.
+  For each pair of systems, this randomly swaps the outputs of the two systems for each sentence, and calculates
+  how often the difference between the scores of the shuffled outputs is at least as large as the actual difference.
+  If the scorer has additive sufficient statistics, the swaps of all samples are represented by a single boolean
+  matrix (built in blocks to bound memory use) and scored in batch.
+
+  See, e.g. the following paper for references
+
+  On Some Pitfalls in Automatic Evaluation and Significance Testing for MT
+  Stefan Riezler and John T. Maxwell III
+  https://www.aclweb.org/anthology/W05-0908
+
+  Args:
+    ref: The correct labels
+    outs: The output of systems
+    scorer: The scorer
+    compare_directions: A list of pairs of systems to compare
+    num_samples: The number of random shuffles
+    cache_stats: The precomputed statistics
+
+  Returns:
+    A list containing the p-value of each compare direction
+  """
+  n = len(ref)
+  if cache_stats is None:
+    cache_stats = [scorer.cache_stats(ref, out) for out in outs]
+  # The number of shuffles in which the score difference is at least the actual difference
+  num_extreme = np.zeros(len(compare_directions), dtype=int)
+
+  if cache_stats[0] is not None:
+    cache_stats = [np.asarray(x, dtype=float) for x in cache_stats]
+    totals = [x.sum(0) for x in cache_stats]
+    observed = [abs(np.subtract(*scorer.score_stats_batch(np.stack([totals[left], totals[right]]))))
+                for left, right in compare_directions]
+    block_size = max(1, max_count_matrix_size // max(n, 1))
+    for start in range(0, num_samples, block_size):
+      block = min(block_size, num_samples - start)
+      # swaps[i,j] is True if the outputs for sentence j are swapped in sample i
+      swaps = np.random.randint(2, size=(block, n)).astype(float)
+      for di, (left, right) in enumerate(compare_directions):
+        delta = swaps @ (cache_stats[right] - cache_stats[left])
+        left_scores = scorer.score_stats_batch(totals[left] + delta)
+        right_scores = scorer.score_stats_batch(totals[right] - delta)
+        num_extreme[di] += np.sum(np.abs(left_scores - right_scores) >= observed[di])
+  else:
+    for di, (left, right) in enumerate(compare_directions):
+      observed = abs(scorer.score_corpus(ref, outs[left])[0] - scorer.score_corpus(ref, outs[right])[0])
+      for _ in range(num_samples):
+        swaps = np.random.randint(2, size=n)
+        shuffled_left = [r if s else l for l, r, s in zip(outs[left], outs[right], swaps)]
+        shuffled_right = [l if s else r for l, r, s in zip(outs[left], outs[right], swaps)]
+        diff = abs(scorer.score_corpus(ref, shuffled_left)[0] - scorer.score_corpus(ref, shuffled_right)[0])
+        num_extreme[di] += diff >= observed
+
+  return [float(x + 1) / (num_samples + 1) for x in num_extreme]
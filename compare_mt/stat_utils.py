@@ -1,3 +1,5 @@
+import heapq
+import numpy as np
 
 def extract_salient_features(dict1, dict2, alpha=1.0):
   """
@@ -15,4 +17,81 @@ def extract_salient_features(dict1, dict2, alpha=1.0):
   scores = {}
   for k in all_keys:
     scores[k] = (dict1[k]+alpha) / (dict1[k] + dict2[k] + 2*alpha)
-  return scores
\ No newline at end of file
+  return scores
+
+def top_k_candidates(scores, k):
+  """
+  Find the indices of the k largest scores, and any other scores tied with the k-th largest one,
+  in time linear in the number of scores.
+
+  Args:
+    scores: A one-dimensional array of scores
+    k: The number of largest scores to find
+
+  Returns:
+    An array with the indices of the candidates in ascending order
+  """
+  scores = np.asarray(scores)
+  if k >= len(scores):
+    return np.arange(len(scores))
+  if k <= 0:
+    return np.arange(0)
+  kth_score = np.partition(scores, len(scores)-k)[len(scores)-k]
+  return np.nonzero(scores >= kth_score)[0]
+
+def top_k_indices(scores, k):
+  """
+  Find the indices of the k largest scores without sorting all of the scores.
+
+  Args:
+    scores: A one-dimensional array of scores
+    k: The number of indices to return
+
+  Returns:
+    An array with the indices of the k largest scores from largest to smallest, where ties are broken by the index
+  """
+  scores = np.asarray(scores)
+  candidates = top_k_candidates(scores, k)
+  return candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+
+class _ReverseOrder(object):
+  def __init__(self, item):
+    self.item = item
+
+  def __lt__(self, other):
+    return other.item < self.item
+
+class TopKHeap(object):
+  """
+  Keep the k largest (or smallest) items of a stream in a bounded heap, so memory is proportional to k
+  and each item is added in O(log k) time.
+  """
+  def __init__(self, k, largest=True):
+    self.k = k
+    self.largest = largest
+    self.heap = []
+
+  def push(self, item):
+    """
+    Add an item to the heap if it is among the k largest (or smallest) items so far
+
+    Args:
+      item: The item, which must be comparable with the other items
+
+    Returns:
+      A tuple of whether the item was kept, and the item that was removed from the heap to make space, or None
+    """
+    entry = item if self.largest else _ReverseOrder(item)
+    if len(self.heap) < self.k:
+      heapq.heappush(self.heap, entry)
+      return True, None
+    if self.k > 0 and self.heap[0] < entry:
+      removed = heapq.heapreplace(self.heap, entry)
+      return True, removed if self.largest else removed.item
+    return False, None
+
+  def items(self):
+    """
+    Get the items in the heap in ascending order
+    """
+    return sorted(x if self.largest else x.item for x in self.heap)
@@ -0,0 +1,330 @@
+import os.path
+import unittest
+import numpy as np
+import sys
+from collections import Counter
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import bucketers
+from compare_mt import scorers
+from compare_mt import compare_mt_main
+from compare_mt import corpus_utils
+from compare_mt.corpus_utils import load_tokens, load_alignments, load_nums
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref_file = os.path.join(example_path, "ted.ref.eng")
+  out1_file = os.path.join(example_path, "ted.sys1.eng")
+  out2_file = os.path.join(example_path, "ted.sys2.eng")
+  return [load_tokens(x) for x in (ref_file, out1_file, out2_file)]
+
+
+class TestBucketDetails(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.outs = ref[:300], [out1[:300], out2[:300]]
+    self.bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+
+  def test_rec_prec_fmeas_arrays(self):
+    counts = [(0, 0, 0), (0, 3, 2), (2, 3, 4), (3, 3, 2), (2, 2, 0), (5, 7, 5)]
+    rec, prec, fmeas = bucketers._calc_rec_prec_fmeas_arrays(*zip(*counts))
+    for i, (mcnt, ocnt, rcnt) in enumerate(counts):
+      self.assertEqual((rec[i], prec[i], fmeas[i]), bucketers._calc_rec_prec_fmeas(mcnt, ocnt, rcnt))
+
+  def test_statistics_arrays(self):
+    statistics, my_ref_totals, my_out_totals, my_out_matches = self.bucketer.calc_statistics(self.ref, self.outs)
+    num_buckets = len(self.bucketer.bucket_strs)
+    self.assertEqual(my_ref_totals.shape, (300, num_buckets))
+    self.assertEqual(my_out_totals.shape, (300, 2, num_buckets))
+    self.assertEqual(my_out_matches.dtype, np.int32)
+    for oi, ostatistics in enumerate(statistics):
+      self.assertEqual([x[:3] for x in ostatistics],
+                       list(zip(my_out_matches[:,oi].sum(0), my_ref_totals.sum(0), my_out_totals[:,oi].sum(0))))
+
+  def test_intervals(self):
+    _, my_ref_total_list, my_out_totals_list, my_out_matches_list = self.bucketer.calc_statistics(self.ref, self.outs)
+    np.random.seed(1)
+    ref_total, intervals = self.bucketer.calc_bucket_details(my_ref_total_list, my_out_totals_list, my_out_matches_list,
+                                                             num_samples=200)
+    self.assertEqual(list(ref_total), list(np.sum(my_ref_total_list, 0)))
+    self.assertEqual(len(intervals), 2)
+    for bounds in intervals[0]:
+      self.assertEqual(bounds[:3], [None, None, None])
+      for lower, upper in bounds[3:]:
+        self.assertTrue(0.0 <= lower <= upper <= 1.0)
+
+
+class TestBucketLookup(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, _, _ = _get_example_data()
+    self.words = [w for sent in ref[:100] for w in sent]
+
+  def test_word_buckets(self):
+    freq_data = [[w.lower() for w in self.words[:500]]]
+    for bucketer in (bucketers.FreqWordBucketer(freq_data=freq_data),
+                     bucketers.FreqWordBucketer(freq_data=freq_data, case_insensitive=True),
+                     bucketers.CaseWordBucketer()):
+      buckets = bucketer.calc_buckets(bucketer.token_ids(self.words))
+      self.assertEqual(list(buckets), [bucketer.calc_bucket(w) for w in self.words])
+
+  def test_label_buckets(self):
+    labels = ['NN', 'DT', 'NN', 'VB', 'JJ']
+    bucketer = bucketers.LabelWordBucketer(label_set='NN+VB')
+    self.assertEqual(list(bucketer.calc_buckets(None, bucketer.label_ids(labels))), [0, 2, 0, 1, 2])
+    labels = ['0.1', '0.5', '0.75', '1.0', '0.3']
+    bucketer = bucketers.NumericalLabelWordBucketer()
+    self.assertEqual(list(bucketer.calc_buckets(None, bucketer.label_ids(labels))),
+                     [bucketer.calc_bucket(None, label=l) for l in labels])
+    with self.assertRaises(ValueError):
+      bucketer.calc_buckets(bucketer.token_ids(['a', 'b']))
+
+
+class TestBucketedLikelihoods(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    example_path = os.path.join(compare_mt_root, "example")
+    self.ref = load_tokens(os.path.join(example_path, "ll_test.txt"))
+    self.lls = [load_nums(os.path.join(example_path, x)) for x in ("ll_test.sys1.likelihood", "ll_test.sys2.likelihood")]
+
+  def test_likelihood_stats(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    sums, counts, variances = bucketer.calc_bucketed_likelihood_stats(self.ref, self.lls)
+    buckets = [bucketer.calc_bucket(w) for sent in self.ref for w in sent]
+    for si, lls in enumerate(self.lls):
+      flat_lls = [l for sent in lls for l in sent]
+      for bi in range(len(bucketer.bucket_strs)):
+        bucket_lls = [l for l, b in zip(flat_lls, buckets) if b == bi]
+        self.assertEqual(counts[bi], len(bucket_lls))
+        self.assertAlmostEqual(sums[si,bi], sum(bucket_lls))
+        if bucket_lls:
+          self.assertAlmostEqual(variances[si,bi], np.var(bucket_lls))
+        else:
+          self.assertTrue(np.isnan(variances[si,bi]))
+      averages = list(bucketer.calc_bucketed_likelihoods(self.ref, lls))
+      self.assertEqual([x == "NA" for x in averages], [c == 0 for c in counts])
+    with self.assertRaises(ValueError):
+      bucketer.calc_bucketed_likelihood_stats(self.ref, [self.lls[0][:-1]])
+
+
+class TestCorpusMatches(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.outs = ref[:200], [out1[:200], out2[:200]]
+
+  def test_first_occurrence_matches(self):
+    match_store = bucketers.TokenMatchStore(self.ref, self.outs)
+    ref_offsets, out_offsets = match_store.ref_offsets, match_store.out_offsets
+    out_matches, ref_matches = match_store.out_matches, match_store.ref_matches
+    for oi, out in enumerate(self.outs):
+      for si, (ref_sent, out_sent) in enumerate(zip(self.ref, out)):
+        ref_match = list(ref_matches[oi][ref_offsets[si]:ref_offsets[si+1]])
+        out_match = list(out_matches[oi][out_offsets[oi][si]:out_offsets[oi][si+1]])
+        # The n-th occurrence of a word is matched to its n-th occurrence in the reference
+        for oj, w in enumerate(out_sent):
+          ref_pos = [rj for rj, rw in enumerate(ref_sent) if rw == w]
+          cnt = out_sent[:oj].count(w)
+          self.assertEqual(out_match[oj], ref_pos[cnt] if cnt < len(ref_pos) else -1)
+        self.assertEqual(ref_match, [out_match.index(rj) if rj in out_match else -1 for rj in range(len(ref_sent))])
+        # Single sentences are matched the same way without a store
+        sent_out_matches, sent_ref_matches = bucketers.CaseWordBucketer()._calc_trg_matches(ref_sent, [out_sent])
+        self.assertEqual((sent_out_matches[0], sent_ref_matches[0]), (out_match, ref_match))
+
+  def test_multiple_references(self):
+    bucketer = bucketers.CaseWordBucketer()
+    out_matches, ref_matches = bucketer._calc_trg_matches(('a b a'.split(), 'a a a c'.split()), ['a a a c b d'.split()])
+    self.assertEqual(out_matches, [[0, 2, 3, 3, 1, -1]])
+    self.assertEqual(ref_matches, [[0, 4, 1]])
+
+  def test_multiple_reference_totals(self):
+    ref = corpus_utils.merge_references([self.ref, self.outs[1]])
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    statistics, my_ref_totals, _, my_out_matches = bucketer.calc_statistics(ref, self.outs[:1])
+    # The reference totals count the union of the references that the outputs are matched against
+    for i, (ref_sent, out_sent) in enumerate(zip(self.ref, self.outs[1])):
+      union_cnts = Counter(ref_sent) | Counter(out_sent)
+      self.assertEqual(my_ref_totals[i].sum(), sum(union_cnts.values()))
+      my_ref_total, _, my_out_match, _, _, _ = \
+        bucketer._calc_trg_buckets_and_matches(ref[i], None, [self.outs[0][i]], None)
+      self.assertEqual(list(my_ref_totals[i]), list(my_ref_total))
+      self.assertEqual(list(my_out_matches[i, 0]), list(my_out_match[0]))
+    self.assertTrue(all(0 <= x[3] <= 1 for x in statistics[0]))
+    # Labels are only given for the first reference, which is then the only one the outputs are matched against
+    labels = [['NN'] * len(x) for x in self.ref]
+    out_labels = [[['NN'] * len(x) for x in self.outs[0]]]
+    label_bucketer = bucketers.LabelWordBucketer(label_set='NN')
+    multi_ref = label_bucketer.calc_statistics(ref, self.outs[:1], ref_labels=labels, out_labels=out_labels)
+    single_ref = label_bucketer.calc_statistics(self.ref, self.outs[:1], ref_labels=labels, out_labels=out_labels)
+    self.assertEqual(multi_ref[0], single_ref[0])
+
+  def test_shared_matches(self):
+    match_store = bucketers.TokenMatchStore(self.ref, self.outs, case_insensitive=True)
+    freq_bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref, case_insensitive=True)
+    # Bucketers with other cutoffs reuse the same matches
+    cutoff_bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref, case_insensitive=True,
+                                                                  bucket_cutoffs=[1, 5, 50])
+    for bucketer in (freq_bucketer, cutoff_bucketer):
+      shared = bucketer.calc_statistics(self.ref, self.outs, match_store=match_store)
+      separate = bucketer.calc_statistics(self.ref, self.outs)
+      self.assertEqual(shared[0], separate[0])
+      for x, y in zip(shared[1:], separate[1:]):
+        self.assertTrue((x == y).all())
+    with self.assertRaises(ValueError):
+      bucketers.CaseWordBucketer().calc_statistics(self.ref, self.outs, match_store=match_store)
+
+  def test_match_store_cache(self):
+    bucketers.global_match_stores = {}
+    try:
+      match_store = bucketers.get_match_store(self.ref, self.outs)
+      self.assertIs(bucketers.get_match_store(self.ref, self.outs), match_store)
+      self.assertIsNot(bucketers.get_match_store(self.ref, self.outs, case_insensitive=True), match_store)
+      self.assertIsNot(bucketers.get_match_store(self.ref, self.outs[:1]), match_store)
+    finally:
+      bucketers.global_match_stores = None
+
+
+class TestTokenResults(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.outs = ref[:100], [out1[:100], out2[:100]]
+    example_path = os.path.join(compare_mt_root, "example")
+    self.src = load_tokens(os.path.join(example_path, "ted.orig.slk"))[:100]
+    self.ref_aligns = load_alignments(os.path.join(example_path, "ted.ref.align"))[:100]
+
+  def test_trg_token_results(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    *_, token_results = bucketer.calc_statistics(self.ref, self.outs, keep_token_results=True)
+    for i in range(len(self.ref)):
+      _, _, _, ref_buckets, out_buckets, out_matches = \
+        bucketer._calc_trg_buckets_and_matches(self.ref[i], None, [x[i] for x in self.outs], None)
+      my_ref_buckets, my_out_buckets, my_out_matched = token_results.sentence(i)
+      self.assertEqual(list(my_ref_buckets), list(ref_buckets))
+      self.assertEqual([list(x) for x in my_out_buckets], [list(x) for x in out_buckets])
+      self.assertEqual([list(x) for x in my_out_matched], [[m >= 0 for m in x] for x in out_matches])
+
+  def test_src_token_results(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.src)
+    *_, token_results = bucketer.calc_statistics(self.ref, self.outs, src=self.src, ref_aligns=self.ref_aligns,
+                                                 keep_token_results=True)
+    for i in range(len(self.ref)):
+      _, _, _, src_buckets, _, ref_matches = \
+        bucketer._calc_src_buckets_and_matches(self.src[i], None, self.ref[i], self.ref_aligns[i], [x[i] for x in self.outs])
+      my_src_buckets, my_ref_matches = token_results.sentence(i)
+      self.assertEqual(list(my_src_buckets), list(src_buckets))
+      self.assertEqual([list(x) for x in my_ref_matches], ref_matches)
+
+  def test_src_statistics_by_range(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.src)
+    results = [bucketer.calc_statistics(self.ref[start:end], [x[start:end] for x in self.outs], src=self.src[start:end],
+                                        ref_aligns=self.ref_aligns[start:end], keep_token_results=True)
+               for start, end in ((0, 100), (0, 40), (40, 100))]
+    # Sentences are independent, so the counts of ranges of sentences are parts of the counts of the corpus
+    for x, y, z in zip(results[0][1:4], results[1][1:4], results[2][1:4]):
+      self.assertTrue((x == np.concatenate([y, z])).all())
+    self.assertEqual(list(results[0][4].src_buckets),
+                     list(results[1][4].src_buckets) + list(results[2][4].src_buckets))
+
+  def test_worker_invariance(self):
+    trg_bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    src_bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.src)
+    old_min_parallel_sents = bucketers.min_parallel_sents
+    bucketers.min_parallel_sents = 0
+    self.addCleanup(setattr, bucketers, 'min_parallel_sents', old_min_parallel_sents)
+    for kwargs, bucketer in (({}, trg_bucketer), (dict(src=self.src, ref_aligns=self.ref_aligns), src_bucketer)):
+      results = [bucketer.calc_statistics(self.ref, self.outs, keep_token_results=True, num_workers=num_workers,
+                                          **kwargs)
+                 for num_workers in (None, 1, 2)]
+      for result in results[1:]:
+        self.assertEqual(result[0], results[0][0])
+        for x, y in zip(result[1:4], results[0][1:4]):
+          self.assertEqual(x.dtype, y.dtype)
+          self.assertTrue((x == y).all())
+        for i in range(len(self.ref)):
+          self.assertEqual(repr(result[4].sentence(i)), repr(results[0][4].sentence(i)))
+
+  def test_src_alignment_matches(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.src)
+    _, my_ref_totals, my_out_totals, my_out_matches = bucketer.calc_statistics(self.ref, self.outs, src=self.src,
+                                                                                ref_aligns=self.ref_aligns)
+    self.assertEqual([x.dtype for x in (my_ref_totals, my_out_totals, my_out_matches)], [np.int32] * 3)
+    # Source words are correct if all their aligned reference words are matched
+    for i in range(len(self.ref)):
+      _, _, my_out_matches, src_buckets, src_aligns, ref_matches = \
+        bucketer._calc_src_buckets_and_matches(self.src[i], None, self.ref[i], self.ref_aligns[i], [x[i] for x in self.outs])
+      for oi, ref_match in enumerate(ref_matches):
+        correct = [b for b, a in zip(src_buckets, src_aligns) if a and all(ref_match[x] >= 0 for x in a)]
+        self.assertEqual(list(my_out_matches[oi]), [correct.count(b) for b in range(len(bucketer.bucket_strs))])
+    # Each aligned output word uses up one occurrence in the reference
+    out_aligns = [[(j, j) for j in range(min(len(s), len(o)))] for s, o in zip(self.src, self.outs[0])]
+    matches = list(bucketer.calc_source_bucketed_matches(self.src, self.ref, self.outs[0], self.ref_aligns, out_aligns))
+    counts = [[0, 0, 0] for _ in bucketer.bucket_strs]
+    for src_sent, ref_sent, out_sent, ref_align, out_align in zip(self.src, self.ref, self.outs[0], self.ref_aligns, out_aligns):
+      for j, (s, t) in enumerate(out_align):
+        bucket = bucketer.calc_bucket(src_sent[s])
+        counts[bucket][0] += out_sent[t] in ref_sent and [out_sent[x] for _, x in out_align[:j]].count(out_sent[t]) < ref_sent.count(out_sent[t])
+        counts[bucket][2] += 1
+      for s, _ in ref_align:
+        counts[bucketer.calc_bucket(src_sent[s])][1] += 1
+    self.assertEqual([list(x[:3]) for x in matches], counts)
+    with self.assertRaises(ValueError):
+      list(bucketer.calc_source_bucketed_matches(self.src[:1], self.ref[:1], self.outs[0][:1], self.ref_aligns[:1],
+                                                 [[(len(self.src[0]), 0)]]))
+
+
+class TestSentenceBuckets(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, _ = _get_example_data()
+    self.ref, self.out = ref[:500], out1[:500]
+
+  def test_bucket_scores_from_sentence_stats(self):
+    cache = compare_mt_main.generate_sentence_bucketed_report(self.ref, [self.out], bucket_type='length',
+                                                              statistic_type='score', score_measure='bleu',
+                                                              to_cache=True)
+    bucketer = bucketers.create_sentence_bucketer_from_profile('length')
+    scorer = scorers.create_scorer_from_profile('bleu')
+    bucketed_corpus = bucketer.create_bucketed_corpus(self.out, ref=self.ref)
+    for score, (out, ref) in zip(cache['stats'], bucketed_corpus):
+      self.assertAlmostEqual(score, scorer.score_corpus(ref, out)[0])
+
+  def test_empty_bucket_scores(self):
+    cache = compare_mt_main.generate_sentence_bucketed_report(self.ref, [self.out], bucket_type='length',
+                                                              bucket_cutoffs='1:2:500:1000', statistic_type='score',
+                                                              score_measure='bleu', to_cache=True)
+    self.assertEqual(cache['stats'][-1], 0.0)
+    self.assertTrue(all(isinstance(x, float) for x in cache['stats']))
+
+  def test_bucket_ids_from_values(self):
+    for bucketer in (bucketers.create_sentence_bucketer_from_profile('length'),
+                     bucketers.create_sentence_bucketer_from_profile('lengthdiff'),
+                     bucketers.create_sentence_bucketer_from_profile('score', score_type='sentbleu')):
+      bucket_ids = bucketer.calc_bucket_ids(self.out, ref=self.ref)
+      self.assertEqual(list(bucket_ids), [bucketer.calc_bucket(o, r) for o, r in zip(self.out, self.ref)])
+      sent_ids = bucketer.calc_bucket_sent_ids(self.out, ref=self.ref)
+      self.assertEqual(len(sent_ids), len(bucketer.bucket_strs))
+      for bi, ids in enumerate(sent_ids):
+        self.assertEqual(list(ids), [i for i, x in enumerate(bucket_ids) if x == bi])
+
+  def test_bucket_counts_without_reference(self):
+    cache = compare_mt_main.generate_sentence_bucketed_report(self.ref, [self.out], bucket_type='length',
+                                                              statistic_type='count', to_cache=True)
+    bucketer = bucketers.create_sentence_bucketer_from_profile('length')
+    bucketed_corpus = bucketer.create_bucketed_corpus(self.out)
+    self.assertEqual(cache['stats'], [len(out) for out, _ in bucketed_corpus])
+    self.assertEqual(sum(cache['stats']), len(self.out))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,99 @@
+import os.path
+import unittest
+import tempfile
+import numpy as np
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import freq_utils
+from compare_mt.corpus_utils import load_tokens
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref_file = os.path.join(example_path, "ted.ref.eng")
+  out1_file = os.path.join(example_path, "ted.sys1.eng")
+  out2_file = os.path.join(example_path, "ted.sys2.eng")
+  return [load_tokens(x) for x in (ref_file, out1_file, out2_file)]
+
+
+class TestFreqTable(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, _ = _get_example_data()
+    self.counts = freq_utils.corpus_counts(ref)
+    self.counts['x' * 50] = 7
+    self.counts['ü' * 20] = 3
+    self.words = [w for sent in out1[:200] for w in sent] + ['x' * 50, 'x' * 49, 'ü' * 20, 'ü' * 19, '']
+
+  def test_lookup(self):
+    table = freq_utils.FreqTable.from_counts(self.counts)
+    self.assertEqual(len(table), len(self.counts))
+    self.assertEqual(list(table.lookup(self.words)), [self.counts.get(w, 0) for w in self.words])
+
+  def test_saved_table(self):
+    counts_file = os.path.join(compare_mt_root, "example", "ted.train.counts")
+    counts = freq_utils.count_file_counts(counts_file, case_insensitive=True)
+    with tempfile.TemporaryDirectory() as table_dir:
+      freq_utils.global_table_dir = table_dir
+      try:
+        table = freq_utils.load_freq_table(counts_file, 'counts', case_insensitive=True)
+        self.assertEqual(len(os.listdir(table_dir)), 1)
+        # The saved table is memory-mapped by later runs
+        freq_utils._loaded_tables.clear()
+        saved_table = freq_utils.load_freq_table(counts_file, 'counts', case_insensitive=True)
+        self.assertIsInstance(saved_table.counts, np.memmap)
+        words = [w.lower() for w in self.words]
+        for t in (table, saved_table):
+          self.assertEqual(list(t.lookup(words)), [counts.get(w, 0) for w in words])
+      finally:
+        freq_utils.global_table_dir = None
+        freq_utils._loaded_tables.clear()
+
+
+class TestCountMinSketch(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.corpus = ref + out1 + out2
+    self.counts = freq_utils.corpus_counts(self.corpus)
+    self.words = list(self.counts) + ['unseen-word']
+
+  def test_error_bound(self):
+    sketch = freq_utils.CountMinSketch(0.05)
+    for i in range(0, len(self.corpus), 1000):
+      sketch.add(freq_utils.corpus_counts(self.corpus[i:i+1000]))
+    self.assertEqual(sketch.total, sum(self.counts.values()))
+    errors = sketch.lookup(self.words) - np.array([self.counts.get(w, 0) for w in self.words])
+    # Counts are never underestimated, and rarely overestimated by more than the bound
+    self.assertTrue((errors >= 0).all())
+    self.assertLess(np.mean(errors > sketch.error_bound()), 1.0 - sketch.confidence())
+    self.assertTrue(sketch.cutoff_report([1, 2, 10**9]).endswith('cutoffs 1, 2'))
+
+  def test_sketch_file_counts(self):
+    corpus_file = os.path.join(compare_mt_root, "example", "ted.ref.eng")
+    sketch = freq_utils.sketch_file_counts(corpus_file, 4)
+    counts = freq_utils.corpus_counts(load_tokens(corpus_file))
+    words = list(counts)
+    # With enough memory, the counts are exact
+    self.assertEqual(list(sketch.lookup(words)), [counts[w] for w in words])
+
+  def test_count_file_is_exact(self):
+    counts_file = os.path.join(compare_mt_root, "example", "ted.train.counts")
+    counts = freq_utils.count_file_counts(counts_file, case_insensitive=True)
+    try:
+      table = freq_utils.load_freq_table(counts_file, 'counts', case_insensitive=True, memory_mb=0.05)
+    finally:
+      freq_utils._loaded_tables.clear()
+    # Count files keep the last count of each lowercased word, which a sketch cannot do
+    self.assertIsInstance(table, freq_utils.FreqTable)
+    words = list(counts)
+    self.assertEqual(list(table.lookup(words)), [counts[w] for w in words])
+
+
+if __name__ == "__main__":
+  unittest.main()
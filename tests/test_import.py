@@ -0,0 +1,68 @@
+import os.path
+import subprocess
+import sys
+import unittest
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import scorers
+
+# Modules that are slow to import and should only be loaded when they are actually needed
+heavy_modules = ('nltk', 'sacrebleu', 'matplotlib')
+
+def _run_in_fresh_interpreter(code):
+  """
+  Run code in a new interpreter, and return the heavy modules that were loaded by it
+  """
+  code = ("import sys\n"
+          f"{code}\n"
+          f"print(' '.join(m for m in {heavy_modules!r} if m in sys.modules))\n")
+  result = subprocess.run([sys.executable, '-c', code], cwd=compare_mt_root,
+                          stdout=subprocess.PIPE, check=True, universal_newlines=True)
+  return result.stdout.split('\n')[-2].split()
+
+
+class TestLazyImports(unittest.TestCase):
+
+  def test_light_scorers_do_not_import_heavy_modules(self):
+    loaded = _run_in_fresh_interpreter(
+      "from compare_mt import scorers\n"
+      "ref, out = [['a', 'b', 'c', 'd']], [['a', 'b', 'c', 'd']]\n"
+      "for profile in ('bleu', 'length', 'wer'):\n"
+      "  scorers.create_scorer_from_profile(profile).score_corpus(ref, out)")
+    self.assertEqual(loaded, [])
+
+  def test_heavy_scorers_import_on_use(self):
+    loaded = _run_in_fresh_interpreter(
+      "from compare_mt import scorers\n"
+      "scorers.create_scorer_from_profile('sentbleu').score_sentence(['a', 'b'], ['a', 'b'])")
+    self.assertEqual(loaded, ['nltk'])
+
+  def test_text_only_run_does_not_import_matplotlib(self):
+    loaded = _run_in_fresh_interpreter(
+      "from compare_mt import compare_mt_main\n"
+      "sys.argv = ['compare-mt', 'example/ted.ref.eng', 'example/ted.sys1.eng', 'example/ted.sys2.eng',\n"
+      "            '--compare_sentence_buckets', 'bucket_type=lengthdiff', '--compare_sentence_examples',\n"
+      "            '--compare_ngrams', '--output_json', '/dev/null']\n"
+      "compare_mt_main.main()")
+    self.assertNotIn('matplotlib', loaded)
+
+
+class TestScorerRegistry(unittest.TestCase):
+
+  def test_register_scorer(self):
+    scorers.register_scorer('testlength', lambda **kwargs: scorers.LengthScorer())
+    self.addCleanup(scorers._scorer_factories.pop, 'testlength', None)
+    self.assertIsInstance(scorers.create_scorer_from_profile('testlength'), scorers.LengthScorer)
+
+  def test_rouge_profiles(self):
+    self.assertEqual(scorers.create_scorer_from_profile('rougeLsum').idstr(), 'rougelsum')
+    self.assertEqual(scorers.create_scorer_from_profile('rouge2').idstr(), 'rouge2')
+
+  def test_invalid_profile(self):
+    self.assertRaises(ValueError, scorers.create_scorer_from_profile, 'notascorer')
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,27 @@
+import os.path
+import json
+import subprocess
+import sys
+import unittest
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+
+class TestJsonReport(unittest.TestCase):
+
+  def test_json_to_stdout(self):
+    result = subprocess.run([sys.executable, '-m', 'compare_mt.compare_mt_main',
+                             'example/ted.ref.eng', 'example/ted.sys1.eng', 'example/ted.sys2.eng',
+                             '--compare_word_accuracies', 'bucket_type=freq',
+                             '--compare_sentence_buckets', 'bucket_type=length', '--output_json', '-'],
+                            cwd=compare_mt_root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    content = json.loads(result.stdout)
+    self.assertEqual([x['name'] for x in content][:3], ['Aggregate Scores', 'Word Accuracies', 'Sentence Buckets'])
+    # The text reports are written to standard error
+    self.assertIn('Reading frequency from the reference', result.stderr)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,48 @@
+import os.path
+import unittest
+import numpy as np
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt.rouge import scoring
+
+
+class TestBootstrapAggregator(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    rng = np.random.RandomState(0)
+    self.scores = {'rouge1': rng.rand(2000, 3), 'rougeL': rng.rand(2000, 3)}
+
+  def test_add_scores_batch(self):
+    single = scoring.BootstrapAggregator(n_samples=100)
+    for i in range(2000):
+      single.add_scores({k: scoring.Score(*v[i]) for k, v in self.scores.items()})
+    batch = scoring.BootstrapAggregator(n_samples=100)
+    batch.add_scores_batch({k: v[:500] for k, v in self.scores.items()})
+    batch.add_scores_batch({k: [scoring.Score(*x) for x in v[500:]] for k, v in self.scores.items()})
+    np.random.seed(1)
+    single_result = single.aggregate()
+    np.random.seed(1)
+    batch_result = batch.aggregate()
+    self.assertEqual(single_result, batch_result)
+
+  def test_bootstrap_resample(self):
+    aggregator = scoring.BootstrapAggregator(n_samples=100)
+    aggregator.add_scores_batch(self.scores)
+    np.random.seed(1)
+    result = aggregator.aggregate()
+    # Resample one sample at a time
+    np.random.seed(1)
+    for score_type in result:
+      matrix = self.scores[score_type]
+      sample_mean = np.array([matrix[np.random.choice(np.arange(len(matrix)), size=len(matrix))].mean(0)
+                              for _ in range(100)])
+      expected = np.percentile(sample_mean, [2.5, 50, 97.5], axis=0)
+      self.assertTrue(np.allclose(np.array(result[score_type]), expected))
+
+
+if __name__ == "__main__":
+  unittest.main()
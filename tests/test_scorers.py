@@ -7,6 +7,8 @@ compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."
 sys.path.append(compare_mt_root)
 
 from compare_mt import scorers
+from compare_mt import bucketers
+from compare_mt import corpus_utils
 from compare_mt.corpus_utils import load_tokens
 
 
@@ -156,5 +158,128 @@ class TestSacreBleuScorer(unittest.TestCase):
     self.assertAlmostEqual(detok_bleu, 21.7, places=0)
 
 
+class TestMultiReference(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.out1, self.out2 = ref[:100], out1[:100], out2[:100]
+    self.multi_ref = corpus_utils.merge_references([self.ref, self.out2])
+    self.dup_ref = corpus_utils.merge_references([self.ref, self.ref])
+
+  def test_bleu_multi_ref(self):
+    from nltk.translate import bleu_score as nltk_bleu
+    scorer = scorers.create_scorer_from_profile("bleu")
+    bleu, _ = scorer.score_corpus(self.multi_ref, self.out1)
+    nltk_score = nltk_bleu.corpus_bleu([list(r) for r in self.multi_ref], self.out1)
+    self.assertAlmostEqual(bleu, nltk_score * 100)
+
+  def test_duplicate_refs(self):
+    for profile in ("bleu", "chrf", "sentbleu"):
+      scorer = scorers.create_scorer_from_profile(profile)
+      if profile == "sentbleu":
+        self.assertAlmostEqual(scorer.score_sentence(self.dup_ref[1], self.out1[1])[0],
+                               scorer.score_sentence(self.ref[1], self.out1[1])[0])
+      else:
+        self.assertAlmostEqual(scorer.score_corpus(self.dup_ref, self.out1)[0],
+                               scorer.score_corpus(self.ref, self.out1)[0])
+
+  def test_word_matches(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    out_matches, ref_matches = bucketer._calc_trg_matches((['a', 'b', 'a'], ['b', 'c', 'c']), [['c', 'a', 'c', 'c', 'b']])
+    self.assertEqual(out_matches, [[3, 0, 3, -1, 1]])
+    self.assertEqual(ref_matches, [[1, 4, -1]])
+
+
+class TestScoreAccumulator(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out, _ = _get_example_data()
+    self.ref, self.out = self.ref[:200], self.out[:200]
+
+  def test_accumulate_corpus(self):
+    for profile in ('bleu', 'chrf', 'wer', 'length', 'sentbleu'):
+      scorer = scorers.create_scorer_from_profile(profile)
+      acc = scorer.accumulator()
+      for r, o in zip(self.ref, self.out):
+        acc.update(r, o)
+      self.assertEqual(acc.num_sents, len(self.ref))
+      self.assertAlmostEqual(acc.score(), scorer.score_corpus(self.ref, self.out)[0])
+
+  def test_merge(self):
+    scorer = scorers.create_scorer_from_profile('bleu')
+    acc1, acc2 = scorer.accumulator(), scorer.accumulator()
+    for r, o in zip(self.ref[:100], self.out[:100]):
+      acc1.update(r, o)
+    for r, o in zip(self.ref[100:], self.out[100:]):
+      acc2.update(r, o)
+    self.assertAlmostEqual(acc1.merge(acc2).score(), scorer.score_corpus(self.ref, self.out)[0])
+
+  def test_empty(self):
+    self.assertEqual(scorers.create_scorer_from_profile('bleu').accumulator().score(), 0.0)
+
+
+class TestSentenceScoreMemo(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out, _ = _get_example_data()
+    self.ref, self.out = ref[:50], out[:50]
+
+  def test_memo_scores(self):
+    memo = scorers.SentenceScoreMemo(max_size=30)
+    scorer = scorers.create_scorer_from_profile('sentbleu')
+    for r, o in zip(self.ref, self.out):
+      self.assertEqual(memo.score_sentence(scorer, r, o), scorer.score_sentence(r, o))
+    self.assertEqual(len(memo.scores[scorer.memo_key()]), 30)
+    # The most recently used scores are kept, and equal scorers share scores
+    memo.score_sentence(scorers.create_scorer_from_profile('sentbleu'), self.ref[-1], self.out[-1])
+    self.assertEqual((memo.hits, memo.misses), (1, 50))
+    memo.score_sentence(scorer, self.ref[0], self.out[0])
+    self.assertEqual((memo.hits, memo.misses), (1, 51))
+    # Scorers with different options do not
+    memo.score_sentence(scorers.create_scorer_from_profile('sentbleu', case_insensitive=True), self.ref[0], self.out[0])
+    self.assertEqual((memo.hits, memo.misses), (1, 52))
+
+  def test_memo_sized_from_corpus(self):
+    # A corpus with 150 sentences, without repeated pairs of a reference and an output sentence
+    ref, out1, out2 = _get_example_data()
+    seen, ids = set(), []
+    for i, (r, x, y) in enumerate(zip(ref, out1, out2)):
+      pairs = {(tuple(r), tuple(x)), (tuple(r), tuple(y))}
+      if len(pairs) == 2 and not pairs & seen and len(ids) < 150:
+        seen |= pairs
+        ids.append(i)
+    ref, out = [ref[i] for i in ids], [[out1[i] for i in ids], [out2[i] for i in ids]]
+    sentbleu, chrf = scorers.create_scorer_from_profile('sentbleu'), scorers.create_scorer_from_profile('chrf')
+    # A memo smaller than the corpus, and one sized from it
+    for max_size in (100, len(ref) * len(out)):
+      memo = scorers.SentenceScoreMemo(max_size=max_size)
+      # Analyses score the whole corpus in turn, with scores of other scorers in between
+      pass_hits = []
+      for scorer in (sentbleu, chrf, sentbleu):
+        hits = memo.hits
+        for o in out:
+          for r, x in zip(ref, o):
+            memo.score_sentence(scorer, r, x)
+        pass_hits.append(memo.hits - hits)
+      # Scores are only reused by later analyses if all scores of a scorer over the corpus fit
+      self.assertEqual(pass_hits, [0, 0, len(ref) * len(out) if max_size >= len(ref) * len(out) else 0])
+
+  def test_memo_key_options(self):
+    memo = scorers.SentenceScoreMemo()
+    # Scorers with attributes that cannot be compared are not memoized
+    scorer = scorers.create_scorer_from_profile('sentbleu')
+    scorer.weights = np.ones(4)
+    self.assertIsNone(scorer.memo_key())
+    memo.score_sentence(scorer, self.ref[0], self.out[0])
+    self.assertEqual((memo.hits, memo.misses, memo.scores), (0, 0, {}))
+    # ROUGE scorers with and without stemming do not share scores
+    stemmed = scorers.RougeScorer('rouge1', use_stemmer=True)
+    unstemmed = scorers.RougeScorer('rouge1')
+    self.assertNotEqual(stemmed.memo_key(), unstemmed.memo_key())
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,180 @@
+import os.path
+import unittest
+import numpy as np
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import scorers
+from compare_mt import sign_utils
+from compare_mt import bucketers
+from compare_mt.corpus_utils import load_tokens
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref_file = os.path.join(example_path, "ted.ref.eng")
+  out1_file = os.path.join(example_path, "ted.sys1.eng")
+  out2_file = os.path.join(example_path, "ted.sys2.eng")
+  return [load_tokens(x) for x in (ref_file, out1_file, out2_file)]
+
+
+class TestPairedBootstrap(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out1, self.out2 = _get_example_data()
+    self.scorer = scorers.create_scorer_from_profile("bleu")
+    self.cache_stats = [self.scorer.cache_stats(self.ref, out) for out in (self.out1, self.out2)]
+
+  def test_score_stats_batch(self):
+    for profile in ("bleu", "length", "chrf", "wer"):
+      scorer = scorers.create_scorer_from_profile(profile)
+      stats = scorer.cache_stats(self.ref[:50], self.out1[:50])
+      batch_scores = scorer.score_stats_batch(stats)
+      for row, score in zip(stats, batch_scores):
+        self.assertAlmostEqual(scorer.score_stats(row), score)
+
+  def test_count_matrices(self):
+    np.random.seed(1)
+    counts = np.concatenate(list(sign_utils.sample_count_matrices(10, 5, 7)))
+    np.random.seed(1)
+    for row in counts:
+      ids = np.random.choice(list(range(10)), size=5, replace=True)
+      self.assertEqual(list(row), list(np.bincount(ids, minlength=10)))
+
+  def test_seeded_bootstrap(self):
+    np.random.seed(1)
+    wins1, stats1 = sign_utils.eval_with_paired_bootstrap(self.ref, [self.out1, self.out2], self.scorer,
+                                                          num_samples=100, cache_stats=self.cache_stats)
+    np.random.seed(1)
+    wins2, stats2 = sign_utils.eval_with_paired_bootstrap(self.ref, [self.out1, self.out2], self.scorer,
+                                                          num_samples=100, cache_stats=self.cache_stats)
+    self.assertEqual(wins1, wins2)
+    self.assertEqual(stats1, stats2)
+
+  def test_win_ratios(self):
+    wins, _ = sign_utils.eval_with_paired_bootstrap(self.ref, [self.out1, self.out2, self.out1], self.scorer,
+                                                    compare_directions=[(0, 1), (0, 2)], num_samples=100)
+    self.assertAlmostEqual(sum(wins[0]), 1.0)
+    # Identical systems always tie
+    self.assertEqual(wins[1], [0.0, 0.0, 1.0])
+
+
+
+  def test_adaptive_bootstrap(self):
+    np.random.seed(1)
+    wins, stats = sign_utils.eval_with_paired_bootstrap(self.ref, [self.out1, self.out2], self.scorer, num_samples=5000,
+                                                        cache_stats=self.cache_stats, adaptive_thresh=0.05)
+    num_samples = stats[0]['num_samples']
+    self.assertLess(num_samples, 5000)
+    # The adaptive samples are the first samples of the non-adaptive bootstrap
+    np.random.seed(1)
+    full_wins, full_stats = sign_utils.eval_with_paired_bootstrap(self.ref, [self.out1, self.out2], self.scorer,
+                                                                  num_samples=num_samples, cache_stats=self.cache_stats)
+    self.assertEqual(wins, full_wins)
+    self.assertEqual(stats, full_stats)
+
+class TestApproxRandomization(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out1, self.out2 = _get_example_data()
+    self.scorer = scorers.create_scorer_from_profile("bleu")
+
+  def test_p_values(self):
+    np.random.seed(1)
+    pvals = sign_utils.eval_with_approx_randomization(self.ref, [self.out1, self.out2, self.out1], self.scorer,
+                                                      compare_directions=[(0, 1), (0, 2)], num_samples=200)
+    self.assertAlmostEqual(pvals[0], 1 / 201.0)
+    # Swapping identical outputs never changes the scores
+    self.assertEqual(pvals[1], 1.0)
+
+class TestParallelResampling(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.outs = ref[:300], [out1[:300], out2[:300]]
+
+  def test_bootstrap_worker_invariance(self):
+    scorer = scorers.create_scorer_from_profile("bleu")
+    results = []
+    for num_workers in (1, 2):
+      np.random.seed(1)
+      results.append(sign_utils.eval_with_paired_bootstrap(self.ref, self.outs, scorer, num_samples=250,
+                                                           num_workers=num_workers))
+    self.assertEqual(results[0], results[1])
+
+  def test_adaptive_bootstrap_pool(self):
+    scorer = scorers.create_scorer_from_profile("bleu")
+    results = []
+    start_worker_pool = sign_utils.start_worker_pool
+    pools = []
+    sign_utils.start_worker_pool = lambda *args: pools.append(start_worker_pool(*args)) or pools[-1]
+    try:
+      for num_workers in (1, 2):
+        np.random.seed(1)
+        results.append(sign_utils.eval_with_paired_bootstrap(self.ref, self.outs, scorer, num_samples=2000,
+                                                             num_workers=num_workers, adaptive_thresh=0.085))
+    finally:
+      sign_utils.start_worker_pool = start_worker_pool
+    self.assertGreater(results[0][1][0]['num_samples'], 2 * sign_utils.adaptive_block_size)
+    self.assertEqual(results[0], results[1])
+    # All blocks of the adaptive bootstrap are scored by the same workers
+    self.assertEqual(len(pools), 1)
+
+  def test_bucket_details_worker_invariance(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    _, my_ref_total_list, my_out_totals_list, my_out_matches_list = bucketer.calc_statistics(self.ref, self.outs)
+    results = []
+    for num_workers in (1, 2):
+      np.random.seed(1)
+      results.append(bucketer.calc_bucket_details(my_ref_total_list, my_out_totals_list, my_out_matches_list,
+                                                  num_samples=250, num_workers=num_workers))
+    self.assertEqual(list(results[0][0]), list(results[1][0]))
+    self.assertEqual(results[0][1], results[1][1])
+
+
+
+class TestResamplePlan(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    ref, out1, out2 = _get_example_data()
+    self.ref, self.outs = ref[:300], [out1[:300], out2[:300]]
+
+  def tearDown(self):
+    sign_utils.global_resample_plan = None
+
+  def test_sample_ids(self):
+    plan = sign_utils.ResamplePlan(seed=1)
+    ids = plan.sample_ids(50, 1500, 0, 300)
+    self.assertEqual(ids.shape, (300, 1500))
+    self.assertTrue(ids.min() >= 0 and ids.max() < 50)
+    # Parts of the plan do not depend on the order in which they are generated
+    other_plan = sign_utils.ResamplePlan(seed=1)
+    self.assertTrue((other_plan.sample_ids(50, 1000, 150, 250) == ids[150:250,:1000]).all())
+    self.assertFalse((sign_utils.ResamplePlan(seed=2).sample_ids(50, 1500, 0, 300) == ids).all())
+
+  def test_tile_cache(self):
+    ids = sign_utils.ResamplePlan(seed=1).sample_ids(50, 3000, 0, 250)
+    plan = sign_utils.ResamplePlan(seed=1)
+    plan.max_cached_tiles = 2
+    # Evicted tiles are generated again with the same values
+    for start in (0, 120, 0):
+      self.assertTrue((plan.sample_ids(50, 3000, start, start+130) == ids[start:start+130]).all())
+      self.assertLessEqual(len(plan.tiles), 2)
+
+  def test_bootstrap_with_plan(self):
+    scorer = scorers.create_scorer_from_profile("bleu")
+    results = []
+    for num_workers in (None, 2):
+      sign_utils.global_resample_plan = sign_utils.ResamplePlan(seed=1)
+      results.append(sign_utils.eval_with_paired_bootstrap(self.ref, self.outs, scorer, num_samples=250,
+                                                           num_workers=num_workers))
+    self.assertEqual(results[0], results[1])
+
+if __name__ == "__main__":
+  unittest.main()
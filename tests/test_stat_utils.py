@@ -0,0 +1,49 @@
+import os.path
+import unittest
+import numpy as np
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import stat_utils
+from compare_mt import compare_mt_main
+
+
+class TestTopK(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    rng = np.random.RandomState(0)
+    # Few distinct values, so there are many ties
+    self.scores = rng.randint(0, 20, size=1000) / 4.0
+
+  def test_top_k_indices(self):
+    for k in (0, 1, 5, 50, 2000):
+      expected = sorted(range(len(self.scores)), key=lambda i: (-self.scores[i], i))[:k]
+      self.assertEqual(list(stat_utils.top_k_indices(self.scores, k)), expected)
+
+  def test_top_k_heap(self):
+    items = [(x, i) for i, x in enumerate(self.scores)]
+    for largest in (True, False):
+      heap = stat_utils.TopKHeap(10, largest=largest)
+      for item in items:
+        heap.push(item)
+      expected = sorted(items)[-10:] if largest else sorted(items)[:10]
+      self.assertEqual(heap.items(), expected)
+
+  def test_select_scorediff_examples(self):
+    scorediff_list = [(float(x), float(x), 0.0, None, None, i) for i, x in enumerate(self.scores)]
+    selected = compare_mt_main.select_scorediff_examples(scorediff_list, 10)
+    self.assertEqual(selected[:10], sorted(scorediff_list)[:10])
+    self.assertEqual(selected[-10:], sorted(scorediff_list)[-10:])
+    # The same examples are selected from a stream, keeping only the selected sentences
+    stream_examples = compare_mt_main._StreamingSentenceExamples(10)
+    for x in scorediff_list:
+      stream_examples.add(x, (('out1', x[-1]), ('out2',), (('ref',),)))
+    self.assertEqual(stream_examples.scorediff_list(), selected)
+    self.assertEqual(sorted(stream_examples.sents), sorted(x[-1] for x in selected))
+
+
+if __name__ == "__main__":
+  unittest.main()